@@ -30,7 +30,13 @@ setup(
     ],
 
     install_requires=['sagemaker-containers>=2.8.6', 'PyYAML>=3.1.2', 'mlflow>=1.7', 'urllib3'],
+    entry_points={
+        'console_scripts': [
+            'serve=sagemaker_mlflow_container.serving:main',
+            'transform=sagemaker_mlflow_container.transform:main',
+        ],
+    },
     extras_require={
-        'test': ['pytest', 'sagemaker>=1.55.2', 'flake8']
+        'test': ['pytest', 'sagemaker>=1.55.2', 'flake8', 'moto']
     },
 )
@@ -0,0 +1,132 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from os.path import join
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+ENTRY_DATA_DIR = 'data'
+ENTRY_META_FILE = 'entry.json'
+
+
+def _dir_size(path: str) -> int:
+    """
+    Return total size in bytes of all files inside `path` (symlinks are not followed)
+    :param path:
+    :return:
+    """
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class DirCache:
+    """
+    Content-addressed cache of directories with LRU eviction
+
+    Every entry is stored as `<root>/<key>/data` with `<root>/<key>/entry.json` meta file.
+    Modification time of the entry dir is used as the last access time.
+    """
+
+    def __init__(self, root: str, size_limit: int):
+        """
+        :param root: directory where cache entries are stored
+        :param size_limit: max total size of cache entries in bytes
+        """
+        self.root = root
+        self.size_limit = size_limit
+
+    def _entry_path(self, key: str) -> str:
+        return join(self.root, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Return path to data of cached entry or None if there is no entry for `key`
+        Entry is marked as the most recently used one
+        :param key:
+        :return:
+        """
+        entry = self._entry_path(key)
+        if not os.path.isfile(join(entry, ENTRY_META_FILE)):
+            return None
+        os.utime(entry)
+        return join(entry, ENTRY_DATA_DIR)
+
+    def put(self, key: str, fill: Callable[[str], None]) -> str:
+        """
+        Create entry for `key` using `fill` callback and evict least recently used entries
+        if the cache size limit is exceeded
+        :param key:
+        :param fill: callback that receives not existing directory path and should create it with entry data
+        :return: path to data of cached entry
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.root)
+        try:
+            fill(join(tmp, ENTRY_DATA_DIR))
+            with open(join(tmp, ENTRY_META_FILE), 'w') as f:
+                json.dump({'key': key, 'size': _dir_size(tmp), 'created': time.time()}, f)
+
+            entry = self._entry_path(key)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict(keep=key)
+        return join(entry, ENTRY_DATA_DIR)
+
+    def _entries(self):
+        for name in os.listdir(self.root):
+            entry = self._entry_path(name)
+            try:
+                with open(join(entry, ENTRY_META_FILE)) as f:
+                    size = json.load(f)['size']
+                yield name, os.stat(entry).st_mtime, size
+            except (OSError, ValueError, KeyError):
+                continue
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Remove least recently used entries until total size fits into size limit
+        :param keep: key of entry that should not be removed
+        :return:
+        """
+        if not os.path.isdir(self.root):
+            return
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for key, _, size in entries:
+            if total <= self.size_limit:
+                break
+            if key == keep:
+                continue
+            logger.info(f'Evict cache entry {key} ({size} bytes) from {self.root}')
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            total -= size
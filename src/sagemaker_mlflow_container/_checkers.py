@@ -13,47 +13,203 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 #
+import functools
+import glob
+import json
 import logging
+import os
+import re
+import subprocess
+from os.path import join
+from typing import Dict, NamedTuple, Optional
 
-from sagemaker_containers._process import check_error
 from sagemaker_mlflow_container import const
 from sagemaker_mlflow_container.errors import CondaIsNotInstalled, CondaTrainingEnvIsNotCreated, \
     MLFlowIsNotInstalledInConda
 
 logger = logging.getLogger(__name__)
 
+CONDA_BASE_ENV = 'base'
 
-def _check_training_env():
-    check_error([
-        'conda', 'run', '-n', const.CONDA_TRAINING_ENV, 'conda', 'info'
-    ], CondaTrainingEnvIsNotCreated, capture_error=True)
+# probes refreshed by `_reprobe_env`, they are picked up by the next `_probe_env` call
+_reprobed: Dict[str, 'EnvProbe'] = {}
 
 
-def _check_conda():
+class EnvProbe(NamedTuple):
+    """Result of the training environment probe"""
+    conda_version: str
+    env_prefix: str
+    mlflow_version: str
 
-    check_error(['conda', '--version'], CondaIsNotInstalled, capture_error=True)
+    @property
+    def bin_path(self) -> str:
+        return join(self.env_prefix, 'bin')
 
 
-def _check_mlflow():
+def _conda_meta_mtime(env_prefix: str) -> Optional[float]:
+    try:
+        return os.stat(join(env_prefix, 'conda-meta')).st_mtime
+    except OSError:
+        return None
+
+
+def _load_probe_stamp(conda_env: str) -> Optional[EnvProbe]:
     """
-    Conda
+    Load env probe persisted by the previous process
+    Stamp is valid only if conda-meta dir of env was not modified since the probe
+    :param conda_env:
     :return:
     """
-    check_error([
-        'conda', 'run', '-n', const.CONDA_TRAINING_ENV, 'mlflow', '--version'
-    ], MLFlowIsNotInstalledInConda, capture_error=True)
+    if not const.ENV_PROBE_STAMP_FILE:
+        return None
+    try:
+        with open(const.ENV_PROBE_STAMP_FILE) as f:
+            stamp = json.load(f)
+        probe = EnvProbe(**stamp['probe'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    if stamp.get('conda_env') != conda_env or stamp.get('conda_meta_mtime') != _conda_meta_mtime(probe.env_prefix):
+        return None
+    if not os.access(join(probe.bin_path, 'mlflow'), os.X_OK):
+        return None
+    return probe
+
+
+def _save_probe_stamp(conda_env: str, probe: EnvProbe):
+    if not const.ENV_PROBE_STAMP_FILE:
+        return
+    stamp = {
+        'conda_env': conda_env,
+        'conda_meta_mtime': _conda_meta_mtime(probe.env_prefix),
+        'probe': probe._asdict(),
+    }
+    try:
+        with open(const.ENV_PROBE_STAMP_FILE, 'w') as f:
+            json.dump(stamp, f)
+    except OSError as e:
+        logger.warning(f'Unable to save env probe to {const.ENV_PROBE_STAMP_FILE}: {e}')
 
 
-def _check_env():
+def _run_probe_cmd(cmd, error_class) -> str:
     """
-    To ensure correct behavior of package we should check os env where it is launched
+    Run command and return its stdout
+    Raise `error_class` if command can't be launched or finishes with non zero code
+    :param cmd:
+    :param error_class: subclass of sagemaker_containers._errors._CalledProcessError
     :return:
     """
-    _check_conda()
-    logger.info('OK – Conda binary found')
+    try:
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise error_class(cmd=' '.join(cmd), output=str(e).encode())
+    if process.returncode:
+        raise error_class(cmd=' '.join(cmd), return_code=process.returncode, output=process.stderr)
+    return process.stdout.decode()
+
+
+def _find_env_prefix(conda_info, conda_env: str) -> Optional[str]:
+    """
+    Find location of conda env by its name in `conda info --json --envs` output
+    :param conda_info:
+    :param conda_env:
+    :return:
+    """
+    if conda_env == CONDA_BASE_ENV:
+        return conda_info.get('root_prefix')
+    for prefix in conda_info.get('envs', []):
+        if os.path.basename(prefix) == conda_env and os.path.dirname(prefix) in conda_info.get('envs_dirs', []):
+            return prefix
+    return None
+
+
+def _find_mlflow_version(env_prefix: str) -> Optional[str]:
+    """
+    Read version of mlflow package installed into conda env from package metadata
+    to avoid launching of mlflow cli
+    :param env_prefix:
+    :return:
+    """
+    patterns = [
+        join(env_prefix, 'lib', 'python*', 'site-packages', 'mlflow-*.dist-info'),
+        join(env_prefix, 'lib', 'python*', 'site-packages', 'mlflow-*.egg-info'),
+        join(env_prefix, 'conda-meta', 'mlflow-[0-9]*.json'),
+    ]
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            match = re.match(r'mlflow-([^-]+?)(-.*)?(\.dist-info|\.egg-info|\.json)$', os.path.basename(path))
+            if match:
+                return match.group(1)
+    return None
+
+
+def _probe_mlflow(env_prefix: str) -> str:
+    mlflow_bin = join(env_prefix, 'bin', 'mlflow')
+    if not os.access(mlflow_bin, os.X_OK):
+        raise MLFlowIsNotInstalledInConda(cmd=f'{mlflow_bin} --version', output=b'mlflow executable is not found')
+
+    version = _find_mlflow_version(env_prefix)
+    if version is None:
+        output = _run_probe_cmd([mlflow_bin, '--version'], MLFlowIsNotInstalledInConda)
+        version = output.strip().split()[-1]
+    return version
 
-    _check_training_env()
-    logger.info(f'OK – Conda env to run mlflow training found, {const.CONDA_TRAINING_ENV}')
 
-    _check_mlflow()
-    logger.info(f'OK – mlflow binary found for {const.CONDA_TRAINING_ENV}')
+@functools.lru_cache(maxsize=None)
+def _probe_env(conda_env: str = const.CONDA_TRAINING_ENV) -> EnvProbe:
+    """
+    Collect conda version, location of conda env and mlflow version in the env
+    using single `conda info` call instead of `conda run` for every check.
+    Result is memoized for the process and optionally persisted into `const.ENV_PROBE_STAMP_FILE`
+    :param conda_env: name of conda env to probe
+    :return:
+    """
+    probe = _reprobed.pop(conda_env, None)
+    if probe is not None:
+        _save_probe_stamp(conda_env, probe)
+        return probe
+
+    probe = _load_probe_stamp(conda_env)
+    if probe is not None:
+        logger.info(f'Env probe is loaded from {const.ENV_PROBE_STAMP_FILE}')
+        return probe
+
+    conda_info = json.loads(_run_probe_cmd(['conda', 'info', '--json', '--envs'], CondaIsNotInstalled))
+
+    env_prefix = _find_env_prefix(conda_info, conda_env)
+    if env_prefix is None:
+        raise CondaTrainingEnvIsNotCreated(cmd='conda info --json --envs',
+                                           output=f'conda env {conda_env} is not found'.encode())
+
+    probe = EnvProbe(
+        conda_version=conda_info.get('conda_version', ''),
+        env_prefix=env_prefix,
+        mlflow_version=_probe_mlflow(env_prefix),
+    )
+    _save_probe_stamp(conda_env, probe)
+    return probe
+
+
+def _reprobe_env(conda_env: str = const.CONDA_TRAINING_ENV) -> EnvProbe:
+    """
+    Refresh memoized env probe after the env is changed in place (updated, installed from lockfiles or restored).
+    Location of env and conda version stay the same, so only mlflow version is probed again without `conda info`
+    :param conda_env: name of conda env to probe
+    :return:
+    """
+    probe = _probe_env(conda_env)
+    _reprobed[conda_env] = probe._replace(mlflow_version=_probe_mlflow(probe.env_prefix))
+    _probe_env.cache_clear()
+    return _probe_env(conda_env)
+
+
+def _check_env() -> EnvProbe:
+    """
+    To ensure correct behavior of package we should check os env where it is launched
+    :return:
+    """
+    probe = _probe_env(const.CONDA_TRAINING_ENV)
+    logger.info(f'OK – Conda binary found, version {probe.conda_version}')
+    logger.info(f'OK – Conda env to run mlflow training found, {const.CONDA_TRAINING_ENV}: {probe.env_prefix}')
+    logger.info(f'OK – mlflow binary found for {const.CONDA_TRAINING_ENV}, version {probe.mlflow_version}')
+    return probe
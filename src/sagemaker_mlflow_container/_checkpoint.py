@@ -0,0 +1,275 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from os.path import join
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._utils import _file_sha256
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# layout of checkpoint dir
+CHECKPOINT_RUN_FILE = 'run.json'
+CHECKPOINT_STATE_FILE = 'sync_state.json'
+CHECKPOINT_ARTIFACTS_DIR = 'artifacts'
+
+
+class FileState(NamedTuple):
+    """State of synced file that is used to detect its changes"""
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+class SyncStats(NamedTuple):
+    """Result of a single sync pass"""
+    copied: int
+    removed: int
+    bytes: int
+
+
+def _lower_thread_priority():
+    """
+    Lower scheduling priority of the current thread (Linux schedules threads as separate tasks)
+    so sync doesn't compete for CPU with training
+    """
+    get_native_id = getattr(threading, 'get_native_id', None)
+    if get_native_id is None:
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, get_native_id(), 10)
+    except OSError:
+        pass
+
+
+class CheckpointSyncer:
+    """
+    Mirror new and changed files of MLFlow run artifact dir into checkpoint dir in background thread
+
+    File is considered changed if its size or mtime differ from the last synced state and its sha256 differs too.
+    Copy throughput is limited by `max_bytes_per_second`
+    """
+
+    def __init__(self, src: str, checkpoint_dir: str, interval: float = const.CHECKPOINT_SYNC_INTERVAL_SECONDS,
+                 max_bytes_per_second: int = const.CHECKPOINT_SYNC_MAX_MB_PER_SECOND * 1024 * 1024):
+        """
+        :param src: run artifact dir
+        :param checkpoint_dir: dir to mirror artifacts into (e.g. /opt/ml/checkpoints)
+        :param interval: seconds between sync passes
+        :param max_bytes_per_second: copy rate limit, 0 – unlimited
+        """
+        self.src = src
+        self.checkpoint_dir = checkpoint_dir
+        self.dst = join(checkpoint_dir, CHECKPOINT_ARTIFACTS_DIR)
+        self.interval = interval
+        self.max_bytes_per_second = max_bytes_per_second
+        self._state: Dict[str, FileState] = self._load_state()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _state_path(self) -> str:
+        return join(self.checkpoint_dir, CHECKPOINT_STATE_FILE)
+
+    def _load_state(self) -> Dict[str, FileState]:
+        try:
+            with open(self._state_path()) as f:
+                return {rel: FileState(*state) for rel, state in json.load(f).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def _save_state(self):
+        tmp_path = f'{self._state_path()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({rel: list(state) for rel, state in self._state.items()}, f)
+        os.replace(tmp_path, self._state_path())
+
+    def _copy(self, rel: str):
+        src, dst = join(self.src, rel), join(self.dst, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp_path = f'{dst}.sync-tmp'
+        start, copied = time.monotonic(), 0
+        with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+            for chunk in iter(lambda: fsrc.read(READ_CHUNK_SIZE), b''):
+                fdst.write(chunk)
+                copied += len(chunk)
+                if self.max_bytes_per_second:
+                    ahead = copied / self.max_bytes_per_second - (time.monotonic() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dst)
+        return copied
+
+    def sync(self) -> SyncStats:
+        """
+        Mirror changes of artifact dir made since the last pass
+        :return:
+        """
+        copied, copied_bytes, seen = 0, 0, set()
+        for root, _, files in os.walk(self.src):
+            for name in files:
+                path = join(root, name)
+                rel = os.path.relpath(path, self.src)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                seen.add(rel)
+                known = self._state.get(rel)
+                if known is not None and (known.size, known.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                sha256 = _file_sha256(path)
+                if known is None or known.sha256 != sha256 or not os.path.exists(join(self.dst, rel)):
+                    copied_bytes += self._copy(rel)
+                    copied += 1
+                self._state[rel] = FileState(stat.st_size, stat.st_mtime_ns, sha256)
+
+        removed = [rel for rel in self._state if rel not in seen]
+        for rel in removed:
+            del self._state[rel]
+            if os.path.exists(join(self.dst, rel)):
+                os.remove(join(self.dst, rel))
+
+        if copied or removed:
+            self._save_state()
+            logger.info(f'Checkpoint sync: {copied} files ({copied_bytes} bytes) copied, {len(removed)} removed')
+        return SyncStats(copied, len(removed), copied_bytes)
+
+    def _run(self):
+        _lower_thread_priority()
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+            except Exception as e:
+                # training should not fail because of checkpoint sync
+                logger.warning(f'Checkpoint sync of {self.src} is failed: {e}')
+
+    def start(self):
+        os.makedirs(self.dst, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='checkpoint-sync', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop background sync and sync the last changes
+        :return:
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self.sync()
+        except Exception as e:
+            # training should not fail because of checkpoint sync
+            logger.warning(f'Final checkpoint sync of {self.src} is failed: {e}')
+
+
+def _local_artifact_dir(artifact_uri: str) -> Optional[str]:
+    url = urlparse(artifact_uri)
+    return url.path if url.scheme in ('', 'file') else None
+
+
+def resumed_run_id(checkpoint_dir: str = const.CHECKPOINT_DIR) -> Optional[str]:
+    """
+    Return id of MLFlow run that was checkpointed before the job was interrupted
+    :param checkpoint_dir:
+    :return:
+    """
+    try:
+        with open(join(checkpoint_dir, CHECKPOINT_RUN_FILE)) as f:
+            return json.load(f)['run_id']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def restore_artifacts(artifact_dir: str, checkpoint_dir: str = const.CHECKPOINT_DIR):
+    """
+    Copy checkpointed artifacts that are missing in run artifact dir (e.g. local artifact storage was lost)
+    :param artifact_dir:
+    :param checkpoint_dir:
+    :return:
+    """
+    src = join(checkpoint_dir, CHECKPOINT_ARTIFACTS_DIR)
+    restored = 0
+    for root, _, files in os.walk(src):
+        for name in files:
+            rel = os.path.relpath(join(root, name), src)
+            if not os.path.exists(join(artifact_dir, rel)):
+                os.makedirs(os.path.dirname(join(artifact_dir, rel)), exist_ok=True)
+                shutil.copy2(join(root, name), join(artifact_dir, rel))
+                restored += 1
+    if restored:
+        logger.info(f'{restored} artifacts are restored from checkpoint {checkpoint_dir} into {artifact_dir}')
+
+
+def _clear_checkpoint(checkpoint_dir: str):
+    shutil.rmtree(join(checkpoint_dir, CHECKPOINT_ARTIFACTS_DIR), ignore_errors=True)
+    try:
+        os.remove(join(checkpoint_dir, CHECKPOINT_STATE_FILE))
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def checkpoint_sync(run_id: str, artifact_uri: str, checkpoint_dir: str = const.CHECKPOINT_DIR,
+                    carry_over: bool = const.CHECKPOINT_CARRY_OVER):
+    """
+    Sync run artifacts into checkpoint dir while the block is executed.
+    Sync is enabled if checkpoint dir exists (SageMaker creates it when checkpointing is configured)
+    and run artifacts are stored locally. Artifacts checkpointed by the same run are restored before the block,
+    checkpoint of another run is cleared unless `carry_over` is set
+    :param run_id: MLFlow run id that is saved to be resumed after interruption
+    :param artifact_uri: run artifact uri
+    :param checkpoint_dir:
+    :param carry_over: restore artifacts checkpointed by another run too
+    :return:
+    """
+    artifact_dir = _local_artifact_dir(artifact_uri)
+    if not os.path.isdir(checkpoint_dir) or artifact_dir is None:
+        yield
+        return
+
+    previous_run_id = resumed_run_id(checkpoint_dir)
+    if previous_run_id is not None and previous_run_id != run_id:
+        if carry_over:
+            # checkpointed run was lost with ephemeral tracking storage, its artifacts are carried over to the new run
+            logger.info(f'Continue checkpoint of MLFlow run {previous_run_id} in run {run_id}')
+        else:
+            logger.warning(f'Checkpoint {checkpoint_dir} of another MLFlow run {previous_run_id} is cleared, '
+                           f'run {run_id} starts from scratch')
+            _clear_checkpoint(checkpoint_dir)
+    restore_artifacts(artifact_dir, checkpoint_dir)
+    with open(join(checkpoint_dir, CHECKPOINT_RUN_FILE), 'w') as f:
+        json.dump({'run_id': run_id}, f)
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    syncer = CheckpointSyncer(artifact_dir, checkpoint_dir)
+    syncer.start()
+    logger.info(f'Artifacts of run {run_id} are synced into {checkpoint_dir} every {syncer.interval}s')
+    try:
+        yield
+    finally:
+        syncer.stop()
@@ -0,0 +1,306 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import threading
+from os.path import join
+from typing import Any, BinaryIO, Mapping, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._cache import DirCache
+from sagemaker_mlflow_container._utils import MLPROJECT_FILE_NAME, _extract_conda_file_name, \
+    _extract_entry_points, _extract_member, _file_sha256, _find_mlproject_file_path
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE_NAMES = (const.CONDA_LOCK_FILE_NAME, const.PIP_LOCK_FILE_NAME)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# layout of code cache entry data
+CACHE_CODE_DIR = 'code'
+CACHE_PROJECT_FILE = 'project.json'
+
+
+class ProjectFiles(NamedTuple):
+    """Files of MLproject that are required to update training conda env"""
+    conda_file: str
+    # explicit lockfiles located next to MLproject file (see `_conda._capture_lock_files`)
+    conda_lock_file: Optional[str] = None
+    pip_lock_file: Optional[str] = None
+    # entry point name -> parameters spec from MLproject file
+    entry_points: Optional[Mapping[str, Mapping[str, Any]]] = None
+
+
+class _HashingReader:
+    """
+    File-like wrapper that calculates sha256 of data read from the stream
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.digest.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        # tarfile stops reading at the end of archive, the rest of stream (padding) is hashed too
+        for chunk in iter(lambda: self.read(READ_CHUNK_SIZE), b''):
+            pass
+        return self.digest.hexdigest()
+
+
+def _s3_client():
+    import boto3
+
+    # the same settings as `sagemaker_containers._files.s3_download` uses
+    return boto3.client('s3', region_name=os.environ.get('AWS_REGION', os.environ.get('SAGEMAKER_REGION')),
+                        endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
+
+
+def _code_cache() -> Optional[DirCache]:
+    """
+    Return cache of extracted code or None if cache is not configured
+    :return:
+    """
+    if not const.CODE_CACHE_DIR:
+        return None
+    return DirCache(const.CODE_CACHE_DIR, const.CODE_CACHE_SIZE_LIMIT_MB * 1024 * 1024)
+
+
+class CodeExtractor:
+    """
+    Download and extract submitted code into code dir
+
+    Archive is extracted in a streaming way and `wait_project_files` returns as soon as
+    MLproject, conda and lock files are extracted, so conda env update can be started
+    before the rest of (possibly large) code is extracted.
+    Without lock files it's known only after the whole archive is extracted, so lock files
+    are used regardless of their position in the archive
+
+    If $CODE_CACHE_DIR is set, extracted code is cached by S3 object ETag or archive sha256
+    together with MLproject metadata, so the same archive is not downloaded and extracted again
+    """
+
+    def __init__(self, uri: str, code_dir: str):
+        """
+        :param uri: code location (`train_env.module_dir`): s3 uri, local archive or dir
+        :param code_dir: dir where code should be extracted
+        """
+        self.uri = uri
+        self.code_dir = code_dir
+        self._project_files_ready = threading.Event()
+        self._project_files: Optional[ProjectFiles] = None
+        self._error: Optional[BaseException] = None
+        self._cancelled = threading.Event()
+        self._s3 = None
+        self._s3_etag: Optional[str] = None
+
+    def wait_project_files(self) -> ProjectFiles:
+        """
+        Block until MLproject files required to update conda env are extracted
+        :return: absolute paths to MLproject files
+        :raise: error of code download or extraction if it is failed
+        """
+        self._project_files_ready.wait()
+        if self._error is not None:
+            raise self._error
+        if self._project_files is None:
+            # extraction is failed or the files are not found in archive
+            raise ValueError(f"Can't find MLProject file or its conda file in the '{self.uri}'")
+        return self._project_files
+
+    def cancel(self):
+        """
+        Make running `download_and_extract` fail before the next archive member is extracted
+        :return:
+        """
+        self._cancelled.set()
+
+    def _lock_file(self, name: str) -> Optional[str]:
+        path = join(self.code_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def _mark_project_files_ready(self):
+        ml_project_file = _find_mlproject_file_path(self.code_dir)
+        self._project_files = ProjectFiles(
+            conda_file=join(self.code_dir, _extract_conda_file_name(ml_project_file)),
+            conda_lock_file=self._lock_file(const.CONDA_LOCK_FILE_NAME),
+            pip_lock_file=self._lock_file(const.PIP_LOCK_FILE_NAME),
+            entry_points=_extract_entry_points(ml_project_file),
+        )
+        self._project_files_ready.set()
+
+    def download_and_extract(self):
+        try:
+            from sagemaker_containers import _files
+
+            os.makedirs(self.code_dir, exist_ok=True)
+            cache = _code_cache()
+            cache_key = None
+            if os.listdir(self.code_dir):
+                logger.info(f'Code dir {self.code_dir} is not empty, skip code downloading')
+                cache = None
+            else:
+                # computed once: key of local archive is its sha256
+                cache_key = self._cache_key() if cache is not None else None
+                if cache_key is not None and self._restore_from_cache(cache, cache_key):
+                    return
+                if self.uri.startswith('s3://'):
+                    etag = self._s3_etag
+                    self._extract_s3_archive()
+                    if etag is not None and etag != self._s3_etag:
+                        logger.warning(f'Code archive {self.uri} is changed while it is downloaded, skip caching')
+                        cache_key = None
+                elif os.path.isfile(self.uri) and tarfile.is_tarfile(self.uri):
+                    with open(self.uri, 'rb') as f:
+                        self._extract_archive(f)
+                else:
+                    _files.download_and_extract(self.uri, self.code_dir)
+
+            if not self._project_files_ready.is_set():
+                self._mark_project_files_ready()
+            if cache is not None and cache_key is not None:
+                self._save_to_cache(cache, cache_key)
+        except BaseException as e:
+            self._error = e
+            raise
+        finally:
+            # unblock waiters even if extraction is failed
+            self._project_files_ready.set()
+
+    def _cache_key(self) -> Optional[str]:
+        """
+        Return ETag of S3 object or sha256 of local archive, None if code is not an archive
+        :return:
+        """
+        if self.uri.startswith('s3://'):
+            if self._s3_etag is None:
+                url = urlparse(self.uri)
+                self._s3 = self._s3 or _s3_client()
+                self._s3_etag = self._s3.head_object(Bucket=url.netloc, Key=url.path.lstrip('/'))['ETag']
+            return hashlib.sha256(f's3-etag:{self._s3_etag}'.encode('utf-8')).hexdigest()
+        if os.path.isfile(self.uri) and tarfile.is_tarfile(self.uri):
+            return _file_sha256(self.uri)
+        return None
+
+    def _restore_from_cache(self, cache: DirCache, cache_key: str) -> bool:
+        cached = cache.get(cache_key)
+        if cached is None:
+            logger.info(f'Code cache miss for {self.uri}')
+            return False
+
+        with open(join(cached, CACHE_PROJECT_FILE)) as f:
+            project = json.load(f)
+        # code dir is empty, it is replaced by a copy of cached code
+        os.rmdir(self.code_dir)
+        shutil.copytree(join(cached, CACHE_CODE_DIR), self.code_dir, symlinks=True)
+        self._project_files = ProjectFiles(
+            conda_file=join(self.code_dir, project['conda_file']),
+            conda_lock_file=join(self.code_dir, project['conda_lock_file']) if project['conda_lock_file'] else None,
+            pip_lock_file=join(self.code_dir, project['pip_lock_file']) if project['pip_lock_file'] else None,
+            entry_points=project['entry_points'],
+        )
+        self._project_files_ready.set()
+        logger.info(f'Code of {self.uri} is restored from cache {cache.root} with key {cache_key}')
+        return True
+
+    def _save_to_cache(self, cache: DirCache, cache_key: str):
+        files = self._project_files
+
+        def fill(dst: str):
+            shutil.copytree(self.code_dir, join(dst, CACHE_CODE_DIR), symlinks=True)
+            with open(join(dst, CACHE_PROJECT_FILE), 'w') as f:
+                json.dump({
+                    'uri': self.uri,
+                    'conda_file': os.path.relpath(files.conda_file, self.code_dir),
+                    'conda_lock_file': files.conda_lock_file and os.path.relpath(files.conda_lock_file, self.code_dir),
+                    'pip_lock_file': files.pip_lock_file and os.path.relpath(files.pip_lock_file, self.code_dir),
+                    'entry_points': files.entry_points,
+                }, f)
+
+        cache.put(cache_key, fill)
+        logger.info(f'Code of {self.uri} is saved to cache {cache.root} with key {cache_key}')
+
+    def _extract_s3_archive(self):
+        """
+        Extract archive reading it directly from S3 response stream without temporary file
+        :return:
+        """
+        url = urlparse(self.uri)
+        self._s3 = self._s3 or _s3_client()
+        response = self._s3.get_object(Bucket=url.netloc, Key=url.path.lstrip('/'))
+        self._s3_etag = response['ETag']
+        reader = _HashingReader(response['Body'])
+        try:
+            self._extract_archive(reader)
+            logger.info(f'Code archive {self.uri} is extracted, sha256: {reader.hexdigest()}')
+        finally:
+            response['Body'].close()
+
+    def _is_inside_code_dir(self, member: tarfile.TarInfo) -> bool:
+        """
+        Whether member and target of link member are located inside code dir
+        :param member:
+        :return:
+        """
+        code_dir = os.path.realpath(self.code_dir)
+        paths = [join(code_dir, member.name)]
+        if member.issym():
+            paths.append(join(code_dir, os.path.dirname(member.name), member.linkname))
+        elif member.islnk():
+            paths.append(join(code_dir, member.linkname))
+        for path in paths:
+            path = os.path.realpath(path)
+            if path != code_dir and not path.startswith(code_dir + os.sep):
+                return False
+        return True
+
+    def _extract_archive(self, stream: BinaryIO):
+        """
+        Extract tar.gz archive member by member reading it as a stream
+        :param stream: archive data
+        :return:
+        """
+        ml_project_member, conda_member = None, None
+        with tarfile.open(fileobj=stream, mode='r|gz') as tar:
+            for member in tar:
+                if self._cancelled.is_set():
+                    raise RuntimeError(f'Extraction of code {self.uri} is cancelled')
+                if not self._is_inside_code_dir(member):
+                    logger.warning(f'Skip archive member {member.name} located or linked outside of code dir')
+                    continue
+                _extract_member(tar, member, self.code_dir)
+
+                if self._project_files_ready.is_set():
+                    continue
+                name = os.path.normpath(member.name)
+                if ml_project_member is None and name.lower() == MLPROJECT_FILE_NAME:
+                    ml_project_member = name
+                    conda_member = os.path.normpath(_extract_conda_file_name(join(self.code_dir, name)))
+                # otherwise project files are marked ready after extraction, when absent lock files are known
+                if conda_member is not None and os.path.exists(join(self.code_dir, conda_member)) \
+                        and all(self._lock_file(lock_name) for lock_name in LOCK_FILE_NAMES):
+                    logger.info('MLproject, conda and lock files are extracted')
+                    self._mark_project_files_ready()
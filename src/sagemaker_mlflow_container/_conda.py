@@ -0,0 +1,272 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import hashlib
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+from os.path import join
+from typing import Any, Mapping, Optional
+
+import yaml
+from sagemaker_containers._errors import _CalledProcessError
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._cache import DirCache
+from sagemaker_mlflow_container._conda_pkgs import conda_environ, prefetch_packages
+from sagemaker_mlflow_container._utils import ProcessTerminator, _sibling_path, _swap_dir, check_error
+
+logger = logging.getLogger(__name__)
+
+CONDA_META_DIR = 'conda-meta'
+
+
+def _normalize_dependency(dep: str) -> str:
+    """
+    Normalize conda or pip dependency specification so that insignificant differences
+    (whitespaces and case of the package name) do not change spec hash
+
+    >>> _normalize_dependency('NumPy >= 1.18')
+    'numpy>=1.18'
+    :param dep:
+    :return:
+    """
+    dep = re.sub(r'\s+', '', str(dep))
+    name, rest = re.match(r'^([^=<>!~\[@;]*)(.*)$', dep).groups()
+    return f'{name.lower()}{rest}'
+
+
+def _normalize_conda_spec(spec: Mapping[str, Any]) -> Mapping[str, Any]:
+    """
+    Return conda environment spec without fields that don't affect resolved environment
+    (env `name` and `prefix`) and with sorted dependencies.
+    Channels order is kept because it defines channels priority
+    :param spec: parsed conda environment yaml
+    :return:
+    """
+    conda_deps, pip_deps = [], []
+    for dep in spec.get('dependencies') or []:
+        if isinstance(dep, Mapping):
+            pip_deps += [_normalize_dependency(d) for d in dep.get('pip') or []]
+        else:
+            conda_deps.append(_normalize_dependency(dep))
+
+    return {
+        'channels': [str(c) for c in spec.get('channels') or []],
+        'dependencies': sorted(conda_deps),
+        'pip': sorted(pip_deps),
+    }
+
+
+def _conda_spec_hash(conda_fp: str) -> str:
+    """
+    Calculate hash of normalized conda spec file (dependencies and channels) and platform
+    :param conda_fp: path to conda environment file
+    :return: hex digest
+    """
+    with open(conda_fp) as f:
+        spec = yaml.safe_load(f) or {}
+
+    key = {
+        'spec': _normalize_conda_spec(spec),
+        'platform': f'{sys.platform}-{platform.machine()}',
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _lock_spec_hash(conda_lock_fp: str, pip_lock_fp: Optional[str]) -> str:
+    """
+    Calculate hash of explicit lockfiles. They are already fully resolved, so no normalization is required
+    :param conda_lock_fp: path to `conda list --explicit` output
+    :param pip_lock_fp: path to `pip freeze` output
+    :param terminator: allows to terminate running install from another thread
+    :return: hex digest
+    """
+    digest = hashlib.sha256(f'{sys.platform}-{platform.machine()}'.encode('utf-8'))
+    for path in (conda_lock_fp, pip_lock_fp):
+        if path:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _env_fingerprint(env_prefix: str) -> str:
+    """
+    Calculate hash of packages that are installed into conda env
+    (conda-meta contains one `<name>-<version>-<build>.json` file for every installed package)
+    :param env_prefix:
+    :return: hex digest
+    """
+    meta_dir = join(env_prefix, CONDA_META_DIR)
+    packages = sorted(fn for fn in os.listdir(meta_dir) if fn.endswith('.json')) if os.path.isdir(meta_dir) else []
+    return hashlib.sha256('\n'.join(packages).encode('utf-8')).hexdigest()
+
+
+def _env_cache_key(spec_hash: str, env_prefix: str) -> str:
+    """
+    Return key of cache entry for conda env located in `env_prefix` updated by spec with `spec_hash`
+    Env is not relocatable so its location is a part of the key as well as packages
+    that were installed into env before update
+    :param spec_hash:
+    :param env_prefix:
+    :return:
+    """
+    key = f'{spec_hash}:{os.path.abspath(env_prefix)}:{_env_fingerprint(env_prefix)}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _env_snapshot_key(spec_hash: str, env_prefix: str) -> str:
+    """
+    Return key of packed conda env updated by spec with `spec_hash`
+    Packed envs are relocatable so unlike `_env_cache_key` the key doesn't depend on env location
+    :param spec_hash:
+    :param env_prefix:
+    :return:
+    """
+    key = f'{spec_hash}:{_env_fingerprint(env_prefix)}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _stamp_path(env_prefix: str) -> str:
+    return join(env_prefix, CONDA_META_DIR, const.CONDA_ENV_STAMP_FILE)
+
+
+def _is_env_up_to_date(spec_hash: str, env_prefix: str) -> bool:
+    """
+    Check whether conda env was already updated using spec with `spec_hash`
+    and was not changed since that
+    :param spec_hash:
+    :param env_prefix:
+    :return:
+    """
+    try:
+        with open(_stamp_path(env_prefix)) as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return stamp.get('spec') == spec_hash and stamp.get('env') == _env_fingerprint(env_prefix)
+
+
+def _write_stamp(spec_hash: str, env_prefix: str):
+    with open(_stamp_path(env_prefix), 'w') as f:
+        json.dump({'spec': spec_hash, 'env': _env_fingerprint(env_prefix)}, f)
+
+
+def _env_cache() -> Optional[DirCache]:
+    """
+    Return cache of resolved conda environments or None if cache is not configured
+    :return:
+    """
+    if not const.CONDA_ENV_CACHE_DIR:
+        return None
+    return DirCache(const.CONDA_ENV_CACHE_DIR, const.CONDA_ENV_CACHE_SIZE_LIMIT_MB * 1024 * 1024)
+
+
+def _replace_dir(src: str, dst: str):
+    """
+    Replace content of `dst` dir by a copy of `src` dir
+    Symlinks are copied as symlinks because conda envs use them (e.g. bin/python).
+    The copy is made next to `dst` and swapped in, so failed copy leaves `dst` as it was
+    :param src:
+    :param dst:
+    :return:
+    """
+    new_dir = _sibling_path(dst, '.new')
+    try:
+        shutil.copytree(src, new_dir, symlinks=True)
+        old_dir = _swap_dir(new_dir, dst)
+    except BaseException:
+        shutil.rmtree(new_dir, ignore_errors=True)
+        raise
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _restore_env_from_cache(cache_key: str, env_prefix: str) -> bool:
+    """
+    Restore conda env from the cache
+    :param cache_key: key returned by `_env_cache_key`
+    :param env_prefix:
+    :return: True if env was restored and False if there is no cached env for `cache_key`
+    """
+    cache = _env_cache()
+    if cache is None:
+        return False
+
+    cached = cache.get(cache_key)
+    if cached is None:
+        logger.info(f'Conda env cache miss for key {cache_key}')
+        return False
+
+    logger.info(f'Conda env cache hit for key {cache_key}, restoring {env_prefix} from {cached}')
+    _replace_dir(cached, env_prefix)
+    return True
+
+
+def _save_env_to_cache(cache_key: str, env_prefix: str):
+    cache = _env_cache()
+    if cache is None:
+        return
+
+    cache.put(cache_key, lambda dst: shutil.copytree(env_prefix, dst, symlinks=True))
+    logger.info(f'Conda env {env_prefix} saved to cache {cache.root} with key {cache_key}')
+
+
+def _capture_lock_files(env_prefix: str, terminator: Optional[ProcessTerminator] = None) -> str:
+    """
+    Save explicit lockfiles of conda env: conda packages with urls and md5 hashes
+    and pip packages with pinned versions
+    :param env_prefix:
+    :param terminator: allows to terminate running command from another thread
+    :return: path to dir with lockfiles
+    """
+    lock_dir = tempfile.mkdtemp(prefix='env-lock-')
+    with open(join(lock_dir, const.CONDA_LOCK_FILE_NAME), 'w') as f:
+        check_error(['conda', 'list', '--explicit', '--md5', '--prefix', env_prefix],
+                    _CalledProcessError, capture_error=True, terminator=terminator, stdout=f)
+    with open(join(lock_dir, const.PIP_LOCK_FILE_NAME), 'w') as f:
+        check_error([join(env_prefix, 'bin', 'python'), '-m', 'pip', 'list', '--format=freeze'],
+                    _CalledProcessError, capture_error=True, terminator=terminator, stdout=f)
+    logger.info(f'Lockfiles of conda env {env_prefix} are saved into {lock_dir}')
+    return lock_dir
+
+
+def _install_from_lock_files(conda_env: str, env_prefix: str, conda_lock_fp: str, pip_lock_fp: Optional[str],
+                             terminator: Optional[ProcessTerminator] = None):
+    """
+    Install packages of explicit lockfiles into existing conda env without dependencies solving.
+    Env is not recreated, so packages that are missing in lockfiles (e.g. mlflow) stay installed.
+    If $CONDA_PKGS_CACHE_DIR is set, missing packages are downloaded into it concurrently before install
+    :param conda_env: conda env name
+    :param env_prefix: conda env location
+    :param conda_lock_fp: path to `conda list --explicit` output
+    :param pip_lock_fp: path to `pip freeze` output
+    :param terminator: allows to terminate running install from another thread
+    :return:
+    """
+    if const.CONDA_PKGS_CACHE_DIR:
+        prefetch_packages(conda_lock_fp)
+    logger.info(f'Install {conda_env} conda env from lockfile {conda_lock_fp}')
+    check_error(['conda', 'install', '--yes', '--name', conda_env, '--file', conda_lock_fp],
+                _CalledProcessError, capture_error=True, env=conda_environ(), terminator=terminator)
+    if pip_lock_fp:
+        logger.info(f'Install pip packages into {conda_env} conda env from lockfile {pip_lock_fp}')
+        check_error([join(env_prefix, 'bin', 'python'), '-m', 'pip', 'install', '--no-deps', '-r', pip_lock_fp],
+                    _CalledProcessError, capture_error=True, terminator=terminator)
@@ -0,0 +1,141 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import time
+from os.path import join
+from typing import Optional
+
+from sagemaker_containers._errors import _CalledProcessError
+
+from sagemaker_mlflow_container._utils import _extract_all, _sibling_path, _swap_dir, check_error
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_EXT = '.tar.gz'
+
+
+def _snapshot_path(snapshot_dir: str, snapshot_key: str) -> str:
+    return join(snapshot_dir, f'{snapshot_key}{SNAPSHOT_EXT}')
+
+
+def _log_throughput(action: str, path: str, size: int, seconds: float):
+    logger.info(f'Conda env {action} {path}: {size / 1024 / 1024:.1f} MB in {seconds:.2f}s '
+                f'({size / 1024 / 1024 / max(seconds, 1e-6):.1f} MB/s)')
+
+
+def find_snapshot(snapshot_dir: Optional[str], snapshot_key: str) -> Optional[str]:
+    """
+    Return path to packed conda env for `snapshot_key` in `snapshot_dir` if it exists
+    :param snapshot_dir:
+    :param snapshot_key:
+    :return:
+    """
+    if not snapshot_dir:
+        return None
+    path = _snapshot_path(snapshot_dir, snapshot_key)
+    return path if os.path.isfile(path) else None
+
+
+def pack_env(env_prefix: str, snapshot_dir: str, snapshot_key: str) -> str:
+    """
+    Pack conda env into relocatable compressed archive using conda-pack
+    Compression is done using all available CPUs
+    :param env_prefix: conda env location
+    :param snapshot_dir: dir to save archive into
+    :param snapshot_key: key of the env, used as archive name
+    :return: path to archive
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = _snapshot_path(snapshot_dir, snapshot_key)
+    tmp_path = f'{path}.tmp'
+
+    start = time.monotonic()
+    check_error([
+        'conda', 'pack', '--prefix', env_prefix, '--output', tmp_path, '--format', 'tar.gz',
+        '--n-threads', '-1', '--ignore-missing-files', '--force', '--quiet'
+    ], _CalledProcessError, capture_error=True)
+    os.rename(tmp_path, path)
+    _log_throughput('packed to', path, os.path.getsize(path), time.monotonic() - start)
+    return path
+
+
+def _open_decompressed_stream(archive: str):
+    """
+    Return process decompressing archive with pigz (multi-threaded gzip) if it is available
+    :param archive:
+    :return: pigz process or None
+    """
+    pigz = shutil.which('pigz')
+    if pigz is None:
+        return None
+    return subprocess.Popen([pigz, '--decompress', '--stdout', archive], stdout=subprocess.PIPE,
+                            bufsize=1024 * 1024)
+
+
+def restore_env(archive: str, env_prefix: str):
+    """
+    Extract packed conda env into `env_prefix` replacing existing env and fix prefixes using `conda-unpack`
+
+    Archive is extracted as a stream without temporary files. If pigz is available, decompression
+    is done by pigz process concurrently with extraction.
+    The env is extracted next to `env_prefix` and swapped in, existing env is put back if extraction
+    or `conda-unpack` fails
+    :param archive: path to archive created by `pack_env`
+    :param env_prefix: conda env location
+    :return:
+    """
+    start = time.monotonic()
+    new_prefix = _sibling_path(env_prefix, '.new')
+    os.makedirs(new_prefix)
+    try:
+        _extract_env(archive, new_prefix)
+        old_prefix = _swap_dir(new_prefix, env_prefix)
+    except BaseException:
+        shutil.rmtree(new_prefix, ignore_errors=True)
+        raise
+
+    try:
+        # conda-unpack replaces prefix placeholders by its own location, so it is run in the final location
+        check_error([join(env_prefix, 'bin', 'python'), join(env_prefix, 'bin', 'conda-unpack')],
+                    _CalledProcessError, capture_error=True)
+    except BaseException:
+        if old_prefix is not None:
+            shutil.rmtree(env_prefix, ignore_errors=True)
+            os.rename(old_prefix, env_prefix)
+        raise
+    if old_prefix is not None:
+        shutil.rmtree(old_prefix, ignore_errors=True)
+    _log_throughput('restored from', archive, os.path.getsize(archive), time.monotonic() - start)
+
+
+def _extract_env(archive: str, env_prefix: str):
+    pigz = _open_decompressed_stream(archive)
+    try:
+        if pigz is not None:
+            tar = tarfile.open(fileobj=pigz.stdout, mode='r|')
+        else:
+            tar = tarfile.open(archive, mode='r|gz')
+        with tar:
+            _extract_all(tar, env_prefix)
+    finally:
+        if pigz is not None:
+            pigz.stdout.close()
+            if pigz.wait():
+                raise _CalledProcessError(cmd=f'pigz --decompress --stdout {archive}', return_code=pigz.returncode)
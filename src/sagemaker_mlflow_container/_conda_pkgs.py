@@ -0,0 +1,193 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import List, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from sagemaker_mlflow_container import const
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# conda keeps urls of packages in its package cache dir in this file
+URLS_FILE = 'urls.txt'
+
+# Prefix of log line with package cache statistics, SageMaker metric definition example:
+# {'Name': 'conda_pkgs_bytes_saved', 'Regex': 'conda_pkgs_cache: .* bytes_saved=([0-9]+)'}
+METRICS_LOG_PREFIX = 'conda_pkgs_cache:'
+
+
+class LockedPackage(NamedTuple):
+    """Package listed in explicit conda lockfile"""
+    url: str
+    md5: Optional[str]
+
+    @property
+    def file_name(self) -> str:
+        return os.path.basename(unquote(urlparse(self.url).path))
+
+
+class PrefetchStats(NamedTuple):
+    """Result of packages prefetch"""
+    hits: int
+    misses: int
+    bytes_downloaded: int
+    bytes_saved: int  # size of packages that were found in the cache
+    seconds: float
+
+
+def conda_environ(pkgs_dir: Optional[str] = None) -> Optional[Mapping[str, str]]:
+    """
+    Return environment of conda process that uses `pkgs_dir` as package cache
+    :param pkgs_dir: package cache dir, $CONDA_PKGS_CACHE_DIR by default
+    :return: None if package cache dir is not configured (process inherits current environment)
+    """
+    pkgs_dir = pkgs_dir or const.CONDA_PKGS_CACHE_DIR
+    if not pkgs_dir:
+        return None
+    os.makedirs(pkgs_dir, exist_ok=True)
+    environ = os.environ.copy()
+    environ['CONDA_PKGS_DIRS'] = pkgs_dir
+    return environ
+
+
+def read_explicit_lockfile(path: str) -> List[LockedPackage]:
+    """
+    Parse `conda list --explicit --md5` output
+    :param path:
+    :return:
+    """
+    packages = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or line.startswith('@'):
+                continue
+            url, _, md5 = line.partition('#')
+            packages.append(LockedPackage(url, md5 or None))
+    return packages
+
+
+def _md5(path: str) -> str:
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Prefetcher:
+
+    def __init__(self, pkgs_dir: str, workers: int):
+        self.pkgs_dir = pkgs_dir
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _http(self):
+        import urllib3
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = urllib3.PoolManager(
+                    maxsize=self.workers, block=True,
+                    retries=urllib3.Retry(total=const.ARTIFACTS_DOWNLOAD_RETRIES, backoff_factor=0.5,
+                                          status_forcelist=(429, 500, 502, 503, 504)),
+                )
+            return self._pool
+
+    def _is_cached(self, package: LockedPackage) -> bool:
+        path = join(self.pkgs_dir, package.file_name)
+        return os.path.isfile(path) and (package.md5 is None or _md5(path) == package.md5)
+
+    def _download(self, package: LockedPackage, dst: str):
+        url = urlparse(package.url)
+        if url.scheme == 'file':
+            shutil.copyfile(unquote(url.path), dst)
+            return
+        response = self._http().request('GET', package.url, preload_content=False)
+        try:
+            if response.status != 200:
+                raise IOError(f'Unable to download {package.url}: HTTP {response.status}')
+            with open(dst, 'wb') as f:
+                for chunk in response.stream(READ_CHUNK_SIZE):
+                    f.write(chunk)
+        finally:
+            response.release_conn()
+
+    def fetch(self, package: LockedPackage) -> Tuple[bool, int]:
+        """
+        Download package into package cache dir if it is not there yet
+        :param package:
+        :return: whether package is found in the cache and its size
+        """
+        path = join(self.pkgs_dir, package.file_name)
+        if self._is_cached(package):
+            return True, os.path.getsize(path)
+
+        tmp_path = f'{path}.{threading.get_ident()}.part'
+        try:
+            self._download(package, tmp_path)
+            if package.md5 is not None and _md5(tmp_path) != package.md5:
+                raise IOError(f'MD5 checksum of {package.url} does not match the lockfile')
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock, open(join(self.pkgs_dir, URLS_FILE), 'a') as f:
+            f.write(f'{package.url}\n')
+        return False, os.path.getsize(path)
+
+
+def prefetch_packages(conda_lock_fp: str, pkgs_dir: Optional[str] = None,
+                      workers: Optional[int] = None) -> PrefetchStats:
+    """
+    Download packages listed in explicit conda lockfile into conda package cache dir concurrently
+    so `conda create --file` only links them. Packages that are already in the cache
+    with matching MD5 checksum are not downloaded
+    :param conda_lock_fp: path to `conda list --explicit --md5` output
+    :param pkgs_dir: package cache dir, $CONDA_PKGS_CACHE_DIR by default
+    :param workers: max number of concurrent downloads
+    :return: statistics of prefetch
+    """
+    pkgs_dir = pkgs_dir or const.CONDA_PKGS_CACHE_DIR
+    workers = workers or const.CONDA_PKGS_PREFETCH_CONCURRENCY
+    os.makedirs(pkgs_dir, exist_ok=True)
+
+    start = time.monotonic()
+    packages = read_explicit_lockfile(conda_lock_fp)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_Prefetcher(pkgs_dir, workers).fetch, packages))
+
+    stats = PrefetchStats(
+        hits=sum(1 for hit, _ in results if hit),
+        misses=sum(1 for hit, _ in results if not hit),
+        bytes_downloaded=sum(size for hit, size in results if not hit),
+        bytes_saved=sum(size for hit, size in results if hit),
+        seconds=time.monotonic() - start,
+    )
+    logger.info(f'{METRICS_LOG_PREFIX} hits={stats.hits} misses={stats.misses} '
+                f'bytes_downloaded={stats.bytes_downloaded} bytes_saved={stats.bytes_saved} '
+                f'seconds={stats.seconds:.3f}')
+    return stats
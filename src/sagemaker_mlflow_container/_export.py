@@ -0,0 +1,354 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import errno
+import fcntl
+import fnmatch
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MODE_AUTO = 'auto'
+EXPORT_MODE_MOVE = 'move'
+EXPORT_MODE_HARDLINK = 'hardlink'
+EXPORT_MODE_REFLINK = 'reflink'
+EXPORT_MODE_COPY = 'copy'
+EXPORT_MODES = (EXPORT_MODE_AUTO, EXPORT_MODE_MOVE, EXPORT_MODE_HARDLINK, EXPORT_MODE_REFLINK, EXPORT_MODE_COPY)
+
+# Linux ioctl to share data blocks between files (btrfs, xfs, overlayfs over them)
+FICLONE = 0x40049409
+
+# Files larger than the chunk are copied by several workers concurrently
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Files are compressed by chunks of this size concurrently, every chunk is a separate gzip member
+COMPRESS_CHUNK_SIZE = 16 * 1024 * 1024
+
+# errors that mean that link or clone is not possible and the file should be copied
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EMLINK,
+                    errno.ENOSYS}
+
+
+class ExportStats(NamedTuple):
+    """Result of directory export"""
+    files: int
+    bytes: int
+    seconds: float
+    mode: str
+
+
+class ArtifactFilter(NamedTuple):
+    """
+    Selection of artifacts by glob patterns matched against paths relative to artifact root.
+    Pattern ending with `/` selects the whole dir (`model/` is the same as `model/*`)
+    """
+    include: Sequence[str] = ()  # all files are included if empty
+    exclude: Sequence[str] = ()
+
+    @staticmethod
+    def _matches(rel: str, pattern: str) -> bool:
+        if pattern.endswith('/'):
+            return rel.startswith(pattern)
+        return fnmatch.fnmatchcase(rel, pattern)
+
+    def __call__(self, rel: str) -> bool:
+        rel = rel.replace(os.sep, '/')
+        if self.include and not any(self._matches(rel, p) for p in self.include):
+            return False
+        return not any(self._matches(rel, p) for p in self.exclude)
+
+    def __bool__(self) -> bool:
+        return bool(self.include or self.exclude)
+
+
+def _same_filesystem(src: str, dst: str) -> bool:
+    parent = dst
+    while not os.path.exists(parent):
+        parent = os.path.dirname(parent)
+    return os.stat(src).st_dev == os.stat(parent).st_dev
+
+
+def _reflink(src: str, dst: str):
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def _copy_range(src: str, dst: str, offset: int, length: int):
+    """
+    Copy `length` bytes starting from `offset` of `src` file into the same position of `dst` file
+    in kernel space if possible (copy_file_range or sendfile) without passing data through user space
+    :param src:
+    :param dst:
+    :param offset:
+    :param length:
+    :return:
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'r+b') as fdst:
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        end = offset + length
+        pos = offset
+
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while pos < end:
+                    copied = os.copy_file_range(in_fd, out_fd, end - pos, pos, pos)
+                    if not copied:
+                        break
+                    pos += copied
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+
+        if pos < end:
+            os.lseek(out_fd, pos, os.SEEK_SET)
+            try:
+                while pos < end:
+                    copied = os.sendfile(out_fd, in_fd, pos, end - pos)
+                    if not copied:
+                        break
+                    pos += copied
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+
+        while pos < end:
+            data = os.pread(in_fd, min(end - pos, 1024 * 1024), pos)
+            if not data:
+                break
+            os.pwrite(out_fd, data, pos)
+            pos += len(data)
+
+
+class _TreeExporter:
+
+    def __init__(self, src: str, dst: str, mode: str, workers: int, select: Optional[Callable[[str], bool]] = None):
+        self.src = src
+        self.dst = dst
+        self.mode = mode
+        self.workers = workers
+        self.select = select
+
+    def _scan(self) -> Tuple[List[str], List[str], List[Tuple[str, int]]]:
+        """
+        Return relative paths of dirs, symlinks and regular files (with sizes) inside src dir
+        :return:
+        """
+        dirs, links, files = [], [], []
+        for root, dir_names, file_names in os.walk(self.src):
+            rel_root = os.path.relpath(root, self.src)
+            for name in dir_names + file_names:
+                rel = os.path.normpath(join(rel_root, name))
+                path = join(self.src, rel)
+                if os.path.islink(path):
+                    links.append(rel)
+                elif name in dir_names:
+                    dirs.append(rel)
+                else:
+                    files.append((rel, os.path.getsize(path)))
+
+        if self.select is not None:
+            links = [rel for rel in links if self.select(rel)]
+            files = [(rel, size) for rel, size in files if self.select(rel)]
+            # only dirs with selected entries are exported
+            parents = set()
+            for rel in links + [rel for rel, _ in files]:
+                parent = os.path.dirname(rel)
+                while parent and parent not in parents:
+                    parents.add(parent)
+                    parent = os.path.dirname(parent)
+            dirs = [rel for rel in dirs if rel in parents]
+        return dirs, links, files
+
+    def _link_or_clone(self, rel: str) -> bool:
+        """
+        Create dst file without copying of data
+        :param rel: file path relative to src dir
+        :return: False if file should be copied
+        """
+        src, dst = join(self.src, rel), join(self.dst, rel)
+        try:
+            if self.mode == EXPORT_MODE_HARDLINK:
+                os.link(src, dst)
+            elif self.mode == EXPORT_MODE_REFLINK:
+                _reflink(src, dst)
+            else:
+                return False
+            return True
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+            if os.path.exists(dst):
+                os.remove(dst)
+            return False
+
+    def export(self) -> Tuple[int, int]:
+        if self.mode == EXPORT_MODE_MOVE and self.select is None:
+            _, _, files = self._scan()
+            os.makedirs(os.path.dirname(self.dst) or '.', exist_ok=True)
+            shutil.move(self.src, self.dst)
+            return len(files), sum(size for _, size in files)
+
+        if self.mode == EXPORT_MODE_MOVE:
+            dirs, links, files = self._scan()
+            for rel in dirs:
+                os.makedirs(join(self.dst, rel), exist_ok=True)
+            for rel in links + [rel for rel, _ in files]:
+                os.makedirs(os.path.dirname(join(self.dst, rel)), exist_ok=True)
+                # rename or copy and delete if dst is on other filesystem
+                shutil.move(join(self.src, rel), join(self.dst, rel))
+            return len(files), sum(size for _, size in files)
+
+        dirs, links, files = self._scan()
+        os.makedirs(self.dst, exist_ok=True)
+        for rel in dirs:
+            os.makedirs(join(self.dst, rel), exist_ok=True)
+        for rel in links:
+            os.symlink(os.readlink(join(self.src, rel)), join(self.dst, rel))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            if self.mode == EXPORT_MODE_COPY:
+                to_copy = files
+            else:
+                linked = pool.map(self._link_or_clone, [rel for rel, _ in files])
+                to_copy = [f for f, is_linked in zip(files, linked) if not is_linked]
+
+            # small files are copied by a single worker, large ones are split by chunks between workers
+            small = [rel for rel, size in to_copy if size <= COPY_CHUNK_SIZE]
+            large = [(rel, size) for rel, size in to_copy if size > COPY_CHUNK_SIZE]
+            chunks = []
+            for rel, size in large:
+                with open(join(self.dst, rel), 'wb') as f:
+                    f.truncate(size)
+                chunks += [(rel, offset, min(COPY_CHUNK_SIZE, size - offset))
+                           for offset in range(0, size, COPY_CHUNK_SIZE)]
+
+            list(pool.map(lambda rel: shutil.copy2(join(self.src, rel), join(self.dst, rel)), small))
+            list(pool.map(lambda c: _copy_range(join(self.src, c[0]), join(self.dst, c[0]), c[1], c[2]), chunks))
+
+        for rel, _ in large:
+            shutil.copystat(join(self.src, rel), join(self.dst, rel))
+        for rel in dirs:
+            shutil.copystat(join(self.src, rel), join(self.dst, rel))
+
+        return len(files), sum(size for _, size in files)
+
+
+def export_tree(src: str, dst: str, mode: str = EXPORT_MODE_AUTO, workers: Optional[int] = None,
+                select: Optional[Callable[[str], bool]] = None) -> ExportStats:
+    """
+    Export `src` dir tree into not existing `dst` dir
+
+    Modes:
+    `move` – move the tree (src dir is removed);
+    `hardlink` – hardlink files (src and dst must be on the same filesystem);
+    `reflink` – clone files sharing data blocks (requires filesystem support);
+    `copy` – parallel chunked copy of files in the kernel space (copy_file_range/sendfile);
+    `auto` – `hardlink` if src and dst are on the same filesystem, `copy` otherwise.
+    Files that can't be linked or cloned are copied
+    :param src:
+    :param dst:
+    :param mode: one of EXPORT_MODES
+    :param workers: number of threads to copy files
+    :param select: predicate of file paths relative to `src` to export (e.g. ArtifactFilter), all files by default.
+    In `move` mode only selected files are moved
+    :return: export statistics
+    """
+    if mode not in EXPORT_MODES:
+        raise ValueError(f'Unknown export mode: {mode}, expected one of: {", ".join(EXPORT_MODES)}')
+    if os.path.exists(dst):
+        raise FileExistsError(errno.EEXIST, 'Destination already exists', dst)
+
+    if mode == EXPORT_MODE_AUTO:
+        mode = EXPORT_MODE_HARDLINK if _same_filesystem(src, dst) else EXPORT_MODE_COPY
+
+    start = time.monotonic()
+    files, size = _TreeExporter(src, dst, mode, workers or min(32, (os.cpu_count() or 1) * 4), select).export()
+    return ExportStats(files=files, bytes=size, seconds=time.monotonic() - start, mode=mode)
+
+
+def _gzip_file(src: str, dst: str, pool: ThreadPoolExecutor, slots: threading.BoundedSemaphore, level: int):
+    """
+    Compress file by chunks concurrently into multi-member gzip file (readable by gzip, zcat and python gzip)
+    :param src:
+    :param dst:
+    :param pool: pool that compresses chunks
+    :param slots: limits number of chunks in memory
+    :param level: compression level
+    :return:
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        pending = deque()
+        empty = True
+        while True:
+            # own compressed chunks are written out to free slots instead of waiting for other files
+            while not slots.acquire(blocking=False):
+                if not pending:
+                    slots.acquire()
+                    break
+                fdst.write(pending.popleft().result())
+                slots.release()
+            chunk = fsrc.read(COMPRESS_CHUNK_SIZE)
+            if not chunk:
+                slots.release()
+                break
+            empty = False
+            pending.append(pool.submit(gzip.compress, chunk, level))
+            while pending and pending[0].done():
+                fdst.write(pending.popleft().result())
+                slots.release()
+        while pending:
+            fdst.write(pending.popleft().result())
+            slots.release()
+        if empty:
+            # zero length file is not a valid gzip file
+            fdst.write(gzip.compress(b'', level))
+    shutil.copystat(src, dst)
+
+
+def compress_tree(src: str, dst: str, select: Callable[[str], bool], level: int = 6,
+                  workers: Optional[int] = None) -> ExportStats:
+    """
+    Compress files of `src` dir tree selected by predicate into `dst` dir as `<relative path>.gz` files.
+    Large files are split into chunks compressed concurrently (zlib releases GIL, so threads use all cores)
+    :param src:
+    :param dst:
+    :param select: predicate of file paths relative to `src` to compress
+    :param level: gzip compression level
+    :param workers: number of compressing threads
+    :return: export statistics, `bytes` is the size of compressed files
+    """
+    workers = workers or os.cpu_count() or 1
+    _, _, files = _TreeExporter(src, dst, EXPORT_MODE_COPY, workers, select)._scan()
+
+    start = time.monotonic()
+    for rel, _ in files:
+        os.makedirs(os.path.dirname(join(dst, rel)), exist_ok=True)
+    # files are read and written by `pool` threads, chunks of all files are compressed by `chunk_pool`
+    slots = threading.BoundedSemaphore(workers * 2)
+    with ThreadPoolExecutor(max_workers=workers) as chunk_pool, ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda f: _gzip_file(join(src, f[0]), join(dst, f'{f[0]}.gz'), chunk_pool, slots, level),
+                      files))
+    size = sum(os.path.getsize(join(dst, f'{rel}.gz')) for rel, _ in files)
+    return ExportStats(files=len(files), bytes=size, seconds=time.monotonic() - start, mode='gzip')
@@ -0,0 +1,117 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import logging
+import os
+import resource
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._utils import _param_to_bool
+
+logger = logging.getLogger(__name__)
+
+# thread pools of numpy/scipy/sklearn backends
+THREADS_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+# prefix of MLFlow run tags with effective launch settings
+TAGS_PREFIX = 'sagemaker_mlflow_container.launch.'
+
+
+class LaunchProfile(NamedTuple):
+    """Resources of training subprocess"""
+    threads: int
+    cpus: Optional[Sequence[int]]  # CPU set to pin the process tree to, not pinned if None
+    memory_limit_mb: Optional[int]  # RLIMIT_DATA of every process of the tree, unlimited if None
+
+    def environ(self, environ: Mapping[str, str]) -> Dict[str, str]:
+        """
+        Return copy of environment variables with thread counts of BLAS/OpenMP pools
+        :param environ:
+        :return:
+        """
+        environ = dict(environ)
+        environ.update({var: str(self.threads) for var in THREADS_ENV_VARS})
+        return environ
+
+    def apply(self, pid: int):
+        """
+        Apply CPU affinity and memory limit to the just started process, they are inherited by processes
+        that `mlflow run` launches. Unlike `preexec_fn` of `subprocess.Popen` it's safe with threads
+        :param pid:
+        :return:
+        """
+        if self.cpus is not None:
+            os.sched_setaffinity(pid, self.cpus)
+        if self.memory_limit_mb is not None:
+            limit = self.memory_limit_mb * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_DATA, (limit, limit))
+
+    def tags(self) -> Dict[str, str]:
+        return {
+            f'{TAGS_PREFIX}threads': str(self.threads),
+            f'{TAGS_PREFIX}cpus': ','.join(map(str, self.cpus)) if self.cpus is not None else 'all',
+            f'{TAGS_PREFIX}memory_limit_mb': str(self.memory_limit_mb or 'unlimited'),
+        }
+
+    def split(self, n: int) -> List['LaunchProfile']:
+        """
+        Split resources between `n` concurrent trainings on the same host
+        :param n:
+        :return:
+        """
+        n = max(n, 1)
+        threads = max(self.threads // n, 1)
+        memory_limit_mb = self.memory_limit_mb // n if self.memory_limit_mb is not None else None
+        if self.cpus is None or len(self.cpus) < n:
+            return [self._replace(threads=threads, memory_limit_mb=memory_limit_mb) for _ in range(n)]
+        size = len(self.cpus) // n
+        return [LaunchProfile(threads, self.cpus[i * size:(i + 1) * size], memory_limit_mb) for i in range(n)]
+
+
+def _host_memory_mb() -> int:
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+
+
+def launch_profile(num_cpus: int, num_gpus: int, container_params: Mapping[str, Any]) -> LaunchProfile:
+    """
+    Derive launch profile of training subprocess from SageMaker resource config:
+    one BLAS/OpenMP thread per available CPU (or $OMP_NUM_THREADS of the container), no CPU pinning
+    and memory limit of $LAUNCH_MEMORY_FRACTION of host memory on CPU hosts if it is set (GPU runtimes reserve
+    large address ranges, so memory is not limited on GPU hosts by default).
+    Defaults are overridden by `sagemaker_mlflow_container_num_threads`, `..._pin_cpus`
+    and `..._memory_limit_mb` (0 – unlimited) parameters
+    :param num_cpus: SageMaker `num_cpus` of the host
+    :param num_gpus: SageMaker `num_gpus` of the host
+    :param container_params: `sagemaker_mlflow_container_*` parameters
+    :return:
+    """
+    available = sorted(os.sched_getaffinity(0))
+    num_cpus = min(num_cpus, len(available)) if num_cpus else len(available)
+
+    threads = int(container_params.get(const.NUM_THREADS_PARAM, 0) or os.environ.get('OMP_NUM_THREADS', 0)) \
+        or num_cpus
+    cpus = available[:num_cpus] if _param_to_bool(container_params.get(const.PIN_CPUS_PARAM, False)) else None
+
+    if const.MEMORY_LIMIT_MB_PARAM in container_params:
+        memory_limit_mb = int(container_params[const.MEMORY_LIMIT_MB_PARAM]) or None
+    elif num_gpus == 0 and const.LAUNCH_MEMORY_FRACTION > 0:
+        memory_limit_mb = int(_host_memory_mb() * const.LAUNCH_MEMORY_FRACTION)
+    else:
+        memory_limit_mb = None
+
+    profile = LaunchProfile(threads, cpus, memory_limit_mb)
+    logger.info(f'Training launch profile: {profile}')
+    return profile
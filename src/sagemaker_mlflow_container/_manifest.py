@@ -0,0 +1,189 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import List, NamedTuple, Optional, Tuple
+
+from sagemaker_mlflow_container._export import _FALLBACK_ERRNOS, _reflink
+from sagemaker_mlflow_container._utils import _file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Files are hashed by reads of this size into reused buffer, hashlib releases GIL on large updates,
+# so files are hashed by threads in parallel
+HASH_BUFFER_SIZE = 8 * 1024 * 1024
+
+MANIFEST_ALGORITHM = 'sha256'
+
+# prefix of references to files in content-addressed store that replace deduplicated files
+CAS_REF_PREFIX = 'cas://sha256/'
+
+
+class ManifestEntry(NamedTuple):
+    """Exported artifact file"""
+    path: str  # relative to artifacts root, `/` separated
+    size: int
+    sha256: str
+    ref: Optional[str] = None  # reference to content-addressed store if the file was replaced by it
+
+
+class DedupStats(NamedTuple):
+    """Result of deduplication against content-addressed store"""
+    replaced: int
+    bytes_saved: int
+    stored: int
+
+
+def build_manifest(root: str, workers: Optional[int] = None,
+                   buffer_size: int = HASH_BUFFER_SIZE) -> List[ManifestEntry]:
+    """
+    Hash every regular file of dir tree (symlinks are skipped) in a thread pool
+    :param root:
+    :param workers: number of hashing threads, number of CPUs by default
+    :param buffer_size: size of reads
+    :return: entries sorted by path
+    """
+    files: List[Tuple[str, int]] = []
+    for dir_path, _, file_names in os.walk(root):
+        for name in file_names:
+            path = join(dir_path, name)
+            if not os.path.islink(path):
+                files.append((os.path.relpath(path, root).replace(os.sep, '/'), os.path.getsize(path)))
+
+    local = threading.local()
+
+    def hash_file(file: Tuple[str, int]) -> ManifestEntry:
+        if not hasattr(local, 'buffer'):
+            local.buffer = bytearray(buffer_size)
+        rel, size = file
+        return ManifestEntry(rel, size, _file_sha256(join(root, rel), local.buffer))
+
+    # large files first, so they don't end up hashed alone at the end
+    files.sort(key=lambda f: -f[1])
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        entries = list(pool.map(hash_file, files))
+    return sorted(entries, key=lambda e: e.path)
+
+
+def write_manifest(path: str, entries: List[ManifestEntry]):
+    with open(path, 'w') as f:
+        json.dump({'algorithm': MANIFEST_ALGORITHM,
+                   'files': [{k: v for k, v in e._asdict().items() if v is not None} for e in entries]}, f, indent=1)
+
+
+def read_manifest(path: str) -> List[ManifestEntry]:
+    with open(path) as f:
+        return [ManifestEntry(**e) for e in json.load(f)['files']]
+
+
+def _cas_path(cas_root: str, sha256: str) -> str:
+    return join(cas_root, 'sha256', sha256[:2], sha256)
+
+
+def _store(src: str, dst: str):
+    """
+    Put file into content-addressed store: reflink if filesystem supports it, copy otherwise.
+    Stored file doesn't share inode with artifact (unlike hardlink), so changes of the artifact
+    don't corrupt the store
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp_path = f'{dst}.{threading.get_ident()}.tmp'
+    try:
+        try:
+            _reflink(src, tmp_path)
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def dedup_files(root: str, entries: List[ManifestEntry], cas_root: str,
+                min_size: int) -> Tuple[List[ManifestEntry], DedupStats]:
+    """
+    Replace files which content is already in content-addressed store by references,
+    new files are added to the store to be deduplicated in the next runs
+    :param root: exported artifacts dir
+    :param entries: manifest of `root`
+    :param cas_root: content-addressed store dir (`<cas_root>/sha256/<2 chars>/<sha256>` files)
+    :param min_size: smaller files are left as is
+    :return: updated manifest entries and statistics
+    """
+    result, replaced, bytes_saved, stored = [], 0, 0, 0
+    for entry in entries:
+        if entry.size < min_size:
+            result.append(entry)
+            continue
+        cas_path = _cas_path(cas_root, entry.sha256)
+        if os.path.isfile(cas_path) and os.path.getsize(cas_path) == entry.size:
+            os.remove(join(root, entry.path))
+            result.append(entry._replace(ref=f'{CAS_REF_PREFIX}{entry.sha256}'))
+            replaced += 1
+            bytes_saved += entry.size
+        else:
+            _store(join(root, entry.path), cas_path)
+            result.append(entry)
+            stored += 1
+    return result, DedupStats(replaced, bytes_saved, stored)
+
+
+def restore_refs(root: str, entries: List[ManifestEntry], cas_root: str):
+    """
+    Restore files replaced by references from content-addressed store
+    :param root: artifacts dir
+    :param entries: manifest of `root`
+    :param cas_root: content-addressed store dir
+    :return:
+    """
+    for entry in entries:
+        if entry.ref is None:
+            continue
+        dst = join(root, entry.path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(_cas_path(cas_root, entry.sha256), dst)
+
+
+def export_manifest(root: str, manifest_path: str, cas_root: Optional[str] = None,
+                    min_size: int = 0) -> List[ManifestEntry]:
+    """
+    Write manifest (path, size, sha256) of exported artifacts, optionally deduplicating them
+    against content-addressed store
+    :param root: exported artifacts dir
+    :param manifest_path:
+    :param cas_root: content-addressed store dir, deduplication is disabled if None
+    :param min_size: min size of deduplicated files
+    :return: manifest entries
+    """
+    start = time.monotonic()
+    entries = build_manifest(root)
+    hashed = time.monotonic() - start
+    logger.info(f'Artifacts manifest: {len(entries)} files, {sum(e.size for e in entries)} bytes '
+                f'hashed in {hashed:.2f}s')
+    if cas_root:
+        entries, stats = dedup_files(root, entries, cas_root, min_size)
+        logger.info(f'Artifacts deduplication against {cas_root}: {stats.replaced} files '
+                    f'({stats.bytes_saved} bytes) replaced by references, {stats.stored} files stored')
+    write_manifest(manifest_path, entries)
+    return entries
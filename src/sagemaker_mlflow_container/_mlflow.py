@@ -14,30 +14,60 @@
 #    limitations under the License.
 #
 import logging
-
-import urllib3
-import shutil
 from os.path import join
-
-import mlflow
+from typing import Optional
+from urllib.parse import urlparse
 
 from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._export import ArtifactFilter, compress_tree, export_tree
+from sagemaker_mlflow_container._manifest import export_manifest
 
 logger = logging.getLogger(__name__)
 
 
-def _copy_mlflow_results_to_dir(run_id: str, dir_: str):
+def _copy_mlflow_results_to_dir(run_id: str, dir_: str, artifact_filter: ArtifactFilter = ArtifactFilter(),
+                                excluded_dir: Optional[str] = None, dedup: bool = False):
     """
-    Copy MLFlow run artifacts to directory
+    Copy MLFlow run artifacts to directory and write their manifest next to them
     :param run_id:
     :param dir_:
+    :param artifact_filter: artifacts to copy, all artifacts by default
+    :param excluded_dir: dir to compress local artifacts that are not selected by filter into
+    :param dedup: replace artifacts which content is already in $ARTIFACTS_CAS_DIR by references
     :return:
     """
-    artifact_uri: str = mlflow.get_run(run_id).info.artifact_uri
-    url = urllib3.util.parse_url(artifact_uri)
-    if url.scheme != 'file':
-        raise NotImplementedError('Only local artifact storage is supported')
+    import mlflow
 
+    artifact_uri: str = mlflow.get_run(run_id).info.artifact_uri
+    url = urlparse(artifact_uri)
     result_dir = join(dir_, const.SAGEMAKER_MODEL_SUBDIR)
-    shutil.copytree(url.path, join(dir_, result_dir))
-    logger.info(f'MLFlow run: {run_id} artifacts were copied to {result_dir}')
+
+    select = artifact_filter if artifact_filter else None
+
+    if url.scheme == 'file':
+        stats = export_tree(url.path, result_dir, const.ARTIFACTS_EXPORT_MODE, select=select)
+        if select is not None and excluded_dir:
+            excluded_result_dir = join(excluded_dir, const.SAGEMAKER_MODEL_SUBDIR)
+            excluded = compress_tree(url.path, excluded_result_dir, lambda rel: not select(rel),
+                                     const.ARTIFACTS_COMPRESS_LEVEL)
+            logger.info(f'MLFlow run: {run_id} artifacts excluded from export were compressed to '
+                        f'{excluded_result_dir}: {excluded.files} files, {excluded.bytes} bytes '
+                        f'in {excluded.seconds:.2f}s')
+    else:
+        from sagemaker_mlflow_container._remote import REMOTE_SCHEMES, download_artifacts
+
+        if url.scheme not in REMOTE_SCHEMES:
+            raise NotImplementedError(f'Artifact storage with {url.scheme} scheme is not supported')
+        stats = download_artifacts(artifact_uri, run_id, result_dir, select=select)
+
+    logger.info(f'MLFlow run: {run_id} artifacts were exported to {result_dir} using {stats.mode} mode: '
+                f'{stats.files} files, {stats.bytes} bytes in {stats.seconds:.2f}s')
+
+    cas_root = None
+    if dedup:
+        if const.ARTIFACTS_CAS_DIR:
+            cas_root = const.ARTIFACTS_CAS_DIR
+        else:
+            logger.warning('$ARTIFACTS_CAS_DIR is not set, artifacts are not deduplicated')
+    export_manifest(result_dir, join(dir_, const.ARTIFACTS_MANIFEST_FILE), cas_root,
+                    int(const.ARTIFACTS_DEDUP_MIN_SIZE_MB * 1024 * 1024))
@@ -0,0 +1,125 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sagemaker_mlflow_container._timing import StageTimer
+
+logger = logging.getLogger(__name__)
+
+
+class Stage(NamedTuple):
+    """Unit of work of the pipeline that is started when all `requires` stages are finished"""
+    name: str
+    func: Callable[[], Any]
+    requires: Tuple[str, ...] = ()
+    # called from another thread to make running `func` return early when the pipeline is failed
+    cancel: Optional[Callable[[], None]] = None
+
+
+def _run_stage(stage: Stage, timer: Optional[StageTimer]) -> Any:
+    logger.info(f'Stage {stage.name} started')
+    start = time.monotonic()
+    func = stage.func if timer is None else timer.wrap(stage.name, stage.func)
+    try:
+        return func()
+    finally:
+        logger.info(f'Stage {stage.name} finished in {time.monotonic() - start:.2f}s')
+
+
+def _start_stage(stage: Stage, timer: Optional[StageTimer]) -> Future:
+    """
+    Run stage in a daemon thread. Unlike `ThreadPoolExecutor` threads that are joined at interpreter exit,
+    a stage abandoned by the failed pipeline doesn't keep the process running
+    :param stage:
+    :param timer:
+    :return: future of the stage func result
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(_run_stage(stage, timer))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f'stage-{stage.name}', daemon=True).start()
+    return future
+
+
+def run_stages(stages: Iterable[Stage], max_workers: Optional[int] = None,
+               timer: Optional[StageTimer] = None) -> Dict[str, Any]:
+    """
+    Run stages concurrently in threads respecting dependencies between them
+
+    If any stage fails, stages that were not started yet are not run. Running stages with `cancel` hook
+    are cancelled and waited for, the other running stages are abandoned: the error is raised without waiting for them
+    and their daemon threads don't delay exit of the failed process
+    :param stages:
+    :param max_workers: max number of concurrently running stages (by default – all stages)
+    :param timer: timer to record span of every stage
+    :return: mapping of stage name to the value returned by stage func
+    """
+    pending: Dict[str, Stage] = {s.name: s for s in stages}
+    unknown = {r for s in pending.values() for r in s.requires if r not in pending}
+    if unknown:
+        raise ValueError(f'Unknown stages are required: {", ".join(sorted(unknown))}')
+
+    results: Dict[str, Any] = {}
+    running: Dict[Future, Stage] = {}
+    max_workers = max_workers or max(len(pending), 1)
+
+    def submit_ready():
+        for name, stage in list(pending.items()):
+            if len(running) >= max_workers:
+                return
+            if all(r in results for r in stage.requires):
+                del pending[name]
+                running[_start_stage(stage, timer)] = stage
+
+    start = time.monotonic()
+    try:
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                results[stage.name] = future.result()
+            submit_ready()
+    except BaseException:
+        cancelled = {future: stage for future, stage in running.items() if stage.cancel is not None}
+        for stage in cancelled.values():
+            try:
+                stage.cancel()
+            except Exception as e:
+                logger.warning(f'Failed to cancel stage {stage.name}: {e}')
+        abandoned = [stage.name for stage in running.values() if stage.cancel is None]
+        if pending or running:
+            logger.error(f'Pipeline failed, not started stages: {", ".join(sorted(pending)) or "-"}, '
+                         f'cancelled stages: {", ".join(sorted(s.name for s in cancelled.values())) or "-"}, '
+                         f'abandoned running stages: {", ".join(sorted(abandoned)) or "-"}')
+        wait(cancelled)
+        raise
+
+    if pending:
+        raise ValueError(f'Stages have circular dependencies: {", ".join(sorted(pending))}')
+
+    logger.info(f'Pipeline finished in {time.monotonic() - start:.2f}s')
+    return results
@@ -0,0 +1,236 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+import urllib3
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._export import ExportStats
+
+logger = logging.getLogger(__name__)
+
+S3_SCHEMES = ('s3',)
+HTTP_SCHEMES = ('http', 'https')
+REMOTE_SCHEMES = S3_SCHEMES + HTTP_SCHEMES
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class RemoteObject(NamedTuple):
+    """Artifact file in remote storage"""
+    path: str  # relative to artifact root
+    size: Optional[int]  # None if storage doesn't report size, object is downloaded by one request
+
+
+class _S3Source:
+    """
+    Artifacts located in S3 compatible storage
+    $MLFLOW_S3_ENDPOINT_URL is used as endpoint url (the same as MLFlow does) to support MinIO and others
+    """
+
+    def __init__(self, artifact_uri: str, max_connections: int):
+        import boto3
+        from botocore.config import Config
+
+        url = urllib3.util.parse_url(artifact_uri)
+        self.bucket = url.host
+        self.prefix = (url.path or '').strip('/')
+        self.client = boto3.client(
+            's3',
+            endpoint_url=os.environ.get('MLFLOW_S3_ENDPOINT_URL'),
+            config=Config(max_pool_connections=max_connections,
+                          retries={'max_attempts': const.ARTIFACTS_DOWNLOAD_RETRIES, 'mode': 'standard'}),
+        )
+
+    def list(self) -> List[RemoteObject]:
+        prefix = f'{self.prefix}/' if self.prefix else ''
+        objects = []
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('/'):
+                    objects.append(RemoteObject(obj['Key'][len(prefix):], obj['Size']))
+        return objects
+
+    def read_range(self, path: str, start: int, end: int) -> Iterator[bytes]:
+        """
+        Read bytes [start, end) of object
+        :param path:
+        :param start:
+        :param end:
+        :return: iterator over data chunks
+        """
+        key = f'{self.prefix}/{path}' if self.prefix else path
+        body = self.client.get_object(Bucket=self.bucket, Key=key, Range=f'bytes={start}-{end - 1}')['Body']
+        try:
+            yield from iter(lambda: body.read(READ_CHUNK_SIZE), b'')
+        finally:
+            body.close()
+
+
+class _HttpSource:
+    """
+    Artifacts that are available over HTTP (e.g. served by MLFlow tracking server)
+    Artifacts are listed using MLFlow tracking API
+    """
+
+    def __init__(self, artifact_uri: str, run_id: str, max_connections: int):
+        self.artifact_uri = artifact_uri.rstrip('/')
+        self.run_id = run_id
+        self.pool = urllib3.PoolManager(
+            maxsize=max_connections, block=True,
+            retries=urllib3.Retry(total=const.ARTIFACTS_DOWNLOAD_RETRIES, backoff_factor=0.5,
+                                  status_forcelist=(429, 500, 502, 503, 504)),
+        )
+
+    def list(self) -> List[RemoteObject]:
+        from mlflow.tracking import MlflowClient
+
+        client = MlflowClient()
+        objects, dirs = [], [None]
+        while dirs:
+            for info in client.list_artifacts(self.run_id, dirs.pop()):
+                if info.is_dir:
+                    dirs.append(info.path)
+                else:
+                    size = info.file_size if info.file_size is not None else self._size(info.path)
+                    objects.append(RemoteObject(info.path, size))
+        return objects
+
+    def _size(self, path: str) -> Optional[int]:
+        """
+        Return size of artifact which is not listed by tracking server from Content-Length of HEAD response
+        :param path:
+        :return: None if size is unknown
+        """
+        response = self.pool.request('HEAD', f'{self.artifact_uri}/{path}')
+        if response.status != 200:
+            raise IOError(f'Unable to get size of {path}: HTTP {response.status}')
+        length = response.headers.get('Content-Length')
+        return int(length) if length is not None else None
+
+    def read_range(self, path: str, start: int, end: Optional[int]) -> Iterator[bytes]:
+        """
+        Read bytes [start, end) of artifact, the whole artifact if `end` is None
+        :param path:
+        :param start:
+        :param end:
+        :return: iterator over data chunks
+        """
+        headers = {'Range': f'bytes={start}-{end - 1}'} if end is not None else {}
+        response = self.pool.request('GET', f'{self.artifact_uri}/{path}', preload_content=False, headers=headers)
+        try:
+            if response.status not in (200, 206):
+                raise IOError(f'Unable to download {path}: HTTP {response.status}')
+            if response.status == 200 and end is not None \
+                    and (start, end) != (0, int(response.headers.get('Content-Length', -1))):
+                raise IOError(f'Server does not support range requests for {path}')
+            yield from response.stream(READ_CHUNK_SIZE)
+        finally:
+            response.release_conn()
+
+
+class _ParallelDownloader:
+    """
+    Download objects into local dir splitting large objects into parts that are downloaded concurrently
+    """
+
+    def __init__(self, source, dst: str, workers: int, part_size: int, retries: int):
+        self.source = source
+        self.dst = dst
+        self.workers = workers
+        self.part_size = part_size
+        self.retries = retries
+
+    def _download_part(self, part: Tuple[RemoteObject, int, Optional[int]]):
+        obj, start, end = part
+        for attempt in range(1, self.retries + 1):
+            try:
+                fd = os.open(join(self.dst, obj.path), os.O_WRONLY)
+                try:
+                    pos = start
+                    for chunk in self.source.read_range(obj.path, start, end):
+                        os.pwrite(fd, chunk, pos)
+                        pos += len(chunk)
+                finally:
+                    os.close(fd)
+                if end is not None and pos != end:
+                    raise IOError(f'Unexpected end of {obj.path} at {pos}, expected {end}')
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f'Download of {obj.path} [{start}, {end}) failed (attempt {attempt}): {e}')
+                time.sleep(min(2 ** attempt * 0.1, 5))
+
+    def download(self, objects: List[RemoteObject]):
+        for obj in objects:
+            if os.path.isabs(obj.path) or '..' in obj.path.split('/'):
+                raise ValueError(f'Artifact path {obj.path} points outside of artifacts dir')
+
+        parts = []
+        for obj in objects:
+            path = join(self.dst, obj.path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                if obj.size is None:
+                    parts.append((obj, 0, None))
+                    continue
+                f.truncate(obj.size)
+            parts += [(obj, start, min(start + self.part_size, obj.size))
+                      for start in range(0, obj.size, self.part_size)]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(self._download_part, parts))
+
+
+def download_artifacts(artifact_uri: str, run_id: str, dst: str, workers: Optional[int] = None,
+                       part_size: Optional[int] = None,
+                       select: Optional[Callable[[str], bool]] = None) -> ExportStats:
+    """
+    Download run artifacts from remote artifact storage (`s3://` or `http(s)://`) into not existing `dst` dir
+    All downloads share one connection pool which size is equal to number of workers
+    :param artifact_uri: run artifact uri
+    :param run_id: MLFlow run id
+    :param dst:
+    :param workers: max number of concurrent requests
+    :param part_size: objects larger than part size are downloaded by several range requests concurrently
+    :param select: predicate of artifact paths relative to artifact root to download, all artifacts by default
+    :return: export statistics
+    """
+    workers = workers or const.ARTIFACTS_DOWNLOAD_CONCURRENCY
+    part_size = part_size or const.ARTIFACTS_DOWNLOAD_PART_SIZE_MB * 1024 * 1024
+    scheme = urllib3.util.parse_url(artifact_uri).scheme
+
+    if scheme in S3_SCHEMES:
+        source = _S3Source(artifact_uri, workers)
+    elif scheme in HTTP_SCHEMES:
+        source = _HttpSource(artifact_uri, run_id, workers)
+    else:
+        raise NotImplementedError(f'Artifact storage with {scheme} scheme is not supported')
+
+    start = time.monotonic()
+    objects = source.list()
+    if select is not None:
+        objects = [obj for obj in objects if select(obj.path)]
+    os.makedirs(dst)
+    _ParallelDownloader(source, dst, workers, part_size, const.ARTIFACTS_DOWNLOAD_RETRIES).download(objects)
+    size = sum(o.size if o.size is not None else os.path.getsize(join(dst, o.path)) for o in objects)
+    return ExportStats(files=len(objects), bytes=size, seconds=time.monotonic() - start, mode=scheme)
@@ -0,0 +1,336 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+"""
+Rendezvous of training hosts over TCP
+
+The leader host sets up training env and creates MLFlow run, then broadcasts run id and packed
+conda env to worker hosts. Workers report to the leader when their training is finished or failed,
+a worker that fails before it is connected sends its failure report instead of the first message.
+
+Protocol: every message is a JSON document on a single line. Packed conda env is sent as raw bytes
+right after the message that declares its size:
+
+worker -> leader: {"host": ..., "env_up_to_date": ...}
+leader -> worker: {"run_id": ..., "snapshot_key": ..., "snapshot_size": ...} + snapshot bytes
+worker -> leader: {"host": ..., "success": ..., "error": ...}
+"""
+import json
+import logging
+import os
+import socket
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from os.path import join
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+from sagemaker_mlflow_container import const
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# closing of listening socket doesn't wake up `accept` blocked in another thread, so it waits with timeout
+ACCEPT_POLL_SECONDS = 0.5
+
+
+class RunAnnouncement(NamedTuple):
+    """MLFlow run and training env received by worker from the leader"""
+    run_id: str
+    snapshot_key: str
+    snapshot: Optional[str]  # path to received packed conda env, None if worker env is up to date
+
+
+def leader_host(hosts: Sequence[str]) -> str:
+    """
+    Return host that sets up training env and creates MLFlow run (the same as SageMaker master host)
+    :param hosts: all hosts of training job
+    :return:
+    """
+    return sorted(hosts)[0]
+
+
+def _send_message(sock: socket.socket, message: Mapping[str, Any]):
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _read_message(reader) -> Dict[str, Any]:
+    line = reader.readline()
+    if not line:
+        raise ConnectionError('Connection is closed by the other host')
+    return json.loads(line)
+
+
+class _WorkerConnection(NamedTuple):
+    host: str
+    sock: socket.socket
+    reader: Any
+    env_up_to_date: bool
+
+
+class LeaderRendezvous:
+    """
+    Leader side of the rendezvous. Listening is started on enter so workers can connect
+    while the leader is setting up training env
+    """
+
+    def __init__(self, workers: Sequence[str], port: int = const.RENDEZVOUS_PORT,
+                 timeout: float = const.RENDEZVOUS_TIMEOUT_SECONDS):
+        """
+        :param workers: hosts that are expected to connect
+        :param port: port to listen on
+        :param timeout: seconds to wait for all workers to connect
+        """
+        self.workers = sorted(workers)
+        self.port = port
+        self.timeout = timeout
+        self._server: Optional[socket.socket] = None
+        self._connections: List[_WorkerConnection] = []
+        self._watcher: Optional[ThreadPoolExecutor] = None
+        self._reports: List[Future] = []
+        self._closed = False
+
+    def __enter__(self):
+        if self.workers:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind(('', self.port))
+            self._server.listen(len(self.workers))
+            logger.info(f'Rendezvous leader listens on port {self.port}, waiting for {", ".join(self.workers)}')
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # workers see closed connection and fail if the leader is failed before the end of training
+        self._closed = True
+        for conn in self._connections:
+            try:
+                # unblocks threads that read reports
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.reader.close()
+            conn.sock.close()
+        self._connections = []
+        if self._watcher is not None:
+            self._watcher.shutdown(wait=False)
+            self._watcher = None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    def accept_workers(self):
+        """
+        Block until all workers are connected or rendezvous is closed from another thread
+        :return:
+        """
+        server = self._server
+        deadline = time.monotonic() + self.timeout
+        expected = set(self.workers)
+        while expected:
+            if self._closed:
+                raise RuntimeError(f'Rendezvous is closed before workers are connected: {", ".join(sorted(expected))}')
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f'Workers are not connected in {self.timeout}s: {", ".join(sorted(expected))}')
+            server.settimeout(min(remaining, ACCEPT_POLL_SECONDS))
+            try:
+                sock, address = server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._closed:
+                    continue
+                raise
+            if self._closed:
+                sock.close()
+                continue
+            sock.settimeout(remaining)
+            reader = sock.makefile('rb')
+            hello = _read_message(reader)
+            sock.settimeout(None)
+            if hello['host'] not in expected:
+                logger.warning(f'Unexpected host {hello["host"]} ({address[0]}) is connected, close connection')
+                reader.close()
+                sock.close()
+                continue
+            if 'success' in hello:
+                reader.close()
+                sock.close()
+                raise RuntimeError(f'Training is failed on worker {hello["host"]} before it is connected: '
+                                   f'{hello.get("error")}')
+            expected.discard(hello['host'])
+            self._connections.append(_WorkerConnection(hello['host'], sock, reader, hello['env_up_to_date']))
+            logger.info(f'Worker {hello["host"]} is connected from {address[0]}')
+
+    @property
+    def workers_need_env(self) -> bool:
+        return any(not conn.env_up_to_date for conn in self._connections)
+
+    def _announce(self, conn: _WorkerConnection, run_id: str, snapshot_key: str, snapshot: Optional[str]):
+        if conn.env_up_to_date or snapshot is None:
+            _send_message(conn.sock, {'run_id': run_id, 'snapshot_key': snapshot_key, 'snapshot_size': 0})
+            return
+        _send_message(conn.sock, {'run_id': run_id, 'snapshot_key': snapshot_key,
+                                  'snapshot_size': os.path.getsize(snapshot)})
+        with open(snapshot, 'rb') as f:
+            conn.sock.sendfile(f)
+        logger.info(f'Packed conda env {snapshot} is sent to {conn.host}')
+
+    def broadcast_run(self, run_id: str, snapshot_key: str, snapshot: Optional[str]):
+        """
+        Send run id to all workers and packed conda env to workers which env is not up to date.
+        Workers are served concurrently
+        :param run_id: MLFlow run id
+        :param snapshot_key: key of training env (see `_conda._env_snapshot_key`)
+        :param snapshot: path to packed training env
+        :return:
+        """
+        if not self._connections:
+            return
+        with ThreadPoolExecutor(max_workers=len(self._connections)) as pool:
+            list(pool.map(lambda c: self._announce(c, run_id, snapshot_key, snapshot), self._connections))
+
+    def _read_report(self, conn: _WorkerConnection,
+                     on_failure: Optional[Callable[[str, str], None]]) -> Dict[str, Any]:
+        try:
+            report = _read_message(conn.reader)
+        except (OSError, ValueError) as e:
+            report = {'success': False, 'error': str(e)}
+        if not report['success'] and on_failure is not None and not self._closed:
+            on_failure(conn.host, report.get('error'))
+        return report
+
+    def watch_workers(self, on_failure: Optional[Callable[[str, str], None]] = None):
+        """
+        Start reading reports of workers in background, so failure of a worker is known
+        while the leader is still training
+        :param on_failure: called with host and error as soon as a worker reports failure
+        :return:
+        """
+        if self._watcher is not None or not self._connections:
+            return
+        self._watcher = ThreadPoolExecutor(max_workers=len(self._connections))
+        self._reports = [self._watcher.submit(self._read_report, conn, on_failure) for conn in self._connections]
+
+    def wait_workers(self):
+        """
+        Block until all workers report the end of training
+        :return:
+        """
+        self.watch_workers()
+        failed = []
+        for conn, report in zip(self._connections, self._reports):
+            report = report.result()
+            if not report['success']:
+                logger.error(f'Training on {conn.host} is failed: {report.get("error")}')
+                failed.append(conn.host)
+        if failed:
+            raise RuntimeError(f'Training is failed on workers: {", ".join(failed)}')
+
+
+class WorkerRendezvous:
+    """
+    Worker side of the rendezvous
+    """
+
+    def __init__(self, host: str, leader: str, port: int = const.RENDEZVOUS_PORT,
+                 timeout: float = const.RENDEZVOUS_TIMEOUT_SECONDS):
+        """
+        :param host: current host
+        :param leader: leader host
+        :param port: port the leader listens on
+        :param timeout: seconds to retry connection to the leader
+        """
+        self.host = host
+        self.leader = leader
+        self.port = port
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+            self._sock = None
+
+    def connect(self, env_up_to_date: bool):
+        """
+        Connect to the leader retrying while it is not listening yet
+        :param env_up_to_date: whether training env of the worker is already up to date
+        :return:
+        """
+        self._connect()
+        _send_message(self._sock, {'host': self.host, 'env_up_to_date': env_up_to_date})
+
+    def _connect(self):
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self._sock = socket.create_connection((self.leader, self.port),
+                                                      timeout=max(deadline - time.monotonic(), 0.1))
+                break
+            except OSError as e:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f'Unable to connect to leader {self.leader}:{self.port} '
+                                       f'in {self.timeout}s: {e}')
+                time.sleep(min(0.1 * 2 ** attempt, 2))
+        self._sock.settimeout(None)
+        self._reader = self._sock.makefile('rb')
+        logger.info(f'Connected to rendezvous leader {self.leader}:{self.port}')
+
+    def receive_run(self, snapshot_dir: str) -> RunAnnouncement:
+        """
+        Block until the leader creates MLFlow run
+        :param snapshot_dir: dir to save received packed conda env into
+        :return:
+        """
+        message = _read_message(self._reader)
+        snapshot = None
+        if message['snapshot_size']:
+            snapshot = join(snapshot_dir, f'{message["snapshot_key"]}.tar.gz')
+            remaining = message['snapshot_size']
+            with open(snapshot, 'wb') as f:
+                while remaining:
+                    chunk = self._reader.read(min(remaining, READ_CHUNK_SIZE))
+                    if not chunk:
+                        raise ConnectionError('Connection is closed while receiving packed conda env')
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            logger.info(f'Packed conda env is received from the leader: {snapshot}')
+        return RunAnnouncement(message['run_id'], message['snapshot_key'], snapshot)
+
+    def report(self, success: bool, error: str = ''):
+        """
+        Report the end of training to the leader. Worker that is not connected yet connects to report failure,
+        so the leader fails without waiting for it
+        :param success:
+        :param error: error description if training is failed
+        :return:
+        """
+        if self._sock is None:
+            self._connect()
+        _send_message(self._sock, {'host': self.host, 'success': success, 'error': error})
@@ -0,0 +1,273 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from sagemaker_mlflow_container import const
+
+logger = logging.getLogger(__name__)
+
+PROC_DIR = '/proc'
+
+# Prefix of log lines with resource usage summary, SageMaker metric definition example:
+# {'Name': 'peak_rss_mb', 'Regex': 'resource_usage: rss_mb peak=([0-9.]+)'}
+METRICS_LOG_PREFIX = 'resource_usage:'
+
+# MLFlow limits number of metrics in one log_batch request
+MAX_METRICS_PER_BATCH = 1000
+
+MEASURES = ('cpu_percent', 'rss_mb', 'read_bytes_per_second', 'write_bytes_per_second', 'threads', 'processes')
+
+
+class ProcessStat(NamedTuple):
+    """Counters of a single process read from /proc"""
+    ppid: int
+    cpu_ticks: int  # user + system
+    threads: int
+    rss_pages: int
+    read_bytes: int
+    write_bytes: int
+
+
+class Sample(NamedTuple):
+    """Resource usage of process tree aggregated over all its processes"""
+    timestamp: float  # unix timestamp
+    cpu_percent: float  # 100 is one fully used CPU
+    rss_mb: float
+    read_bytes_per_second: float
+    write_bytes_per_second: float
+    threads: int
+    processes: int
+
+
+def _read_io(pid: int) -> Tuple[int, int]:
+    read_bytes = write_bytes = 0
+    try:
+        with open(f'{PROC_DIR}/{pid}/io') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'read_bytes':
+                    read_bytes = int(value)
+                elif key == 'write_bytes':
+                    write_bytes = int(value)
+    except OSError:
+        pass
+    return read_bytes, write_bytes
+
+
+def _read_stat(pid: int) -> Optional[ProcessStat]:
+    try:
+        with open(f'{PROC_DIR}/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # process name in parentheses may contain spaces, fields after it are space separated
+    fields = stat[stat.rindex(')') + 2:].split()
+    return ProcessStat(ppid=int(fields[1]), cpu_ticks=int(fields[11]) + int(fields[12]), threads=int(fields[17]),
+                       rss_pages=int(fields[21]), read_bytes=0, write_bytes=0)
+
+
+def _process_tree(root_pid: int) -> Dict[int, ProcessStat]:
+    """
+    Read counters of process and all its descendants
+    :param root_pid:
+    :return: stats by pid
+    """
+    stats = {}
+    for name in os.listdir(PROC_DIR):
+        if name.isdigit():
+            stat = _read_stat(int(name))
+            if stat is not None:
+                stats[int(name)] = stat
+
+    children: Dict[int, List[int]] = {}
+    for pid, stat in stats.items():
+        children.setdefault(stat.ppid, []).append(pid)
+    tree: Set[int] = set()
+    stack = [root_pid] if root_pid in stats else []
+    while stack:
+        pid = stack.pop()
+        tree.add(pid)
+        stack.extend(children.get(pid, ()))
+    return {pid: stats[pid]._replace(**dict(zip(('read_bytes', 'write_bytes'), _read_io(pid)))) for pid in tree}
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def summarize(samples: List[Sample]) -> Dict[str, Dict[str, float]]:
+    """
+    Return peak, p95 and mean of every measure
+    :param samples:
+    :return:
+    """
+    summary = {}
+    for measure in MEASURES:
+        values = [getattr(s, measure) for s in samples]
+        summary[measure] = {'peak': max(values), 'p95': _percentile(values, 95), 'mean': sum(values) / len(values)}
+    return summary
+
+
+class ResourceSampler:
+    """
+    Sample CPU, RSS, I/O and threads of process tree from /proc in background thread
+    and log them to MLFlow run as `resource_<measure>` metrics by batches
+    """
+
+    def __init__(self, root_pid: int, run_id: Optional[str], interval: float = const.RESOURCE_SAMPLE_INTERVAL_SECONDS,
+                 flush_interval: float = const.RESOURCE_FLUSH_INTERVAL_SECONDS):
+        """
+        :param root_pid: pid of process which tree is sampled
+        :param run_id: MLFlow run to log metrics to, metrics are not logged if None
+        :param interval: seconds between samples
+        :param flush_interval: seconds between log_batch requests
+        """
+        self.root_pid = root_pid
+        self.run_id = run_id
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.samples: List[Sample] = []
+        self._pending: List[Sample] = []
+        self._previous: Dict[int, ProcessStat] = {}
+        self._previous_time = time.monotonic()
+        self._ticks_per_second = os.sysconf('SC_CLK_TCK')
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self) -> Optional[Sample]:
+        """
+        Take a sample, rates are computed since the previous sample
+        :return: None if process tree is finished
+        """
+        now = time.monotonic()
+        tree = _process_tree(self.root_pid)
+        elapsed = max(now - self._previous_time, 1e-6)
+        # counters of processes that appeared since the previous sample are counted from zero,
+        # processes that finished are not counted for the last interval
+        cpu_ticks = read_bytes = write_bytes = 0
+        for pid, stat in tree.items():
+            previous = self._previous.get(pid, ProcessStat(0, 0, 0, 0, 0, 0))
+            cpu_ticks += stat.cpu_ticks - previous.cpu_ticks
+            read_bytes += stat.read_bytes - previous.read_bytes
+            write_bytes += stat.write_bytes - previous.write_bytes
+        self._previous, self._previous_time = tree, now
+        if not tree:
+            return None
+
+        sample = Sample(
+            timestamp=time.time(),
+            cpu_percent=100 * cpu_ticks / self._ticks_per_second / elapsed,
+            rss_mb=sum(s.rss_pages for s in tree.values()) * self._page_size / (1024 * 1024),
+            read_bytes_per_second=read_bytes / elapsed,
+            write_bytes_per_second=write_bytes / elapsed,
+            threads=sum(s.threads for s in tree.values()),
+            processes=len(tree),
+        )
+        self.samples.append(sample)
+        self._pending.append(sample)
+        return sample
+
+    def flush(self):
+        """
+        Log pending samples to MLFlow run
+        :return:
+        """
+        pending, self._pending = self._pending, []
+        if not pending or self.run_id is None:
+            return
+        from mlflow.entities import Metric
+        from mlflow.tracking import MlflowClient
+
+        metrics = [Metric(f'resource_{measure}', getattr(sample, measure), int(sample.timestamp * 1000), step)
+                   for step, sample in enumerate(pending, len(self.samples) - len(pending))
+                   for measure in MEASURES]
+        client = MlflowClient()
+        for i in range(0, len(metrics), MAX_METRICS_PER_BATCH):
+            client.log_batch(self.run_id, metrics=metrics[i:i + MAX_METRICS_PER_BATCH])
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    self.flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                # training should not fail because of monitoring
+                logger.warning(f'Resource sampling of process {self.root_pid} is failed: {e}')
+
+    def start(self):
+        self._previous = _process_tree(self.root_pid)
+        self._previous_time = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Optional[Mapping[str, Mapping[str, float]]]:
+        """
+        Stop sampling, flush samples and log summary
+        :return: summary (see `summarize`), None if no samples were taken
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if not self.samples:
+            return None
+        summary = summarize(self.samples)
+        for measure, stats in summary.items():
+            logger.info(f'{METRICS_LOG_PREFIX} {measure} ' + ' '.join(f'{k}={v:.1f}' for k, v in stats.items()))
+        try:
+            self.flush()
+            if self.run_id is not None:
+                from mlflow.entities import Metric
+                from mlflow.tracking import MlflowClient
+
+                timestamp = int(time.time() * 1000)
+                MlflowClient().log_batch(self.run_id, metrics=[
+                    Metric(f'resource_{measure}_{stat}', value, timestamp, 0)
+                    for measure, stats in summary.items() for stat, value in stats.items()
+                ])
+        except Exception as e:
+            logger.warning(f'Unable to log resource usage to MLFlow run {self.run_id}: {e}')
+        return summary
+
+
+@contextmanager
+def sample_resources(root_pid: int, run_id: Optional[str]):
+    """
+    Sample resources of process tree while the block is executed.
+    Sampling is disabled if $RESOURCE_SAMPLE_INTERVAL_SECONDS is 0 or /proc is not available
+    :param root_pid:
+    :param run_id: MLFlow run to log metrics to
+    :return:
+    """
+    if const.RESOURCE_SAMPLE_INTERVAL_SECONDS <= 0 or not os.path.isdir(PROC_DIR):
+        yield
+        return
+    sampler = ResourceSampler(root_pid, run_id)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
@@ -0,0 +1,322 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+"""
+Pre-fork HTTP server of MLFlow pyfunc model implementing SageMaker inference container protocol:
+`GET /ping` and `POST /invocations` on $SAGEMAKER_BIND_TO_PORT.
+
+The master process binds the socket and forks workers that accept connections from it. Every worker loads
+the model once and groups rows of concurrent requests into micro-batches that are predicted by one `predict` call.
+pandas and mlflow are imported only by workers
+"""
+import http.server
+import io
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._launch import THREADS_ENV_VARS
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_CSV = 'text/csv'
+CONTENT_TYPE_JSON = 'application/json'
+
+# exit code of worker that failed to load the model, the master doesn't restart it
+EXIT_MODEL_LOAD_FAILED = 3
+
+
+class UnsupportedContentType(ValueError):
+    """Request content type can't be parsed, responded with 415"""
+
+
+class _Request(NamedTuple):
+    frame: Any  # pandas.DataFrame
+    future: Future
+
+
+def parse_input(body: bytes, content_type: str):
+    """
+    Parse request body into pandas DataFrame
+    CSV with header and JSON in pandas `split` (`{"columns": [...], "data": [...]}`) or `records` orient
+    are supported, also wrapped as `{"dataframe_split": ...}`, `{"dataframe_records": ...}` or `{"instances": ...}`
+    :param body:
+    :param content_type:
+    :return:
+    """
+    import pandas as pd
+
+    content_type = (content_type or CONTENT_TYPE_JSON).split(';')[0].strip().lower()
+    if content_type == CONTENT_TYPE_CSV:
+        return pd.read_csv(io.BytesIO(body))
+    if content_type != CONTENT_TYPE_JSON:
+        raise UnsupportedContentType(f'Unsupported content type: {content_type}, expected {CONTENT_TYPE_CSV} '
+                                     f'or {CONTENT_TYPE_JSON}')
+
+    data = json.loads(body)
+    if isinstance(data, dict):
+        for key in ('dataframe_split', 'dataframe_records', 'instances', 'inputs'):
+            if key in data:
+                data = data[key]
+                break
+    if isinstance(data, dict) and 'data' in data:
+        return pd.DataFrame(data['data'], columns=data.get('columns'), index=data.get('index'))
+    return pd.DataFrame(data)
+
+
+def _slice(predictions, start: int, end: int):
+    if hasattr(predictions, 'iloc'):
+        return predictions.iloc[start:end]
+    if isinstance(predictions, dict):
+        return {k: _slice(v, start, end) for k, v in predictions.items()}
+    return predictions[start:end]
+
+
+def format_output(predictions) -> bytes:
+    """
+    Serialize predictions to JSON: DataFrame as records, Series and arrays as lists
+    :param predictions:
+    :return:
+    """
+    if hasattr(predictions, 'to_dict') and hasattr(predictions, 'columns'):
+        predictions = predictions.to_dict(orient='records')
+    elif hasattr(predictions, 'tolist'):
+        predictions = predictions.tolist()
+    elif isinstance(predictions, dict):
+        predictions = {k: v.tolist() if hasattr(v, 'tolist') else v for k, v in predictions.items()}
+    return json.dumps(predictions, default=str).encode()
+
+
+class MicroBatcher:
+    """
+    Group DataFrames of concurrent requests into batches predicted by one call
+
+    A batch is predicted when it has `max_rows` rows or `max_wait` seconds passed since its first request.
+    Requests with different columns are predicted separately. If batch prediction fails, requests of the batch
+    are predicted one by one, so invalid request doesn't fail the others
+    """
+
+    def __init__(self, predict: Callable[[Any], Any], max_rows: int = const.SERVING_MAX_BATCH_ROWS,
+                 max_wait: float = const.SERVING_MAX_BATCH_WAIT_MS / 1000):
+        self.predict = predict
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.batches = 0
+        self._queue: 'queue.Queue[Optional[_Request]]' = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, frame) -> Future:
+        future = Future()
+        self._queue.put(_Request(frame, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch, rows = [first], len(first.frame)
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+            rows += len(request.frame)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            groups: Dict[tuple, List[_Request]] = {}
+            for request in self._collect(first):
+                groups.setdefault(tuple(request.frame.columns), []).append(request)
+            for group in groups.values():
+                self._predict_batch(group)
+
+    def _predict_batch(self, batch: List[_Request]):
+        import pandas as pd
+
+        self.batches += 1
+        try:
+            frame = batch[0].frame if len(batch) == 1 else pd.concat([r.frame for r in batch], ignore_index=True)
+            predictions = self.predict(frame)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            for request in batch:
+                self._predict_batch([request])
+            return
+
+        offset = 0
+        for request in batch:
+            request.future.set_result(_slice(predictions, offset, offset + len(request.frame)))
+            offset += len(request.frame)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, Nagle's algorithm delays the body of keep-alive responses
+    disable_nagle_algorithm = True
+    batcher: MicroBatcher
+
+    def _respond(self, status: int, body: bytes = b'', content_type: str = CONTENT_TYPE_JSON):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/ping':
+            self._respond(200)
+        else:
+            self._respond(404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/invocations':
+            self._respond(404)
+            return
+        try:
+            frame = parse_input(body, self.headers.get('Content-Type'))
+        except UnsupportedContentType as e:
+            self._respond(415, json.dumps({'error': str(e)}).encode())
+            return
+        except Exception as e:
+            self._respond(400, json.dumps({'error': str(e)}).encode())
+            return
+        try:
+            predictions = self.batcher.submit(frame).result()
+        except Exception as e:
+            logger.exception('Prediction failed')
+            self._respond(500, json.dumps({'error': str(e)}).encode())
+            return
+        self._respond(200, format_output(predictions))
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def make_server(sock: socket.socket, batcher: MicroBatcher) -> http.server.HTTPServer:
+    """
+    Create HTTP server that accepts connections from already listening socket
+    :param sock:
+    :param batcher: batcher of model predictions
+    :return:
+    """
+    handler = type('Handler', (_Handler,), {'batcher': batcher})
+    server = _HTTPServer(sock.getsockname()[:2], handler, bind_and_activate=False)
+    server.socket = sock
+    return server
+
+
+def _worker(sock: socket.socket, model_path: str, threads: int, max_rows: int, max_wait: float) -> int:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    for var in THREADS_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+    try:
+        import mlflow.pyfunc
+
+        model = mlflow.pyfunc.load_model(model_path)
+    except Exception:
+        logger.exception(f'Unable to load model {model_path}')
+        return EXIT_MODEL_LOAD_FAILED
+
+    logger.info(f'Worker {os.getpid()} loaded model {model_path}')
+    make_server(sock, MicroBatcher(model.predict, max_rows, max_wait)).serve_forever()
+    return 0
+
+
+def serve(model_path: str, port: int = const.SERVING_PORT, workers: int = const.SERVING_WORKERS,
+          max_rows: int = const.SERVING_MAX_BATCH_ROWS, max_wait: float = const.SERVING_MAX_BATCH_WAIT_MS / 1000):
+    """
+    Serve MLFlow pyfunc model by pre-forked workers until SIGTERM. Workers that die are restarted
+    :param model_path: local path of MLFlow model
+    :param port:
+    :param workers: number of worker processes, number of CPUs if 0
+    :param max_rows: max rows of micro-batch
+    :param max_wait: max seconds to wait for micro-batch to fill
+    :return:
+    """
+    workers = workers or os.cpu_count() or 1
+    threads = max((os.cpu_count() or 1) // workers, 1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    sock.listen(socket.SOMAXCONN)
+    logger.info(f'Serve {model_path} on port {port} by {workers} workers, micro-batches of up to {max_rows} rows '
+                f'collected for up to {max_wait * 1000:.0f}ms')
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = _worker(sock, model_path, threads, max_rows, max_wait)
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        pid, status = os.wait()
+        children.discard(pid)
+        if stopping:
+            continue
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) == EXIT_MODEL_LOAD_FAILED:
+            stop(signal.SIGTERM, None)
+            raise RuntimeError(f'Unable to load model {model_path}')
+        logger.warning(f'Worker {pid} died with status {status}, restart it')
+        spawn()
+    sock.close()
@@ -0,0 +1,154 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import itertools
+import logging
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SWEEP_GRID = 'grid'
+SWEEP_RANDOM = 'random'
+SWEEP_MODES = (SWEEP_GRID, SWEEP_RANDOM)
+
+GOAL_MINIMIZE = 'minimize'
+GOAL_MAXIMIZE = 'maximize'
+GOALS = (GOAL_MINIMIZE, GOAL_MAXIMIZE)
+
+
+class TrialResult(NamedTuple):
+    """Result of a single trial of hyperparameters sweep"""
+    run_id: Optional[str]
+    params: Mapping[str, Any]
+    metric: Optional[float]  # None if trial is failed or didn't log the metric
+    error: Optional[str] = None
+
+
+def _is_range(value: Any) -> bool:
+    """
+    Range hyperparameter is a mapping like `{"min": 0.1, "max": 1.0, "scale": "log", "type": "float", "num": 5}`
+    """
+    return isinstance(value, Mapping) and 'min' in value and 'max' in value
+
+
+def _is_sweep_value(value: Any) -> bool:
+    return isinstance(value, list) or _is_range(value)
+
+
+def _cast(value: float, spec: Mapping[str, Any]):
+    return int(round(value)) if spec.get('type') == 'int' else value
+
+
+def _range_grid(name: str, spec: Mapping[str, Any]) -> List[Any]:
+    if 'num' not in spec:
+        raise ValueError(f'Range hyperparameter {name} must have `num` of values for grid sweep')
+    low, high, num = float(spec['min']), float(spec['max']), int(spec['num'])
+    if num < 2:
+        return [_cast(low, spec)]
+    if spec.get('scale') == 'log':
+        low, high = math.log(low), math.log(high)
+        values = [math.exp(low + (high - low) * i / (num - 1)) for i in range(num)]
+    else:
+        values = [low + (high - low) * i / (num - 1) for i in range(num)]
+    # int ranges may produce duplicates
+    return list(dict.fromkeys(_cast(v, spec) for v in values))
+
+
+def _range_sample(spec: Mapping[str, Any], rng: random.Random) -> Any:
+    low, high = float(spec['min']), float(spec['max'])
+    if spec.get('type') == 'int':
+        return rng.randint(int(low), int(high))
+    if spec.get('scale') == 'log':
+        return math.exp(rng.uniform(math.log(low), math.log(high)))
+    return rng.uniform(low, high)
+
+
+def expand_trials(hyper_params: Mapping[str, Any], mode: str, samples: int,
+                  seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Expand list-valued and range hyperparameters into sets of hyperparameters of trials
+
+    >>> expand_trials({'alpha': [0.1, 0.5], 'l1_ratio': 0.1}, 'grid', 0)
+    [{'alpha': 0.1, 'l1_ratio': 0.1}, {'alpha': 0.5, 'l1_ratio': 0.1}]
+    :param hyper_params: hyperparameters where lists are sets of choices and `{"min": ..., "max": ...}`
+    mappings are ranges (see `_is_range`), other values are the same for all trials
+    :param mode: `grid` – all combinations, `random` – `samples` random combinations
+    :param samples: number of trials of random sweep
+    :param seed: random seed
+    :return:
+    """
+    if mode not in SWEEP_MODES:
+        raise ValueError(f'Unknown sweep mode: {mode}, expected one of: {", ".join(SWEEP_MODES)}')
+
+    fixed = {k: v for k, v in hyper_params.items() if not _is_sweep_value(v)}
+    swept = {k: v for k, v in hyper_params.items() if _is_sweep_value(v)}
+    if not swept:
+        raise ValueError('No list-valued or range hyperparameters to sweep')
+
+    if mode == SWEEP_GRID:
+        choices = [v if isinstance(v, list) else _range_grid(k, v) for k, v in swept.items()]
+        return [{**fixed, **dict(zip(swept, combination))} for combination in itertools.product(*choices)]
+
+    rng = random.Random(seed)
+    return [{**fixed, **{k: rng.choice(v) if isinstance(v, list) else _range_sample(v, rng)
+                         for k, v in swept.items()}}
+            for _ in range(samples)]
+
+
+def run_trials(trials: Sequence[Mapping[str, Any]], run_trial: Callable[[Mapping[str, Any]], TrialResult],
+               parallelism: int) -> List[TrialResult]:
+    """
+    Run trials concurrently
+    :param trials: hyperparameters of trials
+    :param run_trial: function that runs a single trial, should not raise
+    :param parallelism: max number of concurrently running trials
+    :return: results in the order of trials
+    """
+    logger.info(f'Run {len(trials)} trials, {parallelism} concurrently')
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(parallelism, 1)) as pool:
+        results = list(pool.map(run_trial, trials))
+    failed = sum(1 for r in results if r.error is not None)
+    logger.info(f'{len(trials)} trials finished in {time.monotonic() - start:.2f}s, {failed} failed')
+    return results
+
+
+def validate_goal(goal: str):
+    """
+    Check sweep goal before trials are run
+    :param goal: `minimize` or `maximize` metric
+    :return:
+    """
+    if goal not in GOALS:
+        raise ValueError(f'Unknown sweep goal: {goal}, expected one of: {", ".join(GOALS)}')
+
+
+def best_trial(results: Sequence[TrialResult], goal: str) -> TrialResult:
+    """
+    Return trial with the best metric
+    :param results:
+    :param goal: `minimize` or `maximize` metric
+    :return:
+    """
+    validate_goal(goal)
+    succeeded = [r for r in results if r.error is None and r.metric is not None]
+    if not succeeded:
+        raise RuntimeError('All trials are failed or did not log the sweep metric')
+    pick = min if goal == GOAL_MINIMIZE else max
+    return pick(succeeded, key=lambda r: r.metric)
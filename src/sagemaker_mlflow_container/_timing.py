@@ -0,0 +1,118 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import functools
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, List, Mapping, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Prefix of log lines with stage timings, SageMaker metric definition example:
+# {'Name': 'download_code_seconds', 'Regex': 'stage_timing: download_code wall_seconds=([0-9.]+)'}
+METRICS_LOG_PREFIX = 'stage_timing:'
+
+
+class Span(NamedTuple):
+    """Timing of a single stage"""
+    name: str
+    start: float  # unix timestamp
+    wall_seconds: float
+    children_cpu_seconds: float  # user + system CPU time of subprocesses finished during the stage
+    children_max_rss_kb: int  # peak RSS of the largest subprocess finished so far
+
+
+def _children_usage():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss
+
+
+class StageTimer:
+    """
+    Record spans of the training stages
+
+    Child CPU time and RSS are collected by `getrusage(RUSAGE_CHILDREN)` that is process wide,
+    so they are attributed approximately for the stages that run concurrently
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        start, start_monotonic = time.time(), time.monotonic()
+        cpu_before, _ = _children_usage()
+        try:
+            yield
+        finally:
+            cpu_after, max_rss = _children_usage()
+            span = Span(name, start, time.monotonic() - start_monotonic, cpu_after - cpu_before, max_rss)
+            with self._lock:
+                self.spans.append(span)
+
+    def wrap(self, name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        Return function that records span `name` on each call of `func`
+        :param name:
+        :param func:
+        :return:
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def report(self) -> Mapping[str, Any]:
+        with self._lock:
+            return {'spans': [s._asdict() for s in self.spans]}
+
+    def write_report(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        logger.info(f'Timing report is saved to {path}')
+
+    def log_metrics(self):
+        """
+        Log spans as lines that can be parsed by SageMaker metric definitions
+        :return:
+        """
+        for span in self.report()['spans']:
+            logger.info(f'{METRICS_LOG_PREFIX} {span["name"]} wall_seconds={span["wall_seconds"]:.3f} '
+                        f'children_cpu_seconds={span["children_cpu_seconds"]:.3f} '
+                        f'children_max_rss_kb={span["children_max_rss_kb"]}')
+
+    def log_to_mlflow(self, run_id: str):
+        """
+        Log spans to MLFlow run as `timing_<stage>_<measure>` metrics
+        :param run_id:
+        :return:
+        """
+        from mlflow.entities import Metric
+        from mlflow.tracking import MlflowClient
+
+        metrics = []
+        for span in self.report()['spans']:
+            timestamp = int((span['start'] + span['wall_seconds']) * 1000)
+            for measure in ('wall_seconds', 'children_cpu_seconds', 'children_max_rss_kb'):
+                metrics.append(Metric(f'timing_{span["name"]}_{measure}', span[measure], timestamp, 0))
+        MlflowClient().log_batch(run_id, metrics=metrics)
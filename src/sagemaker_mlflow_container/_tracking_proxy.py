@@ -0,0 +1,390 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+"""
+Local proxy of remote MLFlow tracking server for training subprocesses.
+
+`log-metric`, `log-parameter`, `set-tag` and `log-batch` requests are acknowledged immediately and sent
+to the tracking server in background by `log-batch` requests that coalesce all pending entities of a run.
+Other requests are forwarded as is after pending entities are sent, so training script reads what it logged
+"""
+import http.server
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._utils import _param_to_bool
+
+if TYPE_CHECKING:
+    import urllib3
+
+logger = logging.getLogger(__name__)
+
+# MLFlow limits of one log-batch request
+MAX_BATCH_METRICS = 1000
+MAX_BATCH_PARAMS = 100
+MAX_BATCH_TAGS = 100
+MAX_BATCH_ENTITIES = 1000
+
+# endpoints which requests are acknowledged by the proxy and coalesced into log-batch requests
+BATCHED_ENDPOINTS = {
+    'runs/log-metric': 'metrics',
+    'runs/log-parameter': 'params',
+    'runs/set-tag': 'tags',
+    'runs/log-batch': None,
+}
+
+# headers that are not forwarded between connections
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'te', 'trailer', 'upgrade',
+                      'proxy-authorization', 'proxy-authenticate', 'host'}
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class ProxyStats(NamedTuple):
+    """Counters of tracking proxy"""
+    acknowledged: int  # write requests acknowledged by the proxy
+    batches: int  # log-batch requests sent to the tracking server
+    forwarded: int  # requests forwarded as is
+    dropped: int  # entities that the tracking server rejected
+
+
+class _RunBatch:
+    """Pending entities of one run"""
+
+    def __init__(self):
+        self.metrics: List[Dict[str, Any]] = []
+        # the last value of param or tag wins, like with separate requests
+        self.params: Dict[str, Dict[str, Any]] = {}
+        self.tags: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, kind: str, entity: Mapping[str, Any]):
+        if kind == 'metrics':
+            self.metrics.append(dict(entity))
+        else:
+            getattr(self, kind)[entity['key']] = dict(entity)
+
+    def __len__(self):
+        return len(self.metrics) + len(self.params) + len(self.tags)
+
+    def requests(self) -> Iterator[Dict[str, List[Dict[str, Any]]]]:
+        """
+        Split entities into log-batch request bodies that satisfy MLFlow limits
+        :return:
+        """
+        params, tags, metrics = list(self.params.values()), list(self.tags.values()), self.metrics
+        while params or tags or metrics:
+            body = {'params': params[:MAX_BATCH_PARAMS], 'tags': tags[:MAX_BATCH_TAGS]}
+            params, tags = params[MAX_BATCH_PARAMS:], tags[MAX_BATCH_TAGS:]
+            n = min(MAX_BATCH_METRICS, MAX_BATCH_ENTITIES - len(body['params']) - len(body['tags']))
+            body['metrics'], metrics = metrics[:n], metrics[n:]
+            yield body
+
+
+def _split(body: Mapping[str, List[Dict[str, Any]]]) -> Iterator[Dict[str, List[Dict[str, Any]]]]:
+    for kind in ('params', 'tags', 'metrics'):
+        for entity in body.get(kind, ()):
+            yield {kind: [entity]}
+
+
+class TrackingProxy:
+    """
+    HTTP server on loopback interface that proxies MLFlow REST API to remote tracking server
+    and batches write requests
+    """
+
+    def __init__(self, upstream_uri: str, flush_interval: float = const.TRACKING_PROXY_FLUSH_INTERVAL_SECONDS,
+                 retries: int = const.TRACKING_PROXY_RETRIES, port: int = 0):
+        """
+        :param upstream_uri: http(s) uri of tracking server
+        :param flush_interval: max seconds that acknowledged entities wait to be sent
+        :param retries: attempts to send log-batch request on connection errors and 429/5xx responses
+        :param port: port to listen on loopback interface, any free port if 0
+        """
+        import urllib3
+
+        self.upstream_uri = upstream_uri.rstrip('/')
+        self.flush_interval = flush_interval
+        insecure = _param_to_bool(os.environ.get('MLFLOW_TRACKING_INSECURE_TLS', False))
+        self._http = urllib3.PoolManager(maxsize=16, cert_reqs='CERT_NONE' if insecure else 'CERT_REQUIRED')
+        self._retry = urllib3.Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                                    allowed_methods=False, raise_on_status=False)
+        # (api prefix, run id, authorization header) -> pending entities
+        self._pending: Dict[Tuple[str, str, Optional[str]], _RunBatch] = {}
+        self._condition = threading.Condition()
+        self._sending = False
+        self._flush_requested = False
+        self._closed = False
+        self._acknowledged = self._batches = self._forwarded = self._dropped = 0
+
+        handler = type('Handler', (_Handler,), {'proxy': self})
+        self._server = _HTTPServer(('127.0.0.1', port), handler)
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, name='tracking-proxy', daemon=True),
+            threading.Thread(target=self._send_loop, name='tracking-proxy-sender', daemon=True),
+        ]
+
+    @property
+    def uri(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    @property
+    def stats(self) -> ProxyStats:
+        return ProxyStats(self._acknowledged, self._batches, self._forwarded, self._dropped)
+
+    def start(self) -> 'TrackingProxy':
+        for thread in self._threads:
+            thread.start()
+        logger.info(f'MLFlow tracking proxy {self.uri} of {self.upstream_uri} is started')
+        return self
+
+    def enqueue(self, api_prefix: str, endpoint: str, body: Mapping[str, Any], authorization: Optional[str]):
+        """
+        Add entities of write request to pending batch of its run
+        :param api_prefix: `/api/2.0/mlflow` or other prefix of the request path
+        :param endpoint: one of BATCHED_ENDPOINTS
+        :param body: request JSON
+        :param authorization: Authorization header of the request
+        :return:
+        """
+        run_id = body.get('run_id') or body['run_uuid']
+        kind = BATCHED_ENDPOINTS[endpoint]
+        if kind is None:
+            entities = [(kind, e) for kind in ('metrics', 'params', 'tags') for e in body.get(kind, ())]
+        else:
+            entities = [(kind, {k: v for k, v in body.items() if k not in ('run_id', 'run_uuid')})]
+        if any('key' not in e for _, e in entities):
+            raise KeyError('key')
+        with self._condition:
+            if not self._pending:
+                # wake up the sender to start flush interval
+                self._condition.notify_all()
+            batch = self._pending.setdefault((api_prefix, run_id, authorization), _RunBatch())
+            for kind, entity in entities:
+                batch.add(kind, entity)
+            self._acknowledged += 1
+            if len(batch) >= MAX_BATCH_ENTITIES:
+                self._condition.notify_all()
+
+    def flush(self):
+        """
+        Wait until all acknowledged entities are sent to the tracking server
+        :return:
+        """
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._pending or self._sending:
+                self._condition.wait()
+
+    def close(self):
+        """
+        Flush pending entities and stop the proxy
+        :return:
+        """
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        stats = self.stats
+        logger.info(f'MLFlow tracking proxy is stopped: {stats.acknowledged} write requests are sent by '
+                    f'{stats.batches} log-batch requests, {stats.forwarded} requests are forwarded')
+        if stats.dropped:
+            logger.error(f'{stats.dropped} MLFlow entities are rejected by tracking server {self.upstream_uri}')
+
+    def _ready(self, deadline: Optional[float]) -> bool:
+        return self._flush_requested or self._closed or (deadline is not None and time.monotonic() >= deadline) \
+            or any(len(batch) >= MAX_BATCH_ENTITIES for batch in self._pending.values())
+
+    def _send_loop(self):
+        while True:
+            with self._condition:
+                # entities wait for up to flush interval since the first of them was acknowledged
+                deadline = None
+                while not (self._pending and self._ready(deadline)):
+                    if self._closed:
+                        return
+                    self._flush_requested = False
+                    if self._pending and deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                    self._condition.wait(deadline - time.monotonic() if deadline is not None else None)
+                pending, self._pending = self._pending, {}
+                self._flush_requested = False
+                self._sending = True
+            try:
+                for (api_prefix, run_id, authorization), batch in pending.items():
+                    for body in batch.requests():
+                        self._send_batch(api_prefix, run_id, authorization, body)
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _send_batch(self, api_prefix: str, run_id: str, authorization: Optional[str],
+                    body: Mapping[str, List[Dict[str, Any]]], isolate: bool = True):
+        import urllib3
+
+        headers = {'Content-Type': 'application/json'}
+        if authorization:
+            headers['Authorization'] = authorization
+        try:
+            response = self._http.request('POST', f'{self.upstream_uri}{api_prefix}/runs/log-batch',
+                                          body=json.dumps(dict(body, run_id=run_id)).encode(), headers=headers,
+                                          retries=self._retry)
+            status, data = response.status, response.data
+        except urllib3.exceptions.HTTPError as e:
+            status, data = None, str(e).encode()
+        self._batches += 1
+        if status == 200:
+            return
+        entities = sum(len(v) for v in body.values())
+        if isolate and status is not None and 400 <= status < 500 and entities > 1:
+            # invalid entity rejects the whole batch, so entities are sent one by one to drop only invalid ones
+            for single in _split(body):
+                self._send_batch(api_prefix, run_id, authorization, single, isolate=False)
+            return
+        self._dropped += entities
+        logger.error(f'Unable to log {entities} entities to MLFlow run {run_id}: HTTP {status} '
+                     f'{data.decode(errors="replace")[:1000]}')
+
+    def forward(self, method: str, path: str, headers: Mapping[str, str], body) -> 'urllib3.HTTPResponse':
+        """
+        Send request to the tracking server after pending entities are sent
+        :param method:
+        :param path: path with query string
+        :param headers: request headers
+        :param body: file-like object or bytes
+        :return: response that is not preloaded
+        """
+        self.flush()
+        with self._condition:
+            self._forwarded += 1
+        return self._http.urlopen(method, f'{self.upstream_uri}{path}', body=body, retries=False, redirect=False,
+                                  preload_content=False, decode_content=False,
+                                  headers={k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS})
+
+
+class _LimitedReader:
+    """Request body stream that ends after Content-Length bytes"""
+
+    def __init__(self, stream, length: int):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, Nagle's algorithm delays the body of keep-alive responses
+    disable_nagle_algorithm = True
+    proxy: TrackingProxy
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length', 0))
+        path = self.path.split('?', 1)[0]
+        api_prefix, _, endpoint = path.rpartition('/runs/')
+        endpoint = f'runs/{endpoint}'
+        if self.command == 'POST' and endpoint in BATCHED_ENDPOINTS and length < 10 * 1024 * 1024:
+            body = self.rfile.read(length)
+            try:
+                self.proxy.enqueue(api_prefix, endpoint, json.loads(body), self.headers.get('Authorization'))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # malformed requests are forwarded, so the tracking server returns proper error
+                self._forward(body)
+                return
+            self._respond(200, {'Content-Type': 'application/json'}, b'{}')
+            return
+        self._forward(_LimitedReader(self.rfile, length) if length else None)
+
+    def _forward(self, body):
+        import urllib3
+
+        try:
+            response = self.proxy.forward(self.command, self.path, self.headers, body)
+        except urllib3.exceptions.HTTPError as e:
+            self._respond(502, {'Content-Type': 'text/plain'}, str(e).encode())
+            return
+        try:
+            headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+            if 'Content-Length' not in response.headers:
+                self._respond(response.status, headers, response.read())
+                return
+            self.send_response(response.status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            for chunk in response.stream(READ_CHUNK_SIZE):
+                self.wfile.write(chunk)
+        finally:
+            response.release_conn()
+
+    def _respond(self, status: int, headers: Mapping[str, str], body: bytes):
+        self.send_response(status)
+        for k, v in headers.items():
+            if k.lower() != 'content-length':
+                self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+@contextmanager
+def tracking_proxy(container_params: Mapping[str, Any]):
+    """
+    Start tracking proxy if `sagemaker_mlflow_container_tracking_proxy` parameter is set
+    and MLFlow tracking uri is http(s) uri
+    :param container_params: `sagemaker_mlflow_container_*` parameters
+    :return: proxy or None
+    """
+    if not _param_to_bool(container_params.get(const.TRACKING_PROXY_PARAM, False)):
+        yield None
+        return
+    from mlflow.tracking import get_tracking_uri
+
+    upstream_uri = get_tracking_uri()
+    if not upstream_uri.startswith(('http://', 'https://')):
+        logger.info(f'MLFlow tracking uri {upstream_uri} is not remote, tracking proxy is not started')
+        yield None
+        return
+    proxy = TrackingProxy(upstream_uri).start()
+    try:
+        yield proxy
+    finally:
+        proxy.close()
@@ -0,0 +1,203 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+"""
+Streaming batch transform of CSV and JSON Lines files by MLFlow pyfunc model.
+
+Input files are read by chunks of lines (one record per line, like SageMaker `SplitType=Line`) that are parsed,
+predicted by one `predict` call and serialized by a pool of processes which load the model once.
+Only a bounded number of chunks is in flight, so memory doesn't depend on input size,
+and predictions are written in input order as soon as they are ready
+"""
+import collections
+import io
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import time
+from os.path import join
+from typing import Any, Callable, Iterator, NamedTuple, Optional, Tuple
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._launch import THREADS_ENV_VARS
+
+logger = logging.getLogger(__name__)
+
+# Prefix of log lines with transform throughput, SageMaker metric definition example:
+# {'Name': 'rows_per_second', 'Regex': 'transform_stats: .* rows_per_second=([0-9.]+)'}
+METRICS_LOG_PREFIX = 'transform_stats:'
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+_EXTENSIONS = {'.csv': FORMAT_CSV, '.jsonl': FORMAT_JSONL, '.json': FORMAT_JSONL}
+
+OUTPUT_SUFFIX = '.out'
+
+# chunks in flight per worker: one being predicted and one queued, so workers don't wait for the reader
+CHUNKS_PER_WORKER = 2
+
+
+class TransformStats(NamedTuple):
+    """Result of transform of one or several files"""
+    files: int
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / max(self.seconds, 1e-9)
+
+
+def file_format(path: str) -> Optional[str]:
+    """
+    Detect input format by file extension
+    :param path:
+    :return: `csv`, `jsonl` or None if file is not supported
+    """
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def read_chunks(f: io.BufferedIOBase, fmt: str, chunk_rows: int) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Split input stream into chunks of lines, empty lines are skipped
+    :param f: binary stream
+    :param fmt: `csv` (the first line is a header) or `jsonl`
+    :param chunk_rows: max lines of a chunk
+    :return: iterator of (header, chunk) pairs, header is empty for `jsonl`
+    """
+    header = f.readline() if fmt == FORMAT_CSV else b''
+    lines = []
+    for line in f:
+        if not line.strip():
+            continue
+        lines.append(line if line.endswith(b'\n') else line + b'\n')
+        if len(lines) == chunk_rows:
+            yield header, b''.join(lines)
+            lines = []
+    if lines:
+        yield header, b''.join(lines)
+
+
+def parse_chunk(header: bytes, chunk: bytes, fmt: str):
+    import pandas as pd
+
+    if fmt == FORMAT_CSV:
+        return pd.read_csv(io.BytesIO(header + chunk))
+    return pd.read_json(io.BytesIO(chunk), lines=True)
+
+
+def format_chunk(predictions, fmt: str) -> bytes:
+    """
+    Serialize predictions of a chunk: CSV lines without header or JSON Lines records
+    :param predictions: DataFrame, Series, array or list
+    :param fmt:
+    :return:
+    """
+    import pandas as pd
+
+    if not isinstance(predictions, pd.DataFrame):
+        predictions = pd.DataFrame(predictions)
+    if fmt == FORMAT_CSV:
+        return predictions.to_csv(header=False, index=False).encode()
+    return predictions.to_json(orient='records', lines=True).rstrip('\n').encode() + b'\n'
+
+
+def _load_pyfunc(model_path: str):
+    import mlflow.pyfunc
+
+    return mlflow.pyfunc.load_model(model_path)
+
+
+# model of pool worker process and error of its loading
+_model: Any = None
+_model_error: Optional[str] = None
+
+
+def _init_worker(model_path: str, threads: int, load_model: Callable[[str], Any]):
+    global _model, _model_error
+    for var in THREADS_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+    try:
+        _model = load_model(model_path)
+    except Exception as e:
+        # pool restarts worker which initializer is failed endlessly, so the error is raised by tasks instead
+        logger.exception(f'Unable to load model {model_path}')
+        _model_error = f'Unable to load model {model_path}: {e!r}'
+
+
+def _predict_chunk(header: bytes, chunk: bytes, fmt: str) -> Tuple[int, bytes]:
+    if _model_error is not None:
+        raise RuntimeError(_model_error)
+    frame = parse_chunk(header, chunk, fmt)
+    return len(frame), format_chunk(_model.predict(frame), fmt)
+
+
+def _transform_file(pool: multiprocessing.pool.Pool, path: str, out_path: str, fmt: str, chunk_rows: int,
+                    max_pending: int) -> TransformStats:
+    start = time.monotonic()
+    rows = 0
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    pending = collections.deque()
+    with open(path, 'rb') as f, open(out_path, 'wb') as out:
+        for header, chunk in read_chunks(f, fmt, chunk_rows):
+            if len(pending) >= max_pending:
+                n, data = pending.popleft().get()
+                out.write(data)
+                rows += n
+            pending.append(pool.apply_async(_predict_chunk, (header, chunk, fmt)))
+        while pending:
+            n, data = pending.popleft().get()
+            out.write(data)
+            rows += n
+    return TransformStats(1, rows, time.monotonic() - start)
+
+
+def transform(model_path: str, input_dir: str, output_dir: str, chunk_rows: int = const.TRANSFORM_CHUNK_ROWS,
+              workers: int = const.TRANSFORM_WORKERS,
+              load_model: Callable[[str], Any] = _load_pyfunc) -> TransformStats:
+    """
+    Predict every CSV/JSON Lines file of input dir tree into `<relative path>.out` file of output dir
+    :param model_path: local path of MLFlow model
+    :param input_dir:
+    :param output_dir:
+    :param chunk_rows: rows predicted by one `predict` call
+    :param workers: number of worker processes, number of CPUs if 0
+    :param load_model: function that loads model by path in worker process
+    :return:
+    """
+    workers = workers or os.cpu_count() or 1
+    threads = max((os.cpu_count() or 1) // workers, 1)
+    start = time.monotonic()
+    files = rows = 0
+    with multiprocessing.Pool(workers, _init_worker, (model_path, threads, load_model)) as pool:
+        for dir_path, dir_names, file_names in os.walk(input_dir):
+            dir_names.sort()
+            for name in sorted(file_names):
+                path = join(dir_path, name)
+                fmt = file_format(path)
+                if fmt is None:
+                    logger.warning(f'Skip {path}, only {", ".join(_EXTENSIONS)} files are supported')
+                    continue
+                out_path = join(output_dir, os.path.relpath(path, input_dir) + OUTPUT_SUFFIX)
+                stats = _transform_file(pool, path, out_path, fmt, chunk_rows, workers * CHUNKS_PER_WORKER)
+                logger.info(f'{METRICS_LOG_PREFIX} file={path} rows={stats.rows} '
+                            f'seconds={stats.seconds:.2f} rows_per_second={stats.rows_per_second:.1f}')
+                files += 1
+                rows += stats.rows
+    total = TransformStats(files, rows, time.monotonic() - start)
+    logger.info(f'{METRICS_LOG_PREFIX} files={total.files} rows={total.rows} '
+                f'seconds={total.seconds:.2f} rows_per_second={total.rows_per_second:.1f}')
+    return total
@@ -13,12 +13,21 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 #
+import functools
+import glob
+import hashlib
 import json
 import logging
 import os
+import shlex
+import signal
 import subprocess
+import tarfile
+import tempfile
+import threading
+import uuid
 from os.path import join
-from typing import Any, List, Mapping, MutableMapping
+from typing import Any, List, Mapping, MutableMapping, Optional
 
 import yaml
 from sagemaker_mlflow_container import const
@@ -28,29 +37,68 @@ DEFAULT_CONDA_FILE_NAME = "conda.yaml"
 
 logger = logging.getLogger(__name__)
 
+# size of reads of hashed files
+HASH_READ_SIZE = 1024 * 1024
 
-def _conda_info(codna_env: str) -> Mapping:
+
+class ProcessTerminator:
     """
-    Return json response of `conda run -n $conda_env info` command
-    :param codna_env:
-    :return:
+    Terminates process tree of a command (e.g. `mlflow run` or conda env update) from another thread,
+    e.g. when training on other host or another pipeline stage is failed.
+    Process that is started after `terminate` call is terminated at once
     """
-    process = subprocess.run(
-        ['conda', 'run', '-n', codna_env, 'conda', 'info', '--json'],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
-    )
-    info = json.loads(process.stdout)
-    return info
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+        self._terminated = False
+
+    def _kill(self):
+        if self._process is not None and self._process.poll() is None:
+            # process is started in its own session, so the whole tree is terminated
+            os.killpg(self._process.pid, signal.SIGTERM)
+
+    def started(self, process: subprocess.Popen):
+        with self._lock:
+            self._process = process
+            if self._terminated:
+                self._kill()
 
-def _get_conda_env_bin_path(conda_env: str) -> str:
+    def terminate(self):
+        with self._lock:
+            self._terminated = True
+            self._kill()
+
+
+def check_error(cmd: List[str], error_class: type, capture_error: bool = False, env: Optional[Mapping] = None,
+                terminator: Optional[ProcessTerminator] = None, **kwargs):
     """
-    Return absolute path to codna environment bin
-    :param conda_env: Name of conda env the bin folder is looking for
-    :return:
+    Run command and raise `error_class` if it fails (see `sagemaker_containers._process.check_error`)
+
+    `sagemaker_containers._process` imports boto3 and the whole sagemaker_containers env, so it is
+    imported on the first call instead of the container startup
+    :param cmd:
+    :param error_class:
+    :param capture_error:
+    :param env: environment variables of the process, current environment by default
+    :param terminator: allows to terminate the process tree from another thread
+    :param kwargs: Popen kwargs
+    :return: process
     """
-    info = _conda_info(conda_env)
-    return os.path.join(info[const.CONDA_INFO_ENV_PATH_KEY], 'bin')
+    if env is None and terminator is None:
+        from sagemaker_containers._process import check_error as _check_error
+
+        return _check_error(cmd, error_class, capture_error=capture_error, **kwargs)
+
+    # sagemaker_containers always runs process with the current environment
+    process = subprocess.Popen(cmd, env=env, stderr=subprocess.PIPE if capture_error else None,
+                               start_new_session=terminator is not None, **kwargs)
+    if terminator is not None:
+        terminator.started(process)
+    _, stderr = process.communicate()
+    if process.returncode:
+        raise error_class(return_code=process.returncode, cmd=' '.join(cmd), output=stderr)
+    return process
 
 
 def _copy_environ_and_prepend_path(new_path: str) -> Mapping:
@@ -64,6 +112,154 @@ def _copy_environ_and_prepend_path(new_path: str) -> Mapping:
     return overridden_enc
 
 
+@functools.lru_cache(maxsize=None)
+def _package_path_dir() -> str:
+    """
+    Create dir with only this package linked into it, to be added to PYTHONPATH of processes run by interpreter
+    of another env without shadowing packages of that env by packages of the container interpreter
+    :return:
+    """
+    path_dir = tempfile.mkdtemp(prefix='sagemaker-mlflow-container-path-')
+    os.symlink(os.path.dirname(os.path.abspath(__file__)), join(path_dir, 'sagemaker_mlflow_container'))
+    return path_dir
+
+
+def _prepend_pythonpath(environ: Mapping, path: str) -> Mapping:
+    """
+    Copy environment variables and prepend `PYTHONPATH` variable with `path`
+    :param environ:
+    :param path:
+    :return:
+    """
+    environ = dict(environ)
+    environ['PYTHONPATH'] = f'{path}:{environ["PYTHONPATH"]}' if environ.get('PYTHONPATH') else path
+    return environ
+
+
+def _extract_all(tar: tarfile.TarFile, path: str):
+    """
+    Extract all archive members into `path` with `data` extraction filter where it is supported
+    (python 3.12 and security releases of older versions): members outside `path`, absolute links
+    and special files are rejected
+    :param tar:
+    :param path:
+    :return:
+    """
+    if hasattr(tarfile, 'data_filter'):
+        tar.extractall(path, filter='data')
+    else:
+        tar.extractall(path)
+
+
+def _extract_member(tar: tarfile.TarFile, member: tarfile.TarInfo, path: str):
+    """
+    Extract archive member into `path` with `data` extraction filter where it is supported (see `_extract_all`)
+    :param tar:
+    :param member:
+    :param path:
+    :return:
+    """
+    if hasattr(tarfile, 'data_filter'):
+        tar.extract(member, path, filter='data')
+    else:
+        tar.extract(member, path)
+
+
+def _file_sha256(path: str, buffer: Optional[bytearray] = None) -> str:
+    """
+    Calculate sha256 of file reading it into `buffer` without copying of data
+    :param path:
+    :param buffer: buffer reused between calls (e.g. one per hashing thread), a new one is allocated if None
+    :return: hex digest
+    """
+    if buffer is None:
+        buffer = bytearray(HASH_READ_SIZE)
+    digest = hashlib.sha256()
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _sibling_path(path: str, suffix: str) -> str:
+    """
+    Return unique not existing path next to `path`, e.g. to build a replacement of `path` on the same filesystem
+    :param path:
+    :param suffix:
+    :return:
+    """
+    return f'{path.rstrip(os.sep)}.{uuid.uuid4().hex[:8]}{suffix}'
+
+
+def _swap_dir(new_dir: str, dst: str) -> Optional[str]:
+    """
+    Move `new_dir` into place of `dst` by renames, so `dst` is never left half-written.
+    `new_dir` must be on the same filesystem as `dst` (see `_sibling_path`)
+    :param new_dir:
+    :param dst:
+    :return: path where previous `dst` is moved aside or None if it didn't exist, caller removes it
+    """
+    old_dir = None
+    if os.path.lexists(dst):
+        old_dir = _sibling_path(dst, '.old')
+        os.rename(dst, old_dir)
+    try:
+        os.rename(new_dir, dst)
+    except OSError:
+        if old_dir is not None:
+            os.rename(old_dir, dst)
+        raise
+    return old_dir
+
+
+def _conda_activate_scripts_environ(env_prefix: str, environ: Mapping) -> Mapping:
+    """
+    Source `etc/conda/activate.d/*.sh` scripts of conda env (installed by some packages, e.g. to set
+    JAVA_HOME or CUDA paths) in a shell and return resulting environment variables
+    :param env_prefix: conda env location
+    :param environ: environment variables to run scripts with
+    :return:
+    """
+    scripts = sorted(glob.glob(join(env_prefix, 'etc', 'conda', 'activate.d', '*.sh')))
+    if not scripts:
+        return environ
+
+    source = ' '.join(f'. {shlex.quote(script)};' for script in scripts)
+    process = subprocess.run(
+        ['bash', '-c', f'{source} env -0'], env=environ, stdout=subprocess.PIPE, check=True
+    )
+    pairs = (item.split('=', 1) for item in process.stdout.decode().split('\0') if '=' in item)
+    return {k: v for k, v in pairs}
+
+
+def _activated_environ(env_prefix: str, conda_env: str) -> Mapping:
+    """
+    Copy os.environ() and apply what `conda activate` does for conda env:
+    prepend `PATH` with env bin dir, set `CONDA_PREFIX` and `CONDA_DEFAULT_ENV`,
+    set env variables configured with `conda env config vars` and run activate.d scripts
+    :param env_prefix: conda env location
+    :param conda_env: name of conda env
+    :return:
+    """
+    environ = dict(_copy_environ_and_prepend_path(join(env_prefix, 'bin')))
+    environ['CONDA_PREFIX'] = env_prefix
+    environ['CONDA_DEFAULT_ENV'] = conda_env
+    # training output should be streamed to logs without buffering
+    environ['PYTHONUNBUFFERED'] = '1'
+
+    try:
+        with open(join(env_prefix, 'conda-meta', 'state')) as f:
+            environ.update(json.load(f).get('env_vars', {}))
+    except (OSError, ValueError):
+        pass
+
+    return _conda_activate_scripts_environ(env_prefix, environ)
+
+
 def _find_mlproject_file_path(ml_project_dir) -> str:
     """
     Looks for file where MLFlow project meta-information is set
@@ -90,6 +286,19 @@ def _extract_conda_file_name(mlproject_file_path: str) -> str:
         return ml_project.get("conda_env", DEFAULT_CONDA_FILE_NAME)
 
 
+def _extract_entry_points(mlproject_file_path: str) -> Mapping[str, Mapping[str, Any]]:
+    """
+    Extract entry points and their parameters from MLFlow project file
+    :param mlproject_file_path: MLFlow MLProject file path
+    :return: mapping of entry point name to its parameters spec
+    """
+    with open(mlproject_file_path) as f:
+        ml_project = yaml.safe_load(f)
+
+        return {name: (entry_point or {}).get('parameters') or {}
+                for name, entry_point in (ml_project.get('entry_points') or {}).items()}
+
+
 def _split_run_params(mp: Mapping[str, Any]) -> MutableMapping[str, Any]:
     """
     Split from mapping `sagemaker_mlflow_run_*` prefixed hyperparameters
@@ -100,12 +309,65 @@ def _split_run_params(mp: Mapping[str, Any]) -> MutableMapping[str, Any]:
     :param mp:
     :return:
     """
-    run_params = {}
+    return _split_prefixed_params(mp, const.MLFLOW_RUN_PARAMS_PREFIX)
+
+
+def _split_container_params(mp: Mapping[str, Any]) -> MutableMapping[str, Any]:
+    """
+    Split from mapping `sagemaker_mlflow_container_*` prefixed hyperparameters
+    that tune the container itself
+
+    >>> hps = {"sagemaker_mlflow_container_pack_env": True, "another_param": 3}
+    >>> _split_container_params(hps)
+    {"pack_env": True}
+    :param mp:
+    :return:
+    """
+    return _split_prefixed_params(mp, const.CONTAINER_PARAMS_PREFIX)
+
+
+def _split_prefixed_params(mp: Mapping[str, Any], prefix: str) -> MutableMapping[str, Any]:
+    params = {}
     for k, v in mp.items():
-        if k.startswith(const.MLFLOW_RUN_PARAMS_PREFIX):
-            _, param = k.split(const.MLFLOW_RUN_PARAMS_PREFIX, maxsplit=1)
-            run_params[param] = v
-    return run_params
+        if k.startswith(prefix):
+            _, param = k.split(prefix, maxsplit=1)
+            params[param] = v
+    return params
+
+
+def _param_to_bool(value: Any) -> bool:
+    """
+    Interpret hyperparameter value as a flag
+
+    >>> _param_to_bool("True"), _param_to_bool(1), _param_to_bool("no")
+    (True, True, False)
+    :param value:
+    :return:
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes', 'on')
+    return bool(value)
+
+
+def _param_to_list(value: Any) -> List[str]:
+    """
+    Interpret hyperparameter value as a list of strings: JSON list or comma separated string
+
+    >>> _param_to_list("model/, *.onnx"), _param_to_list('["model/"]'), _param_to_list(None)
+    (['model/', '*.onnx'], ['model/'], [])
+    :param value:
+    :return:
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return [item.strip() for item in value.split(',') if item.strip()]
+    if not isinstance(value, list):
+        value = [value]
+    return [str(item) for item in value]
 
 
 def _mapping_to_mlflow_run_params(mp: Mapping) -> List[str]:
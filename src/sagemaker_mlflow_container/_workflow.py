@@ -0,0 +1,144 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import json
+import logging
+from typing import Any, Dict, Mapping, Optional, Sequence, Set, Tuple
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._utils import _param_to_list
+
+logger = logging.getLogger(__name__)
+
+
+def parse_workflow(value: Any) -> Dict[str, Tuple[str, ...]]:
+    """
+    Interpret `sagemaker_mlflow_container_workflow` value
+
+    >>> parse_workflow('{"prepare": [], "train": "prepare", "evaluate": ["prepare", "train"]}')
+    {'prepare': (), 'train': ('prepare',), 'evaluate': ('prepare', 'train')}
+    :param value: JSON mapping of entry point to list (or comma separated string) of entry points it requires
+    :return: mapping of entry point to required entry points
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError(f'Workflow must be JSON mapping of entry point to required entry points: {value}')
+    if not isinstance(value, Mapping) or not value:
+        raise ValueError(f'Workflow must be non-empty mapping of entry point to required entry points: {value}')
+    return {str(step): tuple(_param_to_list(requires)) for step, requires in value.items()}
+
+
+def _ancestors(workflow: Mapping[str, Tuple[str, ...]]) -> Dict[str, Set[str]]:
+    """
+    Return all steps that every step depends on directly or transitively
+    :param workflow:
+    :return:
+    """
+    unknown = {r for requires in workflow.values() for r in requires if r not in workflow}
+    if unknown:
+        raise ValueError(f'Workflow requires unknown steps: {", ".join(sorted(unknown))}')
+
+    ancestors: Dict[str, Set[str]] = {}
+    visiting = []
+
+    def visit(step: str) -> Set[str]:
+        if step in ancestors:
+            return ancestors[step]
+        if step in visiting:
+            raise ValueError(f'Workflow steps have circular dependencies: {" -> ".join(visiting + [step])}')
+        visiting.append(step)
+        result = set(workflow[step])
+        for required in workflow[step]:
+            result |= visit(required)
+        visiting.pop()
+        ancestors[step] = result
+        return result
+
+    for step in workflow:
+        visit(step)
+    return ancestors
+
+
+def validate_workflow(workflow: Mapping[str, Tuple[str, ...]],
+                      entry_points: Optional[Mapping[str, Mapping[str, Any]]], pipe_channels: Sequence[str] = ()):
+    """
+    Check that workflow steps are entry points of MLproject without circular dependencies,
+    that `<step>_artifacts` parameters refer to steps which are finished before
+    and that every Pipe mode channel is read by one step at most (FIFO can be read only once)
+    :param workflow:
+    :param entry_points: entry point name -> parameters spec from MLproject file
+    :param pipe_channels: Pipe mode channels of training job
+    :return:
+    """
+    entry_points = entry_points or {}
+    missing = [step for step in workflow if step not in entry_points]
+    if missing:
+        raise ValueError(f'Workflow steps are not entry points of MLproject: {", ".join(missing)}')
+
+    ancestors = _ancestors(workflow)
+    for step in workflow:
+        for other in workflow:
+            if _artifacts_param(other) in entry_points[step] and other not in ancestors[step]:
+                raise ValueError(f'Entry point {step} has {_artifacts_param(other)} parameter, '
+                                 f'but it does not require {other} step')
+
+    for channel in pipe_channels:
+        readers = [step for step in workflow if channel in entry_points[step]]
+        if len(readers) > 1:
+            raise ValueError(f'Pipe mode channel {channel} can be read by one workflow step only, '
+                             f'it is a parameter of steps: {", ".join(readers)}')
+
+
+def export_step(workflow: Mapping[str, Tuple[str, ...]], export: Optional[str] = None) -> str:
+    """
+    Return step whose run artifacts are saved into model dir
+    :param workflow:
+    :param export: step set by `sagemaker_mlflow_container_workflow_export`
+    :return: `export` or the only step that is not required by other steps
+    """
+    if export:
+        if export not in workflow:
+            raise ValueError(f'Exported step {export} is not a workflow step')
+        return export
+    required = {r for requires in workflow.values() for r in requires}
+    final = [step for step in workflow if step not in required]
+    if len(final) != 1:
+        raise ValueError(f'Workflow has several final steps ({", ".join(final)}), '
+                         f'set {const.CONTAINER_PARAMS_PREFIX}{const.WORKFLOW_EXPORT_PARAM} to select exported one')
+    return final[0]
+
+
+def _artifacts_param(step: str) -> str:
+    return f'{step}{const.WORKFLOW_ARTIFACTS_PARAM_SUFFIX}'
+
+
+def step_params(parameters: Mapping[str, Any], hyper_params: Mapping[str, Any],
+                artifact_uris: Mapping[str, str]) -> Dict[str, Any]:
+    """
+    Select parameters of workflow step: hyper parameters declared by its entry point
+    and artifact URIs of finished steps for `<step>_artifacts` parameters (explicit hyper parameters are kept)
+    :param parameters: parameters spec of entry point of the step
+    :param hyper_params: hyper parameters of all steps
+    :param artifact_uris: step -> artifact URI of its run
+    :return:
+    """
+    params = {k: v for k, v in hyper_params.items() if k in parameters}
+    for step, uri in artifact_uris.items():
+        name = _artifacts_param(step)
+        if name in parameters and name not in params:
+            params[name] = uri
+    return params
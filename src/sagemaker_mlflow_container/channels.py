@@ -0,0 +1,163 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+"""
+Readers of SageMaker data channels for training scripts of MLFlow projects.
+
+Channels are passed to entry point parameters named after them: File mode channel as its dir,
+Pipe mode channel as FIFO of the first epoch (`/opt/ml/input/data/<channel>_0`). The same code reads both
+
+>>> from sagemaker_mlflow_container.channels import read_lines
+>>> for line in read_lines(args.train):
+...     ...
+
+The module is added to PYTHONPATH of training process, it depends only on standard library
+"""
+import os
+import re
+import stat
+import struct
+from typing import BinaryIO, Iterator, List
+
+from sagemaker_mlflow_container import const
+
+# Magic number of SageMaker RecordIO record header (Pipe mode channels with `RecordWrapperType: RecordIO`)
+RECORDIO_MAGIC = 0xced7230a
+
+_RECORD_HEADER = struct.Struct('<II')
+
+# continuation flags of RecordIO record parts
+_CFLAG_FULL, _CFLAG_BEGIN, _CFLAG_MIDDLE, _CFLAG_END = range(4)
+
+_EPOCH_SUFFIX = re.compile(r'_\d+$')
+
+
+def is_pipe(path: str) -> bool:
+    """
+    Whether `path` is a FIFO of Pipe mode channel
+    :param path:
+    :return:
+    """
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def epoch_path(path: str, epoch: int) -> str:
+    """
+    Return FIFO of Pipe mode channel for `epoch`. SageMaker opens FIFO of the next epoch
+    when the previous one is read to the end
+    :param path: FIFO of any epoch of the channel
+    :param epoch:
+    :return:
+    """
+    return _EPOCH_SUFFIX.sub(f'_{epoch}', path)
+
+
+def channel_files(path: str) -> List[str]:
+    """
+    Return files of channel: FIFO of Pipe mode channel or file itself, files of File mode channel dir tree
+    in sorted order (hidden files are skipped)
+    :param path:
+    :return:
+    """
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        files.extend(os.path.join(root, name) for name in sorted(names) if not name.startswith('.'))
+    return files
+
+
+def _open(path: str) -> BinaryIO:
+    return open(path, 'rb', buffering=const.CHANNEL_READ_BUFFER_BYTES)
+
+
+def read_lines(path: str) -> Iterator[bytes]:
+    """
+    Stream lines of all channel files without reading them into memory
+    :param path: channel dir, file or FIFO
+    :return: lines with line endings
+    """
+    for file_path in channel_files(path):
+        with _open(file_path) as f:
+            yield from f
+
+
+def read_chunks(path: str, size: int = 0) -> Iterator[bytes]:
+    """
+    Stream channel data by chunks, e.g. to feed a streaming parser
+    :param path: channel dir, file or FIFO
+    :param size: chunk size ($CHANNEL_READ_BUFFER_BYTES by default)
+    :return:
+    """
+    size = size or const.CHANNEL_READ_BUFFER_BYTES
+    for file_path in channel_files(path):
+        with _open(file_path) as f:
+            chunk = f.read(size)
+            while chunk:
+                yield chunk
+                chunk = f.read(size)
+
+
+def _read_exactly(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError(f'Unexpected end of RecordIO stream: {len(data)} of {size} bytes are read')
+    return data
+
+
+def _recordio_records(f: BinaryIO) -> Iterator[bytes]:
+    parts = []
+    while True:
+        header = f.read(_RECORD_HEADER.size)
+        if not header:
+            if parts:
+                raise ValueError('Unexpected end of RecordIO stream inside multipart record')
+            return
+        if len(header) != _RECORD_HEADER.size:
+            raise ValueError('Unexpected end of RecordIO stream inside record header')
+        magic, length = _RECORD_HEADER.unpack(header)
+        if magic != RECORDIO_MAGIC:
+            raise ValueError(f'Invalid RecordIO magic number {magic:#x}')
+        cflag, length = length >> 29, length & ((1 << 29) - 1)
+        data = _read_exactly(f, length)
+        padding = -length % 4
+        if padding:
+            _read_exactly(f, padding)
+
+        if cflag == _CFLAG_FULL:
+            yield data
+        elif cflag == _CFLAG_BEGIN:
+            parts = [data]
+        elif cflag == _CFLAG_MIDDLE:
+            parts.append(data)
+        else:
+            parts.append(data)
+            yield b''.join(parts)
+            parts = []
+
+
+def read_records(path: str) -> Iterator[bytes]:
+    """
+    Stream records of RecordIO-wrapped channel (`RecordWrapperType: RecordIO`), multipart records are joined
+    :param path: channel dir, file or FIFO
+    :return: record payloads
+    """
+    for file_path in channel_files(path):
+        with _open(file_path) as f:
+            yield from _recordio_records(f)
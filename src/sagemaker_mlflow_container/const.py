@@ -20,18 +20,232 @@ import os
 # conda run -n $CONDA_TRAINING_ENV mlflow run <MLProject dir>
 CONDA_TRAINING_ENV = os.environ.get('CONDA_TRAINING_ENV', 'training')
 
-# Key in JSON document returned by `codna info` command which indicates
-# the path to conda environment location
-CONDA_INFO_ENV_PATH_KEY = 'active_prefix'
+# File where result of training env probe (conda version, env location, mlflow version) is persisted
+# to be reused by the next runner processes while conda-meta of the env is not modified.
+# Probe is not persisted if value is empty
+ENV_PROBE_STAMP_FILE = os.environ.get('ENV_PROBE_STAMP_FILE', '')
+
+# How `mlflow run` is launched inside training conda env:
+# `direct` – run `<env>/bin/mlflow` with activated env variables (falls back to `conda-run` if it is not found)
+# `conda-run` – run `conda run -n $CONDA_TRAINING_ENV mlflow`
+MLFLOW_LAUNCH_MODE_DIRECT = 'direct'
+MLFLOW_LAUNCH_MODE_CONDA_RUN = 'conda-run'
+MLFLOW_LAUNCH_MODE = os.environ.get('MLFLOW_LAUNCH_MODE', MLFLOW_LAUNCH_MODE_DIRECT)
+
+# Name of file inside `conda-meta` dir of training conda env where the hash of conda spec
+# used for the last env update is saved. Repeated update with the same spec is skipped
+CONDA_ENV_STAMP_FILE = '.sagemaker_mlflow_spec'
+
+# Explicit lockfiles of training conda env (`conda list --explicit` and `pip freeze` output).
+# They are captured after `conda env update` and saved with MLFlow run artifacts into `environment` dir.
+# If lockfiles are located next to MLproject file, env is installed from them without dependencies solving
+CONDA_LOCK_FILE_NAME = 'conda.lock'
+PIP_LOCK_FILE_NAME = 'requirements.lock'
+ENV_LOCK_ARTIFACTS_DIR = 'environment'
+
+# Directory where updated training conda environments are cached by conda spec hash
+# (e.g. mounted volume that is shared between jobs). Cache is disabled if value is empty
+CONDA_ENV_CACHE_DIR = os.environ.get('CONDA_ENV_CACHE_DIR', '')
+
+# Max size of conda environments cache. Least recently used envs are evicted when it is exceeded
+CONDA_ENV_CACHE_SIZE_LIMIT_MB = int(os.environ.get('CONDA_ENV_CACHE_SIZE_LIMIT_MB', 10 * 1024))
+
+# Conda package cache dir (CONDA_PKGS_DIRS of conda processes) that is reused between jobs
+# (e.g. EBS-backed path or mounted volume). Image default `pkgs_dirs` are used if value is empty
+CONDA_PKGS_CACHE_DIR = os.environ.get('CONDA_PKGS_CACHE_DIR', '')
+
+# Max number of concurrent downloads of packages listed in explicit conda lockfile into package cache dir
+CONDA_PKGS_PREFETCH_CONCURRENCY = int(os.environ.get('CONDA_PKGS_PREFETCH_CONCURRENCY', 8))
+
+# Directory where extracted submitted code is cached by S3 object ETag or archive sha256
+# together with MLproject metadata. Cache is disabled if value is empty
+CODE_CACHE_DIR = os.environ.get('CODE_CACHE_DIR', '')
+
+# Max size of code cache. Least recently used entries are evicted when it is exceeded
+CODE_CACHE_SIZE_LIMIT_MB = int(os.environ.get('CODE_CACHE_SIZE_LIMIT_MB', 2 * 1024))
 
 
 # Prefix of SageMaker Estimator hyperparameters that relate to tuning of mlflow running
 # but not to hyperparameters of training script itself
 MLFLOW_RUN_PARAMS_PREFIX = 'sagemaker_mlflow_run_'
 
+# Prefix of SageMaker Estimator hyperparameters that tune the container itself
+# (e.g. `sagemaker_mlflow_container_pack_env`)
+CONTAINER_PARAMS_PREFIX = 'sagemaker_mlflow_container_'
+
+# Container parameter to pack updated training conda env into output data dir
+PACK_ENV_PARAM = 'pack_env'
+
+# Container parameters of hyperparameters sweep. If `sweep` is `grid` or `random`, list-valued and range
+# hyperparameters are expanded into trials that are run concurrently as nested MLFlow runs of one parent run.
+# Artifacts of the trial with the best `sweep_metric` are saved into model dir
+SWEEP_PARAM = 'sweep'
+SWEEP_METRIC_PARAM = 'sweep_metric'
+# `minimize` (default) or `maximize`
+SWEEP_GOAL_PARAM = 'sweep_goal'
+# Number of trials of random sweep (10 by default)
+SWEEP_SAMPLES_PARAM = 'sweep_samples'
+SWEEP_SEED_PARAM = 'sweep_seed'
+# Max number of concurrently running trials (number of CPUs by default)
+SWEEP_PARALLELISM_PARAM = 'sweep_parallelism'
+
+# Container parameters of workflow of MLproject entry points. `workflow` is JSON mapping of entry point to entry
+# points it requires, e.g. `{"prepare": [], "train": ["prepare"], "evaluate": ["prepare", "train"]}`. Every entry
+# point is run in a nested MLFlow run of one parent run as soon as the required ones are finished.
+# Entry point parameter `<step>_artifacts` receives artifact URI of run of required `<step>`.
+# Artifacts of `workflow_export` step (the only step that isn't required by others by default) are saved into model dir
+WORKFLOW_PARAM = 'workflow'
+WORKFLOW_EXPORT_PARAM = 'workflow_export'
+# Max number of concurrently running steps (number of CPUs by default)
+WORKFLOW_PARALLELISM_PARAM = 'workflow_parallelism'
+WORKFLOW_ARTIFACTS_PARAM_SUFFIX = '_artifacts'
+
+# Container parameters to select run artifacts exported into model dir: glob patterns (JSON list or comma
+# separated) matched against paths relative to artifact root, pattern ending with `/` selects the whole dir.
+# E.g. `model/` exports only logged model, so `model.tar.gz` stays small
+EXPORT_INCLUDE_PARAM = 'export_include'
+EXPORT_EXCLUDE_PARAM = 'export_exclude'
+# Container parameter to compress local artifacts that are not exported into model dir
+# into output data dir (`output.tar.gz`) instead of leaving them only in the artifact storage
+EXPORT_COMPRESS_EXCLUDED_PARAM = 'export_compress_excluded'
+
+# Container parameters of training subprocess launch profile (see `_launch.launch_profile`):
+# number of BLAS/OpenMP threads (OMP_NUM_THREADS, MKL_NUM_THREADS, OPENBLAS_NUM_THREADS), number of CPUs by default
+NUM_THREADS_PARAM = 'num_threads'
+# pin training process tree to CPUs of the host (sweep trials are pinned to disjoint CPU sets)
+PIN_CPUS_PARAM = 'pin_cpus'
+# RLIMIT_DATA of every training process in MB, 0 – unlimited
+MEMORY_LIMIT_MB_PARAM = 'memory_limit_mb'
+
+# Container parameter to replace exported artifacts which content is already in $ARTIFACTS_CAS_DIR
+# by references in the manifest
+DEDUP_PARAM = 'dedup'
+
+# Container parameter to point `MLFLOW_TRACKING_URI` of training subprocesses to a local proxy of remote tracking
+# server that acknowledges metrics, params and tags immediately and sends them by log-batch requests in background
+TRACKING_PROXY_PARAM = 'tracking_proxy'
+
 
 # Parameter of `mlflow run ...` that is used to specify MLFlow run-id
 MLFLOW_RUN_ID_PARAM = 'run-id'
 
+# Parameter of `mlflow run ...` that selects entry point of MLproject and its default
+MLFLOW_ENTRY_POINT_PARAM = 'entry-point'
+MLFLOW_DEFAULT_ENTRY_POINT = 'main'
+
+# SageMaker input mode of channels streamed through FIFOs `<channel dir>_<epoch>` instead of downloaded files
+PIPE_INPUT_MODE = 'Pipe'
+
 # all artifacts saved during MLFlow training run will be saved into this subdir
 SAGEMAKER_MODEL_SUBDIR = 'mlflow_run_artifacts'
+
+# SageMaker input channel where packed training conda envs (`<spec key>.tar.gz` files created by conda-pack)
+# are looked for. If matching env is found, it is extracted instead of `conda env update`
+CONDA_SNAPSHOT_CHANNEL = os.environ.get('CONDA_SNAPSHOT_CHANNEL', 'conda_snapshot')
+
+# Subdir of SageMaker output data dir where packed training conda env is saved
+CONDA_SNAPSHOT_OUTPUT_SUBDIR = 'conda_snapshot'
+
+# JSON report with timings of training stages is saved into SageMaker output data dir with this name
+TIMING_REPORT_FILE = 'timing.json'
+
+# How local MLFlow run artifacts are exported into SageMaker model dir:
+# `auto` (hardlink if artifacts and model dir are on the same filesystem, parallel copy otherwise),
+# `move`, `hardlink`, `reflink` or `copy`
+ARTIFACTS_EXPORT_MODE = os.environ.get('ARTIFACTS_EXPORT_MODE', 'auto')
+
+# Manifest (path, size, sha256) of artifacts exported into model dir is saved with this name next to them
+ARTIFACTS_MANIFEST_FILE = 'mlflow_run_artifacts.manifest.json'
+
+# Content-addressed store of artifact files shared between jobs (e.g. EFS or FSx mount).
+# With `sagemaker_mlflow_container_dedup` exported files found there are replaced by references
+ARTIFACTS_CAS_DIR = os.environ.get('ARTIFACTS_CAS_DIR', '')
+
+# Smaller files are not deduplicated
+ARTIFACTS_DEDUP_MIN_SIZE_MB = float(os.environ.get('ARTIFACTS_DEDUP_MIN_SIZE_MB', 1))
+
+# gzip level of artifacts that are compressed into output data dir
+ARTIFACTS_COMPRESS_LEVEL = int(os.environ.get('ARTIFACTS_COMPRESS_LEVEL', 6))
+
+# Max number of concurrent requests (and pooled connections) to download run artifacts
+# from remote (s3, http) artifact storage
+ARTIFACTS_DOWNLOAD_CONCURRENCY = int(os.environ.get('ARTIFACTS_DOWNLOAD_CONCURRENCY', 16))
+
+# Remote artifacts larger than this size are downloaded by several concurrent range requests
+ARTIFACTS_DOWNLOAD_PART_SIZE_MB = int(os.environ.get('ARTIFACTS_DOWNLOAD_PART_SIZE_MB', 64))
+
+# Number of attempts to download every part of remote artifact
+ARTIFACTS_DOWNLOAD_RETRIES = int(os.environ.get('ARTIFACTS_DOWNLOAD_RETRIES', 5))
+
+# Port that the leader host of multi-host training listens on to broadcast MLFlow run id
+# and packed training conda env to worker hosts
+RENDEZVOUS_PORT = int(os.environ.get('RENDEZVOUS_PORT', 7077))
+
+# Seconds to wait for all hosts of multi-host training to connect to the leader
+RENDEZVOUS_TIMEOUT_SECONDS = float(os.environ.get('RENDEZVOUS_TIMEOUT_SECONDS', 900))
+
+# Local dir that SageMaker syncs with `checkpoint_s3_uri` of the training job. Artifacts of MLFlow run stored
+# in local artifact storage are mirrored into it while training is running, so the run is resumed
+# with restored artifacts after spot interruption. Sync is disabled if the dir doesn't exist
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR', '/opt/ml/checkpoints')
+
+# Seconds between passes of checkpoint sync
+CHECKPOINT_SYNC_INTERVAL_SECONDS = float(os.environ.get('CHECKPOINT_SYNC_INTERVAL_SECONDS', 30))
+
+# Max throughput of checkpoint sync copies (0 – unlimited)
+CHECKPOINT_SYNC_MAX_MB_PER_SECOND = int(os.environ.get('CHECKPOINT_SYNC_MAX_MB_PER_SECOND', 50))
+
+# Restore artifacts checkpointed by another MLFlow run into the new run (e.g. the checkpointed run was lost
+# with ephemeral tracking storage). By default checkpoint of another run is cleared and the new run starts from scratch
+CHECKPOINT_CARRY_OVER = os.environ.get('CHECKPOINT_CARRY_OVER', 'false').lower() == 'true'
+
+# Default memory limit of every training process as a fraction of host memory on hosts without GPUs
+# (0 – unlimited, opt-in). Overridden by `sagemaker_mlflow_container_memory_limit_mb` parameter
+LAUNCH_MEMORY_FRACTION = float(os.environ.get('LAUNCH_MEMORY_FRACTION', 0))
+
+# Seconds between samples of CPU, memory, I/O and threads of training process tree that are logged to MLFlow run
+# as `resource_*` metrics (0 – sampling is disabled)
+RESOURCE_SAMPLE_INTERVAL_SECONDS = float(os.environ.get('RESOURCE_SAMPLE_INTERVAL_SECONDS', 10))
+
+# Seconds between MLFlow requests that log collected resource samples by a batch
+RESOURCE_FLUSH_INTERVAL_SECONDS = float(os.environ.get('RESOURCE_FLUSH_INTERVAL_SECONDS', 60))
+
+# Port of inference server (`serve` entry point), SageMaker passes it in SAGEMAKER_BIND_TO_PORT
+SERVING_PORT = int(os.environ.get('SAGEMAKER_BIND_TO_PORT', 8080))
+
+# Number of pre-forked inference server worker processes, each loads the model (0 – number of CPUs)
+SERVING_WORKERS = int(os.environ.get('SERVING_WORKERS', 0))
+
+# Rows of concurrent requests are predicted by one `predict` call of up to this many rows
+SERVING_MAX_BATCH_ROWS = int(os.environ.get('SERVING_MAX_BATCH_ROWS', 256))
+
+# Max milliseconds that the first request of micro-batch waits for other requests (0 – no batching wait)
+SERVING_MAX_BATCH_WAIT_MS = float(os.environ.get('SERVING_MAX_BATCH_WAIT_MS', 5))
+
+# Path of served MLFlow model relative to exported run artifacts dir
+SERVING_MODEL_SUBPATH = os.environ.get('SERVING_MODEL_SUBPATH', 'model')
+
+# Serve the model inside $CONDA_TRAINING_ENV conda env updated from conda env of the model
+# (or from lockfiles of the run). `false` – serve by the container interpreter
+SERVING_IN_TRAINING_ENV = os.environ.get('SERVING_IN_TRAINING_ENV', 'true').lower() == 'true'
+
+# Dirs of batch transform (`transform` entry point): every CSV/JSON Lines file of input dir tree is predicted
+# into `<relative path>.out` file of output dir. Defaults are SageMaker Processing job dirs
+TRANSFORM_INPUT_DIR = os.environ.get('TRANSFORM_INPUT_DIR', '/opt/ml/processing/input')
+TRANSFORM_OUTPUT_DIR = os.environ.get('TRANSFORM_OUTPUT_DIR', '/opt/ml/processing/output')
+
+# Input files are predicted by chunks of this many rows (one `predict` call per chunk)
+TRANSFORM_CHUNK_ROWS = int(os.environ.get('TRANSFORM_CHUNK_ROWS', 10000))
+
+# Number of batch transform worker processes, each loads the model (0 – number of CPUs)
+TRANSFORM_WORKERS = int(os.environ.get('TRANSFORM_WORKERS', 0))
+
+# Max seconds that metrics, params and tags acknowledged by local tracking proxy
+# (`sagemaker_mlflow_container_tracking_proxy`) wait to be sent to tracking server by one log-batch request
+TRACKING_PROXY_FLUSH_INTERVAL_SECONDS = float(os.environ.get('TRACKING_PROXY_FLUSH_INTERVAL_SECONDS', 2))
+
+# Number of retries of log-batch requests of tracking proxy on connection errors and 429/5xx responses
+TRACKING_PROXY_RETRIES = int(os.environ.get('TRACKING_PROXY_RETRIES', 5))
+
+# Buffer size of channel readers (`sagemaker_mlflow_container.channels`) used by training scripts
+CHANNEL_READ_BUFFER_BYTES = int(os.environ.get('CHANNEL_READ_BUFFER_BYTES', 1024 * 1024))
@@ -0,0 +1,150 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import logging
+import os
+import sys
+import tarfile
+from os.path import join
+from typing import Optional
+
+import yaml
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._manifest import read_manifest, restore_refs
+from sagemaker_mlflow_container._server import serve
+from sagemaker_mlflow_container._utils import _extract_all, _package_path_dir
+
+logger = logging.getLogger(__name__)
+
+SAGEMAKER_MODEL_DIR = '/opt/ml/model'
+
+# archive of model dir created by training job, SageMaker extracts it for endpoints but not for Processing jobs
+MODEL_ARCHIVE = 'model.tar.gz'
+
+# set in environment of process that is re-executed inside training conda env
+IN_ENV_MARKER = 'SAGEMAKER_MLFLOW_CONTAINER_SERVING_ENV'
+
+
+def _extract_model_archive(model_dir: str):
+    archive = join(model_dir, MODEL_ARCHIVE)
+    if os.path.isfile(archive) and not os.path.isdir(join(model_dir, const.SAGEMAKER_MODEL_SUBDIR)):
+        logger.info(f'Extract {archive}')
+        with tarfile.open(archive) as tar:
+            _extract_all(tar, model_dir)
+
+
+def _restore_deduplicated(model_dir: str):
+    """
+    Restore exported artifacts that were replaced by references to content-addressed store
+    (see `sagemaker_mlflow_container_dedup`)
+    :param model_dir:
+    :return:
+    """
+    manifest_path = join(model_dir, const.ARTIFACTS_MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return
+    entries = read_manifest(manifest_path)
+    artifacts_dir = join(model_dir, const.SAGEMAKER_MODEL_SUBDIR)
+    refs = [e for e in entries if e.ref is not None and not os.path.isfile(join(artifacts_dir, e.path))]
+    if not refs:
+        return
+    if not const.ARTIFACTS_CAS_DIR:
+        raise ValueError(f'{len(refs)} model artifacts are deduplicated, but ARTIFACTS_CAS_DIR is not set')
+    logger.info(f'Restore {len(refs)} deduplicated model artifacts from {const.ARTIFACTS_CAS_DIR}')
+    restore_refs(artifacts_dir, refs, const.ARTIFACTS_CAS_DIR)
+
+
+def _model_conda_file(model_path: str) -> Optional[str]:
+    """
+    Return conda env file of pyfunc flavor of MLFlow model
+    :param model_path:
+    :return: None if model has no conda env
+    """
+    with open(join(model_path, 'MLmodel')) as f:
+        env = yaml.safe_load(f).get('flavors', {}).get('python_function', {}).get('env')
+    if isinstance(env, dict):
+        env = env.get('conda')
+    return join(model_path, env) if env and os.path.isfile(join(model_path, env)) else None
+
+
+def _prepare_model_env(artifacts_dir: str, model_path: str) -> str:
+    """
+    Update training conda env with dependencies of the model, lockfiles captured during training are preferred
+    :param artifacts_dir: exported run artifacts dir
+    :param model_path:
+    :return: python executable of the env
+    """
+    from sagemaker_mlflow_container._checkers import _probe_env
+    from sagemaker_mlflow_container._code import ProjectFiles
+    from sagemaker_mlflow_container.training import _update_codna_env
+
+    lock_dir = join(artifacts_dir, const.ENV_LOCK_ARTIFACTS_DIR)
+    conda_lock_file = join(lock_dir, const.CONDA_LOCK_FILE_NAME)
+    pip_lock_file = join(lock_dir, const.PIP_LOCK_FILE_NAME)
+    conda_file = _model_conda_file(model_path)
+    if os.path.isfile(conda_lock_file):
+        _update_codna_env(ProjectFiles(conda_file or conda_lock_file, conda_lock_file,
+                                       pip_lock_file if os.path.isfile(pip_lock_file) else None))
+    elif conda_file is not None:
+        _update_codna_env(ProjectFiles(conda_file))
+    else:
+        logger.warning(f'Model {model_path} has no conda env, serve it by {const.CONDA_TRAINING_ENV} env as is')
+    return join(_probe_env(const.CONDA_TRAINING_ENV).bin_path, 'python')
+
+
+def _exec_in_env(python: str, module: str):
+    """
+    Replace current process by module of this package started by python of another env.
+    Only this package is added to its path, so packages of the container interpreter don't shadow packages of the env
+    :param python:
+    :param module:
+    :return:
+    """
+    environ = dict(os.environ)
+    environ['PYTHONPATH'] = _package_path_dir()
+    environ['PYTHONUNBUFFERED'] = '1'
+    environ[IN_ENV_MARKER] = '1'
+    logger.info(f'Start {module} by {python}')
+    os.execve(python, [python, '-m', module], environ)
+
+
+def _setup_model(module: str) -> str:
+    """
+    Locate MLFlow model in SageMaker model dir (`model.tar.gz` is extracted) and restore its deduplicated artifacts.
+    Unless $SERVING_IN_TRAINING_ENV is `false`, current process is replaced by `module` started
+    in training conda env updated with dependencies of the model, the function returns in that process
+    :param module: module of this package that uses the model
+    :return: model path
+    """
+    model_dir = os.environ.get('SM_MODEL_DIR', SAGEMAKER_MODEL_DIR)
+    artifacts_dir = join(model_dir, const.SAGEMAKER_MODEL_SUBDIR)
+    model_path = join(artifacts_dir, const.SERVING_MODEL_SUBPATH)
+
+    if not os.environ.get(IN_ENV_MARKER):
+        _extract_model_archive(model_dir)
+        _restore_deduplicated(model_dir)
+        if const.SERVING_IN_TRAINING_ENV:
+            _exec_in_env(_prepare_model_env(artifacts_dir, model_path), module)
+    return model_path
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    serve(_setup_model('sagemaker_mlflow_container.serving'))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,54 +13,198 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 #
+import functools
 import logging
+import os
+import queue
 import subprocess
+import tempfile
 from os.path import join
-from typing import Mapping, MutableMapping
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, MutableMapping, NamedTuple, Optional, Tuple
 
-
-import mlflow
-from sagemaker_containers import _env, _files, training_env
-from sagemaker_containers._env import TrainingEnv
 from sagemaker_containers._errors import _CalledProcessError
-from sagemaker_containers._process import check_error
 
 from sagemaker_mlflow_container import const
-from sagemaker_mlflow_container._checkers import _check_env
+from sagemaker_mlflow_container._checkpoint import checkpoint_sync, resumed_run_id
+from sagemaker_mlflow_container._checkers import EnvProbe, _check_env, _probe_env, _reprobe_env
+from sagemaker_mlflow_container._code import CodeExtractor, ProjectFiles
+from sagemaker_mlflow_container._conda import _capture_lock_files, _conda_spec_hash, _env_cache_key, \
+    _env_snapshot_key, _install_from_lock_files, _is_env_up_to_date, _lock_spec_hash, _restore_env_from_cache, \
+    _save_env_to_cache, _write_stamp
+from sagemaker_mlflow_container._conda_pack import find_snapshot, pack_env, restore_env
+from sagemaker_mlflow_container._conda_pkgs import conda_environ
+from sagemaker_mlflow_container._export import ArtifactFilter
+from sagemaker_mlflow_container._launch import LaunchProfile, launch_profile
 from sagemaker_mlflow_container._mlflow import _copy_mlflow_results_to_dir
-from sagemaker_mlflow_container._utils import _copy_environ_and_prepend_path, _get_conda_env_bin_path, \
-    _mapping_to_mlflow_run_params, \
-    _extract_conda_file_name, \
-    _find_mlproject_file_path, _mapping_to_mlflow_hyper_params, _split_run_params
+from sagemaker_mlflow_container._pipeline import Stage, run_stages
+from sagemaker_mlflow_container._rendezvous import LeaderRendezvous, WorkerRendezvous, leader_host
+from sagemaker_mlflow_container._resources import sample_resources
+from sagemaker_mlflow_container._sweep import GOAL_MINIMIZE, TrialResult, best_trial, expand_trials, run_trials, \
+    validate_goal
+from sagemaker_mlflow_container._timing import StageTimer
+from sagemaker_mlflow_container._tracking_proxy import TrackingProxy, tracking_proxy
+from sagemaker_mlflow_container._utils import ProcessTerminator, _activated_environ, \
+    _copy_environ_and_prepend_path, _mapping_to_mlflow_run_params, _mapping_to_mlflow_hyper_params, \
+    _package_path_dir, _param_to_bool, _param_to_list, _prepend_pythonpath, _split_container_params, \
+    _split_run_params, check_error
+from sagemaker_mlflow_container._workflow import export_step, parse_workflow, step_params, validate_workflow
+
+if TYPE_CHECKING:
+    from sagemaker_containers._env import TrainingEnv
+
+# mlflow and sagemaker_containers env (that imports boto3) are imported by functions that use them
+# to keep startup of the runner process fast, see tests/unit/test_import_time.py
 
 logger = logging.getLogger(__name__)
 
 
-def _update_codna_env(ml_project_dir: str):
-    ml_project_file = _find_mlproject_file_path(ml_project_dir)
-    conda_fp = _extract_conda_file_name(ml_project_file)
-    abs_conda_fp = join(ml_project_dir, conda_fp)
-    logger.info(f'Found MLproject conda file with dependencies: {abs_conda_fp}')
-    logger.info(f'Start to update {const.CONDA_TRAINING_ENV} conda env using {conda_fp} file')
+class EnvUpdate(NamedTuple):
+    """Result of training conda env update"""
+    snapshot_key: str
+    snapshot: Optional[str]  # packed env that was restored or created during update
+    lock_dir: Optional[str]  # lockfiles captured after `conda env update`
 
-    check_error([
-        'conda', 'env', 'update', '-n', const.CONDA_TRAINING_ENV, '-f', abs_conda_fp
-    ], _CalledProcessError, capture_error=True)
 
+def _project_spec(project_files: ProjectFiles) -> Tuple[str, str]:
+    """
+    Return MLproject file that defines training conda env and its hash
+    :param project_files:
+    :return: file path and hash
+    """
+    if project_files.conda_lock_file:
+        return project_files.conda_lock_file, _lock_spec_hash(project_files.conda_lock_file,
+                                                              project_files.pip_lock_file)
+    return project_files.conda_file, _conda_spec_hash(project_files.conda_file)
 
-def _run_training(ml_project_dir: str, hyper_params: Mapping, run_parameters: MutableMapping) -> str:
+
+def _update_codna_env(project_files: ProjectFiles, snapshot_input_dir: Optional[str] = None,
+                      snapshot_output_dir: Optional[str] = None,
+                      terminator: Optional[ProcessTerminator] = None) -> EnvUpdate:
     """
-    Run MLFlow training in separate `training` environment
+    Update training conda env using MLproject conda file
+    or install it from explicit lockfiles if they are located next to MLproject file
+    :param project_files: MLproject files with env dependencies
+    :param snapshot_input_dir: dir where packed conda envs are looked for instead of update
+    :param snapshot_output_dir: dir to pack updated conda env into
+    :param terminator: allows to terminate running conda commands from another thread
+    :return:
+    """
+    env_prefix = _probe_env(const.CONDA_TRAINING_ENV).env_prefix
+    spec_fp, spec_hash = _project_spec(project_files)
+    logger.info(f'Found MLproject file with dependencies: {spec_fp}')
+    snapshot_key = _env_snapshot_key(spec_hash, env_prefix)
+
+    if _is_env_up_to_date(spec_hash, env_prefix):
+        logger.info(f'{const.CONDA_TRAINING_ENV} conda env is already updated using {spec_fp} file, skip update')
+        return EnvUpdate(snapshot_key, None, None)
+
+    snapshot = find_snapshot(snapshot_input_dir, snapshot_key)
+    if snapshot is not None:
+        logger.info(f'Found packed {const.CONDA_TRAINING_ENV} conda env {snapshot}, restore it instead of update')
+        restore_env(snapshot, env_prefix)
+        _reprobe_env(const.CONDA_TRAINING_ENV)
+        _write_stamp(spec_hash, env_prefix)
+        return EnvUpdate(snapshot_key, snapshot, None)
+
+    lock_dir = None
+    cache_key = _env_cache_key(spec_hash, env_prefix)
+    if not _restore_env_from_cache(cache_key, env_prefix):
+        if project_files.conda_lock_file:
+            _install_from_lock_files(const.CONDA_TRAINING_ENV, env_prefix,
+                                     project_files.conda_lock_file, project_files.pip_lock_file, terminator)
+        else:
+            logger.info(f'Start to update {const.CONDA_TRAINING_ENV} conda env using {spec_fp} file')
+            check_error([
+                'conda', 'env', 'update', '-n', const.CONDA_TRAINING_ENV, '-f', spec_fp
+            ], _CalledProcessError, capture_error=True, env=conda_environ(), terminator=terminator)
+            lock_dir = _capture_lock_files(env_prefix, terminator)
+        _save_env_to_cache(cache_key, env_prefix)
+    # mlflow could be updated together with env
+    _reprobe_env(const.CONDA_TRAINING_ENV)
+
+    _write_stamp(spec_hash, env_prefix)
+
+    if snapshot_output_dir:
+        snapshot = pack_env(env_prefix, snapshot_output_dir, snapshot_key)
+
+    return EnvUpdate(snapshot_key, snapshot, lock_dir)
+
+
+def _pack_env_for_workers(env_update: EnvUpdate, leader: LeaderRendezvous) -> Optional[str]:
+    """
+    Return packed training conda env to send to worker hosts which env is not up to date.
+    Env that was already packed or restored during update is reused
+    :param env_update:
+    :param leader:
+    :return: path to packed env or None if workers don't need it
+    """
+    if not leader.workers_need_env:
+        return None
+    if env_update.snapshot is not None:
+        return env_update.snapshot
+    env_prefix = _probe_env(const.CONDA_TRAINING_ENV).env_prefix
+    return pack_env(env_prefix, tempfile.mkdtemp(prefix='conda-snapshot-'), env_update.snapshot_key)
+
+
+def _receive_env_from_leader(worker: WorkerRendezvous, project_files: ProjectFiles) -> str:
+    """
+    Connect to the leader host, wait for MLFlow run and restore training conda env packed by the leader
+    if env of current host is not up to date
+    :param worker:
+    :param project_files:
+    :return: MLFlow run id
+    """
+    env_prefix = _probe_env(const.CONDA_TRAINING_ENV).env_prefix
+    _, spec_hash = _project_spec(project_files)
+    worker.connect(_is_env_up_to_date(spec_hash, env_prefix))
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        run = worker.receive_run(snapshot_dir)
+        if run.snapshot is not None:
+            restore_env(run.snapshot, env_prefix)
+            _reprobe_env(const.CONDA_TRAINING_ENV)
+            _write_stamp(spec_hash, env_prefix)
+    return run.run_id
+
+
+def _import_mlflow():
+    """
+    Import mlflow in the background while training env is set up, it takes seconds
+    :return:
+    """
+    import mlflow  # noqa: F401
+
+
+def _mlflow_launch_cmd(probe: EnvProbe) -> Tuple[List[str], Mapping]:
+    """
+    Return command prefix and environment variables to launch mlflow cli inside training conda env
+    :param probe: training env probe
+    :return:
+    """
+    mlflow_bin = join(probe.bin_path, 'mlflow')
+    if const.MLFLOW_LAUNCH_MODE == const.MLFLOW_LAUNCH_MODE_DIRECT:
+        if os.access(mlflow_bin, os.X_OK):
+            return [mlflow_bin], _activated_environ(probe.env_prefix, const.CONDA_TRAINING_ENV)
+        logger.warning(f'{mlflow_bin} is not found, fall back to `conda run`')
+
+    # Because conda run -n $codna_name ... – not overrides PATH search priority correctly
+    # we override it manually to ensure that appropriate python executable will be selected
+    # to run the training
+    return ['conda', 'run', '-n', const.CONDA_TRAINING_ENV, 'mlflow'], _copy_environ_and_prepend_path(probe.bin_path)
+
+
+def _mlflow_run_cmd(ml_project_dir: str, hyper_params: Mapping, run_parameters: Mapping,
+                    run_id: str) -> Tuple[List[str], Mapping]:
+    """
+    Return `mlflow run ...` command and its environment variables
     :param ml_project_dir: Path to MLFlow project directory where MLFlow code is located
     :param hyper_params: model hyper parameters that will be passed as MLFLow parameters to training script
     :param run_parameters: run parameters that will be passed to `mlflow run ...` as arguments
-    :return: MLFlow run_id
+    :param run_id: MLFlow run id
+    :return:
     """
-
-    cmd = [
-        'conda', 'run', '-n', const.CONDA_TRAINING_ENV,
-        'mlflow', 'run'
-    ]
+    cmd, new_env = _mlflow_launch_cmd(_probe_env(const.CONDA_TRAINING_ENV))
+    cmd = cmd + ['run']
 
     if run_parameters:
         cmd += _mapping_to_mlflow_run_params(run_parameters)
@@ -68,51 +212,540 @@ def _run_training(ml_project_dir: str, hyper_params: Mapping, run_parameters: Mu
     if hyper_params:
         cmd += _mapping_to_mlflow_hyper_params(hyper_params)
 
-    # Because conda run -n $codna_name ... – not overrides PATH search priority correctly
-    # we override it manually to ensure that appropriate python executable will be selected
-    # to run the training
-    bin_path = _get_conda_env_bin_path(const.CONDA_TRAINING_ENV)
-    new_env = _copy_environ_and_prepend_path(bin_path)
+    cmd += ['--run-id', run_id, ml_project_dir]
+    # training scripts can read SageMaker channels with `sagemaker_mlflow_container.channels`
+    return cmd, _prepend_pythonpath(new_env, _package_path_dir())
+
+
+def _channel_hyper_params(train_env: 'TrainingEnv', project_files: ProjectFiles, hyper_params: Mapping,
+                          run_parameters: Mapping) -> Mapping:
+    """
+    Add SageMaker data channels to hyper parameters for entry point parameters named after them:
+    File mode channel is passed as its dir, Pipe mode channel as FIFO of the first epoch
+    (`sagemaker_mlflow_container.channels` readers accept both).
+    Hyper parameters set explicitly are kept, channels aren't passed to entry points that don't declare them
+    :param train_env:
+    :param project_files:
+    :param hyper_params: model hyper parameters
+    :param run_parameters: run parameters of `mlflow run ...`
+    :return: hyper parameters with channel parameters
+    """
+    entry_point = run_parameters.get(const.MLFLOW_ENTRY_POINT_PARAM, const.MLFLOW_DEFAULT_ENTRY_POINT)
+    declared = (project_files.entry_points or {}).get(entry_point, {})
+    channel_params = {}
+    for channel, channel_dir in train_env.channel_input_dirs.items():
+        if channel == const.CONDA_SNAPSHOT_CHANNEL or channel not in declared or channel in hyper_params:
+            continue
+        mode = train_env.input_data_config.get(channel, {}).get('TrainingInputMode')
+        channel_params[channel] = f'{channel_dir}_0' if mode == const.PIPE_INPUT_MODE else channel_dir
+        logger.info(f'Pass {mode or "File"} mode channel {channel} to entry point {entry_point} '
+                    f'as {channel_params[channel]}')
+    return dict(hyper_params, **channel_params) if channel_params else hyper_params
+
+
+def _pipe_channels(train_env: 'TrainingEnv') -> List[str]:
+    """
+    Return Pipe mode channels of training job (conda snapshot channel is not passed to entry points)
+    :param train_env:
+    :return:
+    """
+    return sorted(channel for channel in train_env.channel_input_dirs
+                  if channel != const.CONDA_SNAPSHOT_CHANNEL
+                  and train_env.input_data_config.get(channel, {}).get('TrainingInputMode') == const.PIPE_INPUT_MODE)
+
+
+def _run_mlflow_cmd(cmd: List[str], env: Mapping, profile: Optional[LaunchProfile] = None,
+                    sample_run_id: Optional[str] = None, proxy: Optional[TrackingProxy] = None,
+                    terminator: Optional[ProcessTerminator] = None):
+    """
+    Run `mlflow run ...` command with resources of launch profile
+    :param cmd:
+    :param env:
+    :param profile: thread counts, CPU affinity and memory limit of training process tree
+    :param sample_run_id: MLFlow run to log resource usage of training process tree to
+    :param proxy: local tracking proxy that training process tree logs to
+    :param terminator: allows to terminate training process tree from another thread
+    :return:
+    """
+    if profile is not None:
+        env = profile.environ(env)
+    if proxy is not None:
+        env = dict(env, MLFLOW_TRACKING_URI=proxy.uri)
+    with subprocess.Popen(cmd, env=env, stderr=subprocess.STDOUT, start_new_session=terminator is not None) \
+            as process:
+        if profile is not None:
+            try:
+                profile.apply(process.pid)
+            except BaseException:
+                process.kill()
+                raise
+        if terminator is not None:
+            terminator.started(process)
+        with sample_resources(process.pid, sample_run_id):
+            return_code = process.wait()
+    if proxy is not None:
+        # what training logged is read from tracking server after that (sweep metrics, results saving)
+        proxy.flush()
+    if return_code:
+        raise subprocess.CalledProcessError(return_code, cmd)
+
+
+def _profiles_queue(profile: Optional[LaunchProfile], parallelism: int) -> queue.Queue:
+    """
+    Return queue of launch profiles of concurrent trainings: every running training takes a share
+    of host resources and puts it back when it is finished
+    :param profile: launch profile of the host
+    :param parallelism: max number of concurrent trainings
+    :return:
+    """
+    profiles = queue.Queue()
+    for share in (profile.split(parallelism) if profile is not None else [None] * parallelism):
+        profiles.put(share)
+    return profiles
+
+
+def _run_training(ml_project_dir: str, hyper_params: Mapping, run_parameters: MutableMapping,
+                  env_lock_dir: Optional[str] = None, on_run_started: Optional[Callable[[str], None]] = None,
+                  profile: Optional[LaunchProfile] = None, proxy: Optional[TrackingProxy] = None,
+                  terminator: Optional[ProcessTerminator] = None) -> str:
+    """
+    Run MLFlow training in separate `training` environment
+    :param ml_project_dir: Path to MLFlow project directory where MLFlow code is located
+    :param hyper_params: model hyper parameters that will be passed as MLFLow parameters to training script
+    :param run_parameters: run parameters that will be passed to `mlflow run ...` as arguments
+    :param env_lock_dir: dir with lockfiles of training env to save with run artifacts
+    :param on_run_started: called with run id when MLFlow run is created before training is started
+    :param profile: launch profile of training process, its settings are saved as run tags
+    :param proxy: local tracking proxy for training process
+    :param terminator: allows to terminate training process from another thread
+    :return: MLFlow run_id
+    """
+    import mlflow
 
     run_id = run_parameters.pop(const.MLFLOW_RUN_ID_PARAM, None)
     with mlflow.start_run(run_id) as run:
-        cmd += ['--run-id', run.info.run_id, ml_project_dir]
-        subprocess.run(cmd, check=True, env=new_env, stderr=subprocess.STDOUT)
+        if env_lock_dir:
+            mlflow.log_artifacts(env_lock_dir, const.ENV_LOCK_ARTIFACTS_DIR)
+        if profile is not None:
+            mlflow.set_tags(profile.tags())
+        if on_run_started is not None:
+            on_run_started(run.info.run_id)
+        cmd, new_env = _mlflow_run_cmd(ml_project_dir, hyper_params, run_parameters, run.info.run_id)
+        with checkpoint_sync(run.info.run_id, run.info.artifact_uri):
+            _run_mlflow_cmd(cmd, new_env, profile, run.info.run_id, proxy, terminator)
 
     return run.info.run_id
 
 
-def _save_results(run_id: str, output_dir: str):
-    _copy_mlflow_results_to_dir(run_id, output_dir)
+def _resume_checkpointed_run(run_parameters: MutableMapping):
+    """
+    Resume MLFlow run that was checkpointed before the job was interrupted (e.g. spot instance was reclaimed)
+    if run id is not specified explicitly and the run still exists in tracking storage
+    :param run_parameters: run parameters, run id parameter is set in place
+    :return:
+    """
+    from mlflow.exceptions import MlflowException
+    from mlflow.tracking import MlflowClient
+
+    run_id = resumed_run_id()
+    if run_id is None or run_parameters.get(const.MLFLOW_RUN_ID_PARAM):
+        return
+    try:
+        MlflowClient().get_run(run_id)
+    except MlflowException:
+        logger.warning(f'Checkpointed MLFlow run {run_id} is not found, start a new run')
+        return
+    logger.info(f'Resume checkpointed MLFlow run {run_id}')
+    run_parameters[const.MLFLOW_RUN_ID_PARAM] = run_id
 
 
-def train(train_env: TrainingEnv):
+def _run_worker_training(ml_project_dir: str, hyper_params: Mapping, run_parameters: MutableMapping, run_id: str,
+                         host: str, profile: Optional[LaunchProfile] = None,
+                         proxy: Optional[TrackingProxy] = None) -> str:
+    """
+    Run MLFlow training on worker host in a nested run of the run created by the leader host.
+    `mlflow run` terminates the run it is executed in, so workers don't use the leader run itself
+    :param ml_project_dir: Path to MLFlow project directory where MLFlow code is located
+    :param hyper_params: model hyper parameters that will be passed as MLFLow parameters to training script
+    :param run_parameters: run parameters that will be passed to `mlflow run ...` as arguments
+    :param run_id: MLFlow run id received from the leader
+    :param host: current host
+    :param profile: launch profile of training process
+    :param proxy: local tracking proxy for training process
+    :return: MLFlow run id of the worker
+    """
+    from mlflow.tracking import MlflowClient
+    from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
+
+    run_parameters.pop(const.MLFLOW_RUN_ID_PARAM, None)
+    client = MlflowClient()
+    experiment_id = client.get_run(run_id).info.experiment_id
+    worker_run_id = client.create_run(experiment_id, tags={MLFLOW_PARENT_RUN_ID: run_id, 'host': host}).info.run_id
+    logger.info(f'Run training in MLFlow run {worker_run_id} nested into the leader run {run_id}')
+    try:
+        cmd, new_env = _mlflow_run_cmd(ml_project_dir, hyper_params, run_parameters, worker_run_id)
+        _run_mlflow_cmd(cmd, new_env, profile, proxy=proxy)
+    except Exception:
+        client.set_terminated(worker_run_id, 'FAILED')
+        raise
+    return worker_run_id
+
+
+def _run_sweep(ml_project_dir: str, hyper_params: Mapping, run_parameters: MutableMapping,
+               container_params: Mapping, env_lock_dir: Optional[str] = None,
+               profile: Optional[LaunchProfile] = None, proxy: Optional[TrackingProxy] = None) -> Tuple[str, str]:
+    """
+    Run hyperparameters sweep: every trial is a separate `mlflow run` in a nested run of one parent run
+    sharing the same training env
+    :param ml_project_dir: Path to MLFlow project directory where MLFlow code is located
+    :param hyper_params: model hyper parameters with list-valued or range values to sweep
+    :param run_parameters: run parameters that will be passed to `mlflow run ...` as arguments
+    :param container_params: `sagemaker_mlflow_container_sweep*` parameters
+    :param env_lock_dir: dir with lockfiles of training env to save with parent run artifacts
+    :param profile: launch profile of the host that is split between concurrent trials
+    :param proxy: local tracking proxy for trials
+    :return: parent run id and run id of the best trial
+    """
+    import mlflow
+    from mlflow.tracking import MlflowClient
+    from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
+
+    metric = container_params.get(const.SWEEP_METRIC_PARAM)
+    if not metric:
+        raise ValueError(f'{const.CONTAINER_PARAMS_PREFIX}{const.SWEEP_METRIC_PARAM} parameter is required '
+                         f'to select the best trial of sweep')
+    goal = container_params.get(const.SWEEP_GOAL_PARAM, GOAL_MINIMIZE)
+    validate_goal(goal)
+    seed = container_params.get(const.SWEEP_SEED_PARAM)
+    trials = expand_trials(hyper_params, container_params[const.SWEEP_PARAM],
+                           int(container_params.get(const.SWEEP_SAMPLES_PARAM, 10)),
+                           int(seed) if seed is not None else None)
+    parallelism = int(container_params.get(const.SWEEP_PARALLELISM_PARAM, os.cpu_count() or 1))
+    client = MlflowClient()
+    profiles = _profiles_queue(profile, parallelism)
+
+    run_id = run_parameters.pop(const.MLFLOW_RUN_ID_PARAM, None)
+    with mlflow.start_run(run_id) as parent:
+        if env_lock_dir:
+            mlflow.log_artifacts(env_lock_dir, const.ENV_LOCK_ARTIFACTS_DIR)
+        mlflow.set_tags({'sweep_mode': container_params[const.SWEEP_PARAM], 'sweep_metric': metric,
+                         'sweep_goal': goal, 'sweep_trials': len(trials)})
+
+        def run_trial(params: Mapping) -> TrialResult:
+            child_id = None
+            trial_profile = profiles.get()
+            try:
+                tags = {MLFLOW_PARENT_RUN_ID: parent.info.run_id}
+                if trial_profile is not None:
+                    tags.update(trial_profile.tags())
+                child_id = client.create_run(parent.info.experiment_id, tags=tags).info.run_id
+                cmd, new_env = _mlflow_run_cmd(ml_project_dir, params, run_parameters, child_id)
+                _run_mlflow_cmd(cmd, new_env, trial_profile, child_id, proxy)
+                return TrialResult(child_id, params, client.get_run(child_id).data.metrics.get(metric))
+            except Exception as e:
+                logger.error(f'Trial {child_id} with parameters {params} is failed: {e}')
+                if child_id is not None:
+                    # the run is not terminated if the trial is failed before `mlflow run` is finished
+                    try:
+                        client.set_terminated(child_id, 'FAILED')
+                    except Exception as status_error:
+                        logger.warning(f'Unable to set status of trial {child_id}: {status_error}')
+                return TrialResult(child_id, params, None, str(e))
+            finally:
+                profiles.put(trial_profile)
+
+        best = best_trial(run_trials(trials, run_trial, parallelism), goal)
+        logger.info(f'Best trial {best.run_id} with {metric}={best.metric}: {best.params}')
+        mlflow.set_tag('sweep_best_run_id', best.run_id)
+        mlflow.log_metric(f'best_{metric}', best.metric)
+
+    return parent.info.run_id, best.run_id
+
+
+def _run_workflow(ml_project_dir: str, workflow: Mapping[str, Tuple[str, ...]],
+                  step_hyper_params: Mapping[str, Mapping], run_parameters: MutableMapping,
+                  container_params: Mapping, entry_points: Optional[Mapping[str, Mapping[str, Any]]],
+                  env_lock_dir: Optional[str] = None, profile: Optional[LaunchProfile] = None,
+                  proxy: Optional[TrackingProxy] = None) -> Tuple[str, str]:
+    """
+    Run workflow of MLproject entry points: every step is a separate `mlflow run -e <step>` in a nested run
+    of one parent run sharing the same training env, independent steps are run concurrently
+    :param ml_project_dir: Path to MLFlow project directory where MLFlow code is located
+    :param workflow: entry point -> entry points it requires
+    :param step_hyper_params: entry point -> hyper parameters (not declared by entry point are not passed)
+    :param run_parameters: run parameters that will be passed to `mlflow run ...` as arguments
+    :param container_params: `sagemaker_mlflow_container_workflow*` parameters
+    :param entry_points: entry point name -> parameters spec from MLproject file
+    :param env_lock_dir: dir with lockfiles of training env to save with parent run artifacts
+    :param profile: launch profile of the host that is split between concurrent steps
+    :param proxy: local tracking proxy for steps
+    :return: parent run id and run id of exported step
+    """
+    import mlflow
+    from mlflow.tracking import MlflowClient
+    from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
+
+    validate_workflow(workflow, entry_points)
+    export = export_step(workflow, container_params.get(const.WORKFLOW_EXPORT_PARAM))
+    parallelism = int(container_params.get(const.WORKFLOW_PARALLELISM_PARAM, os.cpu_count() or 1))
+    parallelism = max(min(parallelism, len(workflow)), 1)
+    client = MlflowClient()
+    profiles = _profiles_queue(profile, parallelism)
+    # running steps are terminated when other step is failed
+    terminators = {step: ProcessTerminator() for step in workflow}
+
+    run_id = run_parameters.pop(const.MLFLOW_RUN_ID_PARAM, None)
+    with mlflow.start_run(run_id) as parent:
+        if env_lock_dir:
+            mlflow.log_artifacts(env_lock_dir, const.ENV_LOCK_ARTIFACTS_DIR)
+        mlflow.set_tags({'workflow_steps': len(workflow), 'workflow_export': export})
+        # steps are started after the steps they require, so their artifact URIs are already set
+        artifact_uris: Dict[str, str] = {}
+
+        def run_step(step: str) -> str:
+            step_profile = profiles.get()
+            run = None
+            try:
+                tags = {MLFLOW_PARENT_RUN_ID: parent.info.run_id, 'workflow_step': step}
+                if step_profile is not None:
+                    tags.update(step_profile.tags())
+                run = client.create_run(parent.info.experiment_id, tags=tags)
+                params = step_params(entry_points[step], step_hyper_params[step], artifact_uris)
+                cmd, new_env = _mlflow_run_cmd(ml_project_dir, params,
+                                               dict(run_parameters, **{const.MLFLOW_ENTRY_POINT_PARAM: step}),
+                                               run.info.run_id)
+                _run_mlflow_cmd(cmd, new_env, step_profile, run.info.run_id, proxy, terminators[step])
+                artifact_uris[step] = run.info.artifact_uri
+                return run.info.run_id
+            except Exception:
+                if run is not None:
+                    # terminated `mlflow run` leaves its run running
+                    try:
+                        client.set_terminated(run.info.run_id, 'FAILED')
+                    except Exception as status_error:
+                        logger.warning(f'Unable to set status of step {step} run: {status_error}')
+                raise
+            finally:
+                profiles.put(step_profile)
+
+        logger.info(f'Run workflow of {len(workflow)} steps, {parallelism} concurrently')
+        run_ids = run_stages([Stage(step, functools.partial(run_step, step), requires, terminators[step].terminate)
+                              for step, requires in workflow.items()], max_workers=parallelism)
+        mlflow.set_tag('workflow_export_run_id', run_ids[export])
+
+    return parent.info.run_id, run_ids[export]
+
+
+def _save_results(run_id: str, output_dir: str, container_params: Optional[Mapping] = None,
+                  output_data_dir: Optional[str] = None):
+    """
+    Save MLFlow run artifacts into model dir
+    :param run_id:
+    :param output_dir: SageMaker model dir
+    :param container_params: `sagemaker_mlflow_container_export*` parameters that select exported artifacts
+    and `sagemaker_mlflow_container_dedup`
+    :param output_data_dir: SageMaker output data dir to compress artifacts excluded from export into
+    :return:
+    """
+    container_params = container_params or {}
+    artifact_filter = ArtifactFilter(_param_to_list(container_params.get(const.EXPORT_INCLUDE_PARAM)),
+                                     _param_to_list(container_params.get(const.EXPORT_EXCLUDE_PARAM)))
+    excluded_dir = None
+    if _param_to_bool(container_params.get(const.EXPORT_COMPRESS_EXCLUDED_PARAM, False)):
+        excluded_dir = output_data_dir
+    _copy_mlflow_results_to_dir(run_id, output_dir, artifact_filter, excluded_dir,
+                                _param_to_bool(container_params.get(const.DEDUP_PARAM, False)))
+
+
+def train(train_env: 'TrainingEnv'):
     """
 
     :param train_env:
     :return:
     """
 
+    timer = StageTimer()
+    run_id = None
+    try:
+        with timer.span('total'):
+            run_id = _train(train_env, timer)
+    finally:
+        # timings are best effort, they must not replace the training error
+        try:
+            timer.log_metrics()
+            timer.write_report(join(train_env.output_data_dir, const.TIMING_REPORT_FILE))
+            if run_id is not None:
+                timer.log_to_mlflow(run_id)
+        except Exception as e:
+            logger.warning(f'Failed to save stage timings: {e}')
+
+
+def _train(train_env: 'TrainingEnv', timer: StageTimer) -> Optional[str]:
+    """
+    Run training on the current host.
+    With several hosts, only the leader host sets up training env from scratch, creates MLFlow run
+    and saves results, worker hosts receive run id and packed env from the leader
+    :param train_env:
+    :param timer:
+    :return: MLFlow run id to log timings to (None on worker hosts)
+    """
+    from sagemaker_containers import _env
+
     code_dir = _env.code_dir
+    code = CodeExtractor(train_env.module_dir, code_dir)
+    container_params = _split_container_params(train_env.additional_framework_parameters)
+    sweep = container_params.get(const.SWEEP_PARAM)
+    if sweep and len(train_env.hosts) > 1:
+        raise ValueError('Hyperparameters sweep is supported only on a single host')
+    if sweep:
+        # invalid goal fails the job before conda env update, not after all trials
+        validate_goal(container_params.get(const.SWEEP_GOAL_PARAM, GOAL_MINIMIZE))
+        pipe_channels = _pipe_channels(train_env)
+        if pipe_channels:
+            # FIFO of a channel can be read only once, so concurrent trials can't share it
+            raise ValueError(f'Hyperparameters sweep does not support Pipe mode channels: {", ".join(pipe_channels)}')
+    workflow = parse_workflow(container_params[const.WORKFLOW_PARAM]) \
+        if container_params.get(const.WORKFLOW_PARAM) else None
+    if workflow and (sweep or len(train_env.hosts) > 1):
+        raise ValueError('Workflow is supported only on a single host without hyperparameters sweep')
+    if workflow:
+        export_step(workflow, container_params.get(const.WORKFLOW_EXPORT_PARAM))
+
+    leader = leader_host(train_env.hosts)
+    if train_env.current_host != leader:
+        _train_worker(train_env, timer, code, leader)
+        return None
+
+    snapshot_input_dir = train_env.channel_input_dirs.get(const.CONDA_SNAPSHOT_CHANNEL)
+    snapshot_output_dir = None
+    if _param_to_bool(container_params.get(const.PACK_ENV_PARAM, False)):
+        snapshot_output_dir = join(train_env.output_data_dir, const.CONDA_SNAPSHOT_OUTPUT_SUBDIR)
+
+    workers = [host for host in train_env.hosts if host != leader]
+    with LeaderRendezvous(workers) as rendezvous:
+        # Environment checks don't depend on the code and conda env update requires only
+        # MLproject and conda files, so they are run concurrently with code extraction
+        logger.info(f'Download code, check environment and update {const.CONDA_TRAINING_ENV} conda env '
+                    f'using MLProject dependencies')
+        # conda commands are killed if another stage fails, not to wait for the whole env update
+        env_terminator = ProcessTerminator()
+        stages = [
+            Stage('download_code', code.download_and_extract, cancel=code.cancel),
+            Stage('check_env', _check_env),
+            Stage('import_mlflow', _import_mlflow),
+            Stage('extract_project_files', code.wait_project_files),
+            Stage('update_conda_env',
+                  lambda: _update_codna_env(code.wait_project_files(), snapshot_input_dir, snapshot_output_dir,
+                                            env_terminator),
+                  requires=('check_env', 'extract_project_files'), cancel=env_terminator.terminate),
+        ]
+        if workers:
+            stages.append(Stage('accept_workers', rendezvous.accept_workers, cancel=rendezvous.close))
+        if workflow:
+            # invalid workflow fails the job before conda env update
+            stages.append(Stage('validate_workflow',
+                                lambda: validate_workflow(workflow, code.wait_project_files().entry_points,
+                                                          _pipe_channels(train_env)),
+                                requires=('extract_project_files',)))
+        env_update: EnvUpdate = run_stages(stages, timer=timer)['update_conda_env']
 
-    logger.info('Download code')
-    _files.download_and_extract(train_env.module_dir, code_dir)
+        snapshot = None
+        if workers:
+            with timer.span('pack_env_for_workers'):
+                snapshot = _pack_env_for_workers(env_update, rendezvous)
 
-    logger.info('Checking environment')
-    _check_env()
+        logger.info('Run training')
+        run_params = _split_run_params(train_env.additional_framework_parameters)
+        project_files = code.wait_project_files()
+        if workflow:
+            step_hyper_params = {
+                step: _channel_hyper_params(train_env, project_files, train_env.hyperparameters,
+                                            {const.MLFLOW_ENTRY_POINT_PARAM: step})
+                for step in workflow
+            }
+        else:
+            hyper_params = _channel_hyper_params(train_env, project_files, train_env.hyperparameters, run_params)
+        profile = launch_profile(train_env.num_cpus, train_env.num_gpus, container_params)
+        with timer.span('mlflow_run'), tracking_proxy(container_params) as proxy:
+            if workflow:
+                run_id, result_run_id = _run_workflow(code_dir, workflow, step_hyper_params, run_params,
+                                                      container_params, project_files.entry_points,
+                                                      env_update.lock_dir, profile, proxy)
+            elif sweep:
+                run_id, result_run_id = _run_sweep(code_dir, hyper_params, run_params,
+                                                   container_params, env_update.lock_dir, profile, proxy)
+            else:
+                _resume_checkpointed_run(run_params)
+                terminator = ProcessTerminator()
 
-    logger.info(f'Update {const.CONDA_TRAINING_ENV} conda env using MLProject dependencies')
-    _update_codna_env(code_dir)
+                def stop_training(host: str, error: str):
+                    logger.error(f'Training on worker {host} is failed, stop training: {error}')
+                    terminator.terminate()
 
-    logger.info('Run training')
-    run_params = _split_run_params(train_env.additional_framework_parameters)
-    run_id = _run_training(code_dir, train_env.hyperparameters, run_params)
+                def start_workers(run_id: str):
+                    rendezvous.broadcast_run(run_id, env_update.snapshot_key, snapshot)
+                    rendezvous.watch_workers(stop_training)
+
+                run_id = result_run_id = _run_training(
+                    code_dir, hyper_params, run_params, env_update.lock_dir, start_workers, profile, proxy,
+                    terminator,
+                )
+
+        if workers:
+            logger.info('Wait for training on worker hosts')
+            with timer.span('wait_workers'):
+                rendezvous.wait_workers()
 
     logger.info('Save results')
-    _save_results(run_id, train_env.model_dir)
+    with timer.span('save_results'):
+        _save_results(result_run_id, train_env.model_dir, container_params, train_env.output_data_dir)
+
+    return run_id
+
+
+def _train_worker(train_env: 'TrainingEnv', timer: StageTimer, code: CodeExtractor, leader: str):
+    """
+    Run training on worker host of multi-host training
+    :param train_env:
+    :param timer:
+    :param code: extractor of submitted code
+    :param leader: leader host
+    :return:
+    """
+    from sagemaker_containers import _env
+
+    with WorkerRendezvous(train_env.current_host, leader) as rendezvous:
+        try:
+            logger.info(f'Download code, check environment and wait for MLFlow run from the leader host {leader}')
+            results = run_stages([
+                Stage('download_code', code.download_and_extract, cancel=code.cancel),
+                Stage('check_env', _check_env),
+                Stage('extract_project_files', code.wait_project_files),
+                Stage('receive_env', lambda: _receive_env_from_leader(rendezvous, code.wait_project_files()),
+                      requires=('check_env', 'extract_project_files')),
+            ], timer=timer)
+
+            run_params = _split_run_params(train_env.additional_framework_parameters)
+            hyper_params = _channel_hyper_params(train_env, code.wait_project_files(), train_env.hyperparameters,
+                                                 run_params)
+            container_params = _split_container_params(train_env.additional_framework_parameters)
+            profile = launch_profile(train_env.num_cpus, train_env.num_gpus, container_params)
+            with timer.span('mlflow_run'), tracking_proxy(container_params) as proxy:
+                _run_worker_training(_env.code_dir, hyper_params, run_params, results['receive_env'],
+                                     train_env.current_host, profile, proxy)
+        except Exception as e:
+            # the leader fails as soon as it receives the report
+            try:
+                rendezvous.report(False, str(e))
+            except OSError as report_error:
+                logger.warning(f'Unable to report failure to the leader host {leader}: {report_error}')
+            raise
+        rendezvous.report(True)
 
 
 def main():
+    from sagemaker_containers import training_env
+
     train(training_env())
 
 
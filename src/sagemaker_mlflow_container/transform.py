@@ -0,0 +1,31 @@
+#
+#    Copyright 2020 EPAM Systems
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+import logging
+import sys
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._transform import transform
+from sagemaker_mlflow_container.serving import _setup_model
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    transform(_setup_model('sagemaker_mlflow_container.transform'),
+              const.TRANSFORM_INPUT_DIR, const.TRANSFORM_OUTPUT_DIR)
+
+
+if __name__ == '__main__':
+    main()
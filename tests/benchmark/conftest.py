@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import sys
+import tarfile
+from os.path import join
+from types import SimpleNamespace
+
+import pytest
+
+STUBS_DIR = join(os.path.dirname(__file__), 'stubs')
+ML_PROJECT_DIR = join(os.path.dirname(__file__), '..', 'integration', 'resources', 'ml', 'code')
+
+# size of synthetic artifacts tree
+SMALL_FILES = int(os.environ.get('BENCHMARK_SMALL_FILES', 5000))
+LARGE_FILES = int(os.environ.get('BENCHMARK_LARGE_FILES', 3))
+LARGE_FILE_MB = int(os.environ.get('BENCHMARK_LARGE_FILE_MB', 256))
+
+
+def _install_stub(name, bin_dir):
+    """
+    Copy stub executable into `bin_dir` using current python interpreter to run it
+    """
+    with open(join(STUBS_DIR, name)) as f:
+        _, source = f.read().split('\n', 1)
+    path = join(bin_dir, name)
+    with open(path, 'w') as f:
+        f.write(f'#!{sys.executable}\n{source}')
+    os.chmod(path, 0o755)
+
+
+class StubCalls:
+    """Subprocesses spawned by the container and logged by stub executables"""
+
+    def __init__(self, log):
+        self.log = log
+
+    def __call__(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def stub_calls(tmp_path, monkeypatch):
+    """
+    Put stub `conda` executable on PATH and create stub `training` conda env with stub `mlflow` and `python` executables
+    """
+    conda_root = tmp_path / 'conda'
+    env_prefix = conda_root / 'envs' / 'training'
+    for d in ('bin', 'conda-meta', join('lib', 'python3.6', 'site-packages', 'mlflow-1.7.0.dist-info')):
+        (env_prefix / d).mkdir(parents=True)
+    (conda_root / 'bin').mkdir()
+    _install_stub('conda', str(conda_root / 'bin'))
+    _install_stub('mlflow', str(env_prefix / 'bin'))
+    _install_stub('python', str(env_prefix / 'bin'))
+
+    calls_log = str(tmp_path / 'calls.log')
+    monkeypatch.setenv('PATH', f'{conda_root / "bin"}:{os.environ["PATH"]}')
+    monkeypatch.setenv('STUB_CONDA_ROOT', str(conda_root))
+    monkeypatch.setenv('STUB_CALLS_LOG', calls_log)
+    monkeypatch.setenv('MLFLOW_TRACKING_URI', f'file://{tmp_path / "mlruns"}')
+    return StubCalls(calls_log)
+
+
+@pytest.fixture
+def opt_ml(tmp_path, monkeypatch):
+    """
+    Temporary /opt/ml-like tree with submitted code archive and SageMaker training env describing it
+    """
+    from sagemaker_containers import _env
+
+    root = tmp_path / 'opt_ml'
+    archive = str(root / 'input' / 'sourcedir.tar.gz')
+    os.makedirs(os.path.dirname(archive))
+    with tarfile.open(archive, 'w:gz') as tar:
+        for name in os.listdir(ML_PROJECT_DIR):
+            tar.add(join(ML_PROJECT_DIR, name), arcname=name)
+
+    code_dir = root / 'code'
+    monkeypatch.setattr(_env, 'code_dir', str(code_dir))
+    yield SimpleNamespace(
+        module_dir=archive,
+        hyperparameters={'alpha': 1.0},
+        additional_framework_parameters={},
+        channel_input_dirs={},
+        model_dir=str(root / 'model'),
+        output_data_dir=str(root / 'output' / 'data'),
+        hosts=['algo-1'],
+        num_cpus=os.cpu_count(),
+        num_gpus=0,
+        current_host='algo-1',
+    )
+    shutil.rmtree(str(root), ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def synthetic_tree(tmp_path_factory):
+    """
+    Synthetic artifacts tree of many small files and a few large ones
+    Tree size can be tuned by BENCHMARK_SMALL_FILES, BENCHMARK_LARGE_FILES and BENCHMARK_LARGE_FILE_MB env vars
+    """
+    root = tmp_path_factory.mktemp('artifacts')
+    for i in range(SMALL_FILES):
+        d = root / 'logs' / str(i % 100)
+        d.mkdir(parents=True, exist_ok=True)
+        (d / f'{i}.txt').write_bytes(os.urandom(4096))
+
+    chunk = os.urandom(1024 * 1024)
+    for i in range(LARGE_FILES):
+        (root / 'model').mkdir(exist_ok=True)
+        with open(root / 'model' / f'checkpoint-{i}.bin', 'wb') as f:
+            for _ in range(LARGE_FILE_MB):
+                f.write(chunk)
+    return root
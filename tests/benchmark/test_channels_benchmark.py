@@ -0,0 +1,74 @@
+"""
+Compare reading a channel staged to local disk first (File mode) with streaming it from FIFO (Pipe mode):
+time to the first line, total time and local disk space used by the channel are reported
+
+Use BENCHMARK_CHANNEL_MB and BENCHMARK_CHANNEL_MBPS env vars to change channel size and download throughput
+"""
+import os
+import shutil
+import threading
+import time
+from os.path import join
+
+import pytest
+
+from sagemaker_mlflow_container.channels import read_lines
+
+MB = int(os.environ.get('BENCHMARK_CHANNEL_MB', 200))
+MBPS = float(os.environ.get('BENCHMARK_CHANNEL_MBPS', 400))
+
+BLOCK = b''.join(f'{i},{i % 7},{"x" * 16}\n'.encode() for i in range(40000))
+
+
+def _download(f):
+    """Write MB of CSV lines to `f` with MBPS throughput like SageMaker downloading a channel from S3"""
+    start = time.monotonic()
+    written = 0
+    while written < MB * 1024 * 1024:
+        f.write(BLOCK)
+        written += len(BLOCK)
+        delay = start + written / (MBPS * 1024 * 1024) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _consume(path, start):
+    first = None
+    lines = 0
+    for _ in read_lines(path):
+        if first is None:
+            first = time.monotonic() - start
+        lines += 1
+    return first, lines
+
+
+@pytest.mark.parametrize('mode', ['File', 'Pipe'])
+def test_channel_time_to_first_line(tmp_path, mode):
+    start = time.monotonic()
+    if mode == 'File':
+        channel = tmp_path / 'train'
+        channel.mkdir()
+        with open(str(channel / 'part-0.csv'), 'wb') as f:
+            _download(f)
+        disk = sum(os.path.getsize(join(str(channel), name)) for name in os.listdir(str(channel)))
+        first, lines = _consume(str(channel), start)
+        shutil.rmtree(str(channel))
+    else:
+        fifo = str(tmp_path / 'train_0')
+        os.mkfifo(fifo)
+
+        def download():
+            with open(fifo, 'wb') as f:
+                _download(f)
+
+        writer = threading.Thread(target=download, daemon=True)
+        writer.start()
+        first, lines = _consume(fifo, start)
+        writer.join()
+        disk = 0
+    seconds = time.monotonic() - start
+
+    blocks = -(-MB * 1024 * 1024 // len(BLOCK))
+    assert lines == blocks * 40000
+    print(f'\n{mode:>4}: {MB} MB channel at {MBPS:.0f} MB/s, first line in {first:.3f}s, '
+          f'all {lines} lines in {seconds:.2f}s, {disk / 1024 / 1024:.0f} MB of local disk')
@@ -0,0 +1,40 @@
+"""
+Compare artifacts export with shutil.copytree on a synthetic tree of many small files and a few large ones
+
+Tree size can be tuned by BENCHMARK_SMALL_FILES, BENCHMARK_LARGE_FILES and BENCHMARK_LARGE_FILE_MB env vars
+"""
+import shutil
+import time
+
+import pytest
+from sagemaker_mlflow_container._export import EXPORT_MODE_COPY, EXPORT_MODE_HARDLINK, EXPORT_MODE_MOVE, \
+    EXPORT_MODE_REFLINK, export_tree
+
+from .conftest import LARGE_FILE_MB, LARGE_FILES, SMALL_FILES
+
+
+def _report(name, files, size, seconds):
+    print(f'\n{name:>10}: {files} files, {size / 1024 / 1024:.0f} MB in {seconds:.3f}s '
+          f'({size / 1024 / 1024 / max(seconds, 1e-9):.0f} MB/s)')
+
+
+def test_copytree_baseline(synthetic_tree, tmp_path):
+    start = time.monotonic()
+    shutil.copytree(str(synthetic_tree), str(tmp_path / 'dst'))
+    seconds = time.monotonic() - start
+
+    files = SMALL_FILES + LARGE_FILES
+    _report('copytree', files, SMALL_FILES * 4096 + LARGE_FILES * LARGE_FILE_MB * 1024 * 1024, seconds)
+
+
+@pytest.mark.parametrize('mode', [EXPORT_MODE_COPY, EXPORT_MODE_HARDLINK, EXPORT_MODE_REFLINK, EXPORT_MODE_MOVE])
+def test_export_tree(synthetic_tree, tmp_path, mode):
+    src = synthetic_tree
+    if mode == EXPORT_MODE_MOVE:
+        src = tmp_path / 'src'
+        export_tree(str(synthetic_tree), str(src), EXPORT_MODE_HARDLINK)
+
+    stats = export_tree(str(src), str(tmp_path / 'dst'), mode)
+
+    assert stats.files == SMALL_FILES + LARGE_FILES
+    _report(mode, stats.files, stats.bytes, stats.seconds)
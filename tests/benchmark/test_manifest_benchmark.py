@@ -0,0 +1,54 @@
+"""
+Compare artifacts manifest hashing with sequential hashlib over the same synthetic tree
+
+Use BENCHMARK_LARGE_FILES and BENCHMARK_LARGE_FILE_MB env vars to make the tree multi-GB
+"""
+import hashlib
+import os
+import time
+
+from sagemaker_mlflow_container._manifest import build_manifest, export_manifest
+
+from .conftest import LARGE_FILE_MB, LARGE_FILES, SMALL_FILES
+
+TREE_SIZE = SMALL_FILES * 4096 + LARGE_FILES * LARGE_FILE_MB * 1024 * 1024
+
+
+def _report(name, seconds, files=SMALL_FILES + LARGE_FILES, size=TREE_SIZE):
+    print(f'\n{name:>12}: {files} files, {size / 1024 / 1024:.0f} MB in {seconds:.3f}s '
+          f'({size / 1024 / 1024 / max(seconds, 1e-9):.0f} MB/s)')
+
+
+def test_sequential_hash_baseline(synthetic_tree):
+    start = time.monotonic()
+    for root, _, files in os.walk(str(synthetic_tree)):
+        for name in files:
+            with open(os.path.join(root, name), 'rb') as f:
+                hashlib.sha256(f.read()).hexdigest()
+    _report('sequential', time.monotonic() - start)
+
+
+def test_build_manifest(synthetic_tree):
+    start = time.monotonic()
+    entries = build_manifest(str(synthetic_tree))
+    _report('manifest', time.monotonic() - start)
+
+    assert len(entries) == SMALL_FILES + LARGE_FILES
+    assert sum(e.size for e in entries) == TREE_SIZE
+
+
+def test_dedup_second_run(synthetic_tree, tmp_path):
+    cas = str(tmp_path / 'cas')
+    run1, run2 = tmp_path / 'run1', tmp_path / 'run2'
+    for run in (run1, run2):
+        (run / 'model').mkdir(parents=True)
+        for name in os.listdir(str(synthetic_tree / 'model')):
+            os.link(str(synthetic_tree / 'model' / name), str(run / 'model' / name))
+
+    export_manifest(str(run1), str(tmp_path / 'run1.json'), cas, min_size=1024 * 1024)
+    start = time.monotonic()
+    entries = export_manifest(str(run2), str(tmp_path / 'run2.json'), cas, min_size=1024 * 1024)
+    _report('dedup', time.monotonic() - start, LARGE_FILES, LARGE_FILES * LARGE_FILE_MB * 1024 * 1024)
+
+    assert all(e.ref is not None for e in entries)
+    assert not os.listdir(str(run2 / 'model'))
@@ -0,0 +1,102 @@
+"""
+Load test of inference server: concurrent clients send single-row requests to pyfunc model
+with fixed per-call overhead, throughput and p50/p99 latency are reported with and without micro-batching
+
+Use BENCHMARK_SERVING_REQUESTS and BENCHMARK_SERVING_CLIENTS env vars to change the load
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+import pytest
+import urllib3
+
+REQUESTS = int(os.environ.get('BENCHMARK_SERVING_REQUESTS', 2000))
+CLIENTS = int(os.environ.get('BENCHMARK_SERVING_CLIENTS', 32))
+
+SRC_DIR = join(os.path.dirname(__file__), '..', '..', 'src')
+
+# predict has 2ms overhead per call (e.g. model graph dispatch) and vectorized work per row
+LOADER_MODULE = '''
+import time
+
+
+class Model:
+    def predict(self, frame):
+        time.sleep(0.002)
+        return frame['x'] * 2
+
+
+def _load_pyfunc(path):
+    return Model()
+'''
+
+
+@pytest.fixture(scope='module')
+def pyfunc_model(tmp_path_factory):
+    import mlflow.pyfunc
+
+    root = tmp_path_factory.mktemp('serving')
+    loader = root / 'benchmark_loader.py'
+    loader.write_text(LOADER_MODULE)
+    model_path = str(root / 'model')
+    mlflow.pyfunc.save_model(model_path, loader_module='benchmark_loader', code_paths=[str(loader)])
+    return model_path
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(model_path, port, max_rows, max_wait):
+    code = (f'from sagemaker_mlflow_container._server import serve; '
+            f'serve({model_path!r}, {port}, 0, {max_rows}, {max_wait})')
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(SRC_DIR))
+    process = subprocess.Popen([sys.executable, '-c', code], env=env)
+    http = urllib3.PoolManager(maxsize=CLIENTS)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            if http.request('GET', f'http://127.0.0.1:{port}/ping', retries=False).status == 200:
+                return process, http
+        except urllib3.exceptions.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise TimeoutError('Inference server is not started')
+
+
+def _load_test(http, port):
+    url = f'http://127.0.0.1:{port}/invocations'
+
+    def invoke(i):
+        start = time.monotonic()
+        response = http.request('POST', url, body=f'x\n{i}\n'.encode(), headers={'Content-Type': 'text/csv'})
+        assert response.status == 200 and response.data == f'[{2 * i}]'.encode()
+        return time.monotonic() - start
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        latencies = sorted(pool.map(invoke, range(REQUESTS)))
+    return REQUESTS / (time.monotonic() - start), latencies
+
+
+@pytest.mark.parametrize('name,max_rows,max_wait', [('no batching', 1, 0), ('micro-batch', 256, 0.005)])
+def test_serving_load(pyfunc_model, name, max_rows, max_wait):
+    port = _free_port()
+    process, http = _start_server(pyfunc_model, port, max_rows, max_wait)
+    try:
+        throughput, latencies = _load_test(http, port)
+    finally:
+        process.terminate()
+        process.wait()
+
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f'\n{name:>12}: {REQUESTS} requests by {CLIENTS} clients, {throughput:.0f} req/s, '
+          f'p50 {p50:.1f}ms, p99 {p99:.1f}ms')
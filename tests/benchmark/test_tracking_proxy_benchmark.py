@@ -0,0 +1,60 @@
+"""
+Compare latency of per-step `log_metric` calls to remote tracking server with calls through local tracking proxy
+
+Use BENCHMARK_TRACKING_STEPS and BENCHMARK_TRACKING_LATENCY_MS env vars to change number of calls
+and simulated round trip to the tracking server
+"""
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+from sagemaker_mlflow_container._tracking_proxy import TrackingProxy
+
+from ..unit.test_tracking_proxy import _FileStoreServer
+
+STEPS = int(os.environ.get('BENCHMARK_TRACKING_STEPS', 200))
+LATENCY_MS = float(os.environ.get('BENCHMARK_TRACKING_LATENCY_MS', 20))
+
+
+@pytest.fixture
+def remote_server(tmp_path, monkeypatch):
+    monkeypatch.setenv('MLFLOW_ALLOW_FILE_STORE', 'true')
+    # mlflow warns on every request that request headers of this environment can't be resolved
+    logging.getLogger('mlflow.tracking.request_header.registry').setLevel(logging.ERROR)
+    server = _FileStoreServer(str(tmp_path / 'mlruns'))
+    server.latency = LATENCY_MS / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _log_steps(uri, run_id):
+    from mlflow.tracking import MlflowClient
+
+    client = MlflowClient(uri)
+    start = time.monotonic()
+    for step in range(STEPS):
+        client.log_metric(run_id, 'loss', 1 / (step + 1), step=step)
+    return time.monotonic() - start
+
+
+@pytest.mark.parametrize('name', ['direct', 'proxy'])
+def test_log_metric_latency(remote_server, name):
+    run_id = remote_server.store.create_run('0', 'user', int(time.time() * 1000), [], 'run').info.run_id
+
+    if name == 'direct':
+        seconds = _log_steps(remote_server.uri, run_id)
+    else:
+        proxy = TrackingProxy(remote_server.uri).start()
+        try:
+            seconds = _log_steps(proxy.uri, run_id)
+        finally:
+            proxy.close()
+
+    assert len(remote_server.store.get_metric_history(run_id, 'loss')) == STEPS
+    print(f'\n{name:>7}: {STEPS} log_metric calls with {LATENCY_MS:.0f}ms round trip in {seconds:.3f}s '
+          f'({seconds / STEPS * 1000:.2f}ms per call), {len(remote_server.requests)} tracking server requests')
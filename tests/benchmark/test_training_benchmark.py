@@ -0,0 +1,172 @@
+"""
+Benchmark of the container orchestration overhead
+
+`conda` and `mlflow` are replaced by stub executables with fixed latency, so measured time is
+the container own overhead plus stub latencies. The benchmark fails if the number of spawned subprocesses
+or time of any stage regress past `baseline.json`. Set BENCHMARK_UPDATE_BASELINE=1 to rewrite the baseline
+"""
+import json
+import os
+import tarfile
+from os.path import join
+
+from sagemaker_mlflow_container import const
+
+from .conftest import ML_PROJECT_DIR
+
+BASELINE_FILE = join(os.path.dirname(__file__), 'baseline.json')
+
+# measured stage time may exceed the baseline by this ratio plus absolute slack
+TOLERANCE_RATIO = 1.5
+TOLERANCE_SECONDS = 0.1
+
+
+def _load_baseline():
+    with open(BASELINE_FILE) as f:
+        return json.load(f)
+
+
+def test_training_overhead(stub_calls, opt_ml, monkeypatch):
+    from sagemaker_mlflow_container import training
+    from sagemaker_mlflow_container._checkers import _probe_env
+
+    baseline = _load_baseline()
+    for var, latency in baseline['latency'].items():
+        monkeypatch.setenv(var, str(latency))
+    _probe_env.cache_clear()
+
+    training.train(opt_ml)
+
+    with open(join(opt_ml.output_data_dir, const.TIMING_REPORT_FILE)) as f:
+        stages = {span['name']: span['wall_seconds'] for span in json.load(f)['spans']}
+    calls = stub_calls()
+
+    print(f'\nSubprocesses spawned: {len(calls)}')
+    for call in calls:
+        print(f'  {" ".join(call)}')
+    for name, seconds in stages.items():
+        print(f'{name:>25}: {seconds:.3f}s (baseline {baseline["stages"].get(name, "-")})')
+
+    assert os.path.exists(join(opt_ml.model_dir, const.SAGEMAKER_MODEL_SUBDIR, 'model', 'MLmodel'))
+
+    if os.environ.get('BENCHMARK_UPDATE_BASELINE'):
+        baseline['subprocesses'] = len(calls)
+        baseline['stages'] = {name: round(seconds, 3) for name, seconds in stages.items()}
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        return
+
+    assert len(calls) <= baseline['subprocesses']
+    regressions = {name: seconds for name, seconds in stages.items()
+                   if name in baseline['stages']
+                   and seconds > baseline['stages'][name] * TOLERANCE_RATIO + TOLERANCE_SECONDS}
+    assert not regressions, f'Stages regressed past baseline: {regressions}'
+
+
+def test_sweep_overhead(stub_calls, opt_ml, monkeypatch):
+    from mlflow.tracking import MlflowClient
+
+    from sagemaker_mlflow_container import training
+    from sagemaker_mlflow_container._checkers import _probe_env
+
+    baseline = _load_baseline()
+    for var, latency in baseline['latency'].items():
+        monkeypatch.setenv(var, str(latency))
+    _probe_env.cache_clear()
+
+    opt_ml.hyperparameters = {'alpha': [0.5, 0.1, 1.0]}
+    opt_ml.additional_framework_parameters = {
+        'sagemaker_mlflow_container_sweep': 'grid',
+        'sagemaker_mlflow_container_sweep_metric': 'loss',
+        'sagemaker_mlflow_container_sweep_parallelism': 3,
+    }
+    training.train(opt_ml)
+
+    with open(join(opt_ml.output_data_dir, const.TIMING_REPORT_FILE)) as f:
+        stages = {span['name']: span['wall_seconds'] for span in json.load(f)['spans']}
+    mlflow_runs = [call for call in stub_calls() if call[:2] == ['mlflow', 'run']]
+    print(f'\nmlflow_run of {len(mlflow_runs)} trials: {stages["mlflow_run"]:.3f}s')
+
+    # env is updated once for all trials
+    assert len([call for call in stub_calls() if call[:3] == ['conda', 'env', 'update']]) == 1
+    assert len(mlflow_runs) == 3
+
+    best_runs = [call for call in mlflow_runs if 'alpha=0.1' in call]
+    best_run_id = best_runs[0][best_runs[0].index('--run-id') + 1]
+    parent = MlflowClient().get_run(MlflowClient().get_run(best_run_id).data.tags['mlflow.parentRunId'])
+    assert parent.data.tags['sweep_best_run_id'] == best_run_id
+    assert os.path.exists(join(opt_ml.model_dir, const.SAGEMAKER_MODEL_SUBDIR, 'model', 'MLmodel'))
+
+    # trials are run concurrently
+    assert stages['mlflow_run'] < baseline['stages']['mlflow_run'] * TOLERANCE_RATIO + TOLERANCE_SECONDS
+
+
+WORKFLOW_MLPROJECT = '''
+name: workflow
+
+conda_env: conda.yaml
+
+entry_points:
+  prepare:
+    command: "python prepare.py"
+  featurize_text:
+    parameters:
+      prepare_artifacts: path
+    command: "python featurize.py {prepare_artifacts} text"
+  featurize_image:
+    parameters:
+      prepare_artifacts: path
+    command: "python featurize.py {prepare_artifacts} image"
+  train:
+    parameters:
+      alpha: float
+      featurize_text_artifacts: path
+      featurize_image_artifacts: path
+    command: "python train.py {alpha} {featurize_text_artifacts} {featurize_image_artifacts}"
+'''
+
+
+def test_workflow_overhead(stub_calls, opt_ml, monkeypatch):
+    from sagemaker_mlflow_container import training
+    from sagemaker_mlflow_container._checkers import _probe_env
+
+    baseline = _load_baseline()
+    for var, latency in baseline['latency'].items():
+        monkeypatch.setenv(var, str(latency))
+    _probe_env.cache_clear()
+
+    with tarfile.open(opt_ml.module_dir, 'w:gz') as tar:
+        tar.add(join(ML_PROJECT_DIR, 'conda.yaml'), arcname='conda.yaml')
+        mlproject = join(os.path.dirname(opt_ml.module_dir), 'MLproject')
+        with open(mlproject, 'w') as f:
+            f.write(WORKFLOW_MLPROJECT)
+        tar.add(mlproject, arcname='MLproject')
+    opt_ml.additional_framework_parameters = {
+        'sagemaker_mlflow_container_workflow': json.dumps({
+            'prepare': [], 'featurize_text': ['prepare'], 'featurize_image': ['prepare'],
+            'train': ['featurize_text', 'featurize_image'],
+        }),
+        'sagemaker_mlflow_container_workflow_parallelism': 2,
+    }
+    training.train(opt_ml)
+
+    with open(join(opt_ml.output_data_dir, const.TIMING_REPORT_FILE)) as f:
+        stages = {span['name']: span['wall_seconds'] for span in json.load(f)['spans']}
+    mlflow_runs = {call[call.index('--entry-point') + 1]: call
+                   for call in stub_calls() if call[:2] == ['mlflow', 'run']}
+    print(f'\nworkflow of {len(mlflow_runs)} steps in one job: {stages["total"]:.3f}s '
+          f'(mlflow_run {stages["mlflow_run"]:.3f}s), '
+          f'separate jobs: ~{len(mlflow_runs) * baseline["stages"]["total"]:.3f}s by baseline')
+
+    # env is updated once for all steps
+    assert len([call for call in stub_calls() if call[:3] == ['conda', 'env', 'update']]) == 1
+    assert sorted(mlflow_runs) == ['featurize_image', 'featurize_text', 'prepare', 'train']
+    assert not any(arg.startswith('alpha=') for arg in mlflow_runs['prepare'])
+    train_params = [arg for i, arg in enumerate(mlflow_runs['train']) if mlflow_runs['train'][i - 1] == '-P']
+    assert sorted(p.split('=', 1)[0] for p in train_params) == ['alpha', 'featurize_image_artifacts',
+                                                                'featurize_text_artifacts']
+    assert os.path.exists(join(opt_ml.model_dir, const.SAGEMAKER_MODEL_SUBDIR, 'model', 'MLmodel'))
+
+    # featurize steps are run concurrently, only 3 steps are on the critical path
+    latency = baseline['latency']['STUB_MLFLOW_LATENCY']
+    assert stages['mlflow_run'] < 3 * latency + baseline['stages']['mlflow_run'] * TOLERANCE_RATIO
@@ -0,0 +1,87 @@
+"""
+Compare streaming batch transform with reading the whole input file into one DataFrame:
+rows per second and peak RSS of all processes are reported
+
+Use BENCHMARK_TRANSFORM_ROWS env var to make the input larger, peak RSS of streaming transform should stay flat
+"""
+import json
+import os
+import subprocess
+import sys
+from os.path import join
+
+import pytest
+
+ROWS = int(os.environ.get('BENCHMARK_TRANSFORM_ROWS', 1000000))
+
+SRC_DIR = join(os.path.dirname(__file__), '..', '..', 'src')
+
+LOADER_MODULE = '''
+class Model:
+    def predict(self, frame):
+        return frame['a'] * 2 + frame['b']
+
+
+def _load_pyfunc(path):
+    return Model()
+'''
+
+STREAMING = '''
+from sagemaker_mlflow_container._transform import transform
+stats = transform({model_path!r}, {input_dir!r}, {output_dir!r})
+result = {{'rows': stats.rows, 'seconds': stats.seconds}}
+'''
+
+# both scripts are timed from model loading to the written output
+IN_MEMORY = '''
+import os, time
+start = time.monotonic()
+import mlflow.pyfunc
+import pandas as pd
+model = mlflow.pyfunc.load_model({model_path!r})
+frame = pd.read_csv(os.path.join({input_dir!r}, 'input.csv'))
+pd.DataFrame(model.predict(frame)).to_csv(os.path.join({output_dir!r}, 'input.csv.out'), header=False, index=False)
+result = {{'rows': len(frame), 'seconds': time.monotonic() - start}}
+'''
+
+REPORT = '''
+import json, resource
+result['rss_mb'] = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+print(json.dumps(result))
+'''
+
+
+@pytest.fixture(scope='module')
+def transform_input(tmp_path_factory):
+    import mlflow.pyfunc
+
+    root = tmp_path_factory.mktemp('transform')
+    loader = root / 'benchmark_transform_loader.py'
+    loader.write_text(LOADER_MODULE)
+    model_path = str(root / 'model')
+    mlflow.pyfunc.save_model(model_path, loader_module='benchmark_transform_loader', code_paths=[str(loader)])
+
+    input_dir = root / 'input'
+    input_dir.mkdir()
+    with open(str(input_dir / 'input.csv'), 'w') as f:
+        f.write('a,b,c\n')
+        for i in range(ROWS):
+            f.write(f'{i},{i % 7},{"x" * 16}\n')
+    return model_path, str(input_dir)
+
+
+@pytest.mark.parametrize('name,script', [('in-memory', IN_MEMORY), ('streaming', STREAMING)])
+def test_transform_throughput(transform_input, tmp_path, name, script):
+    model_path, input_dir = transform_input
+    code = script.format(model_path=model_path, input_dir=input_dir, output_dir=str(tmp_path)) + REPORT
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(SRC_DIR))
+    output = subprocess.run([sys.executable, '-c', code], env=env, stdout=subprocess.PIPE, check=True,
+                            universal_newlines=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result['rows'] == ROWS
+    with open(join(str(tmp_path), 'input.csv.out'), 'rb') as f:
+        assert sum(1 for _ in f) == ROWS
+    print(f'\n{name:>10}: {ROWS} rows in {result["seconds"]:.2f}s '
+          f'({ROWS / result["seconds"]:.0f} rows/s), peak RSS {result["rss_mb"]:.0f} MB')
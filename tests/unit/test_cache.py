@@ -0,0 +1,37 @@
+import os
+
+from sagemaker_mlflow_container._cache import DirCache
+
+
+def _fill(size):
+    def fill(dst):
+        os.makedirs(dst)
+        with open(os.path.join(dst, 'file'), 'wb') as f:
+            f.write(b'0' * size)
+    return fill
+
+
+def test_dir_cache_get_put(tmpdir):
+    cache = DirCache(str(tmpdir), 1024 * 1024)
+
+    assert cache.get('key') is None
+
+    data = cache.put('key', _fill(10))
+    assert os.path.getsize(os.path.join(data, 'file')) == 10
+    assert cache.get('key') == data
+
+
+def test_dir_cache_evicts_least_recently_used(tmpdir):
+    cache = DirCache(str(tmpdir), 2500)
+
+    cache.put('first', _fill(1000))
+    cache.put('second', _fill(1000))
+    os.utime(os.path.join(str(tmpdir), 'first'), (0, 0))
+    os.utime(os.path.join(str(tmpdir), 'second'), (1, 1))
+    cache.get('first')
+
+    cache.put('third', _fill(1000))
+
+    assert cache.get('first') is not None
+    assert cache.get('second') is None
+    assert cache.get('third') is not None
@@ -0,0 +1,89 @@
+import os
+import struct
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._code import ProjectFiles
+from sagemaker_mlflow_container.channels import RECORDIO_MAGIC, channel_files, epoch_path, is_pipe, read_chunks, \
+    read_lines, read_records
+from sagemaker_mlflow_container.training import _channel_hyper_params, _pipe_channels
+
+
+def _record(data, cflag=0):
+    return struct.pack('<II', RECORDIO_MAGIC, (cflag << 29) | len(data)) + data + b'\0' * (-len(data) % 4)
+
+
+def _write_fifo(path, data):
+    os.mkfifo(path)
+
+    def write():
+        with open(path, 'wb') as f:
+            for i in range(0, len(data), 1000):
+                f.write(data[i:i + 1000])
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_read_file_channel(tmp_path):
+    (tmp_path / 'b').mkdir()
+    (tmp_path / 'b' / 'part-1.csv').write_bytes(b'3\n4\n')
+    (tmp_path / 'a.csv').write_bytes(b'1\n2\n')
+    (tmp_path / '.manifest').write_bytes(b'hidden\n')
+
+    assert channel_files(str(tmp_path)) == [str(tmp_path / 'a.csv'), str(tmp_path / 'b' / 'part-1.csv')]
+    assert list(read_lines(str(tmp_path))) == [b'1\n', b'2\n', b'3\n', b'4\n']
+    assert b''.join(read_chunks(str(tmp_path), size=3)) == b'1\n2\n3\n4\n'
+
+
+def test_read_pipe_channel(tmp_path):
+    lines = [f'{i},{i * 2}\n'.encode() for i in range(10000)]
+    fifo = str(tmp_path / 'train_0')
+    writer = _write_fifo(fifo, b''.join(lines))
+
+    assert is_pipe(fifo) and not is_pipe(str(tmp_path)) and not is_pipe(str(tmp_path / 'train_1'))
+    assert list(read_lines(fifo)) == lines
+    writer.join()
+    assert epoch_path(fifo, 12) == str(tmp_path / 'train_12')
+
+
+def test_read_records(tmp_path):
+    fifo = str(tmp_path / 'train_0')
+    data = _record(b'first') + _record(b'abc', 1) + _record(b'def', 2) + _record(b'g', 3) + _record(b'')
+    writer = _write_fifo(fifo, data)
+
+    assert list(read_records(fifo)) == [b'first', b'abcdefg', b'']
+    writer.join()
+
+    (tmp_path / 'broken').write_bytes(_record(b'first')[:-4])
+    with pytest.raises(ValueError):
+        list(read_records(str(tmp_path / 'broken')))
+    (tmp_path / 'broken').write_bytes(b'\0' * 8)
+    with pytest.raises(ValueError):
+        list(read_records(str(tmp_path / 'broken')))
+
+
+def test_channel_hyper_params():
+    train_env = SimpleNamespace(
+        channel_input_dirs={'train': '/opt/ml/input/data/train', 'test': '/opt/ml/input/data/test',
+                            'extra': '/opt/ml/input/data/extra',
+                            const.CONDA_SNAPSHOT_CHANNEL: '/opt/ml/input/data/conda_snapshot'},
+        input_data_config={'train': {'TrainingInputMode': 'Pipe'}, 'test': {'TrainingInputMode': 'File'}},
+    )
+    project_files = ProjectFiles('conda.yaml', entry_points={
+        'main': {'train': {'type': 'path'}, 'test': {'type': 'path'}, 'alpha': {'type': 'float'},
+                 const.CONDA_SNAPSHOT_CHANNEL: {'type': 'path'}},
+        'validate': {'test': {'type': 'path'}},
+    })
+
+    assert _channel_hyper_params(train_env, project_files, {'alpha': 0.5}, {}) == {
+        'alpha': 0.5, 'train': '/opt/ml/input/data/train_0', 'test': '/opt/ml/input/data/test',
+    }
+    assert _channel_hyper_params(train_env, project_files, {'test': 's3://bucket/test'},
+                                 {const.MLFLOW_ENTRY_POINT_PARAM: 'validate'}) == {'test': 's3://bucket/test'}
+    assert _channel_hyper_params(train_env, ProjectFiles('conda.yaml'), {}, {}) == {}
+    assert _pipe_channels(train_env) == ['train']
@@ -0,0 +1,110 @@
+import json
+import os
+import subprocess
+from unittest.mock import patch
+
+import pytest
+from sagemaker_mlflow_container import _checkers
+from sagemaker_mlflow_container._checkers import EnvProbe, _probe_env, _reprobe_env
+from sagemaker_mlflow_container.errors import CondaIsNotInstalled, CondaTrainingEnvIsNotCreated, \
+    MLFlowIsNotInstalledInConda
+
+
+@pytest.fixture(autouse=True)
+def clear_probe_cache():
+    _probe_env.cache_clear()
+    yield
+    _probe_env.cache_clear()
+
+
+def _make_env(tmpdir, with_mlflow=True):
+    prefix = tmpdir / 'envs' / 'training'
+    (prefix / 'conda-meta').ensure(dir=True)
+    (prefix / 'bin').ensure(dir=True)
+    if with_mlflow:
+        mlflow_bin = prefix / 'bin' / 'mlflow'
+        mlflow_bin.write('#!/bin/sh\n')
+        mlflow_bin.chmod(0o755)
+        (prefix / 'lib' / 'python3.6' / 'site-packages' / 'mlflow-1.7.0.dist-info').ensure(dir=True)
+    return str(prefix)
+
+
+def _conda_info_process(tmpdir, prefix):
+    info = {
+        'conda_version': '4.8.2',
+        'root_prefix': '/opt/conda',
+        'envs_dirs': [str(tmpdir / 'envs')],
+        'envs': ['/opt/conda', prefix],
+    }
+    return subprocess.CompletedProcess([], 0, stdout=json.dumps(info).encode(), stderr=b'')
+
+
+def test_probe_env(tmpdir):
+    prefix = _make_env(tmpdir)
+
+    with patch('subprocess.run') as run_mock:
+        run_mock.return_value = _conda_info_process(tmpdir, prefix)
+
+        probe = _probe_env('training')
+        # memoized for the process
+        assert _probe_env('training') is probe
+
+    run_mock.assert_called_once()
+    assert probe == EnvProbe(conda_version='4.8.2', env_prefix=prefix, mlflow_version='1.7.0')
+    assert probe.bin_path == os.path.join(prefix, 'bin')
+
+
+def test_reprobe_env(tmpdir):
+    prefix = _make_env(tmpdir)
+
+    with patch('subprocess.run') as run_mock:
+        run_mock.return_value = _conda_info_process(tmpdir, prefix)
+        probe = _probe_env('training')
+
+        # env update replaced mlflow package
+        os.rmdir(os.path.join(prefix, 'lib', 'python3.6', 'site-packages', 'mlflow-1.7.0.dist-info'))
+        os.mkdir(os.path.join(prefix, 'lib', 'python3.6', 'site-packages', 'mlflow-1.8.0.dist-info'))
+        assert _reprobe_env('training') == probe._replace(mlflow_version='1.8.0')
+        assert _probe_env('training').mlflow_version == '1.8.0'
+
+    run_mock.assert_called_once()
+
+
+def test_probe_env_conda_is_not_installed():
+    with patch('subprocess.run', side_effect=FileNotFoundError('conda')):
+        with pytest.raises(CondaIsNotInstalled):
+            _probe_env('training')
+
+
+def test_probe_env_training_env_is_not_created(tmpdir):
+    with patch('subprocess.run') as run_mock:
+        run_mock.return_value = _conda_info_process(tmpdir, '/opt/conda/envs/another')
+        with pytest.raises(CondaTrainingEnvIsNotCreated):
+            _probe_env('training')
+
+
+def test_probe_env_mlflow_is_not_installed(tmpdir):
+    prefix = _make_env(tmpdir, with_mlflow=False)
+    with patch('subprocess.run') as run_mock:
+        run_mock.return_value = _conda_info_process(tmpdir, prefix)
+        with pytest.raises(MLFlowIsNotInstalledInConda):
+            _probe_env('training')
+
+
+def test_probe_env_stamp(tmpdir):
+    prefix = _make_env(tmpdir)
+    stamp_file = str(tmpdir / 'probe.json')
+
+    with patch.object(_checkers.const, 'ENV_PROBE_STAMP_FILE', stamp_file), patch('subprocess.run') as run_mock:
+        run_mock.return_value = _conda_info_process(tmpdir, prefix)
+        probe = _probe_env('training')
+
+        _probe_env.cache_clear()
+        assert _probe_env('training') == probe
+        run_mock.assert_called_once()
+
+        # env was modified so the stamp is outdated
+        _probe_env.cache_clear()
+        os.utime(os.path.join(prefix, 'conda-meta'), (0, 0))
+        _probe_env('training')
+        assert run_mock.call_count == 2
@@ -0,0 +1,99 @@
+import os
+import time
+from unittest.mock import patch
+
+from sagemaker_mlflow_container._checkpoint import CheckpointSyncer, checkpoint_sync, resumed_run_id
+
+
+def test_sync_only_changes(tmpdir):
+    src = tmpdir.mkdir('artifacts')
+    (src / 'model.bin').write_binary(b'm' * 100)
+    src.mkdir('logs').join('log.txt').write('a')
+    syncer = CheckpointSyncer(str(src), str(tmpdir / 'checkpoints'), max_bytes_per_second=0)
+
+    assert syncer.sync() == (2, 0, 101)
+    assert (tmpdir / 'checkpoints' / 'artifacts' / 'logs' / 'log.txt').read() == 'a'
+    assert syncer.sync() == (0, 0, 0)
+
+    # touched but not changed file is not copied again
+    os.utime(str(src / 'model.bin'), ns=(time.time_ns() + 10 ** 9,) * 2)
+    assert syncer.sync() == (0, 0, 0)
+
+    (src / 'logs' / 'log.txt').write('ab')
+    (src / 'model.bin').remove()
+    assert syncer.sync() == (1, 1, 2)
+    assert sorted(os.listdir(str(tmpdir / 'checkpoints' / 'artifacts'))) == ['logs']
+
+
+def test_sync_state_survives_restart(tmpdir):
+    src = tmpdir.mkdir('artifacts')
+    (src / 'model.bin').write('m')
+    CheckpointSyncer(str(src), str(tmpdir / 'checkpoints'), max_bytes_per_second=0).sync()
+
+    assert CheckpointSyncer(str(src), str(tmpdir / 'checkpoints'), max_bytes_per_second=0).sync() == (0, 0, 0)
+
+
+def test_sync_rate_limit(tmpdir):
+    src = tmpdir.mkdir('artifacts')
+    (src / 'model.bin').write_binary(b'm' * 2 * 1024 * 1024)
+    syncer = CheckpointSyncer(str(src), str(tmpdir / 'checkpoints'), max_bytes_per_second=10 * 1024 * 1024)
+
+    start = time.monotonic()
+    syncer.sync()
+    assert time.monotonic() - start >= 0.2
+
+
+def test_failed_final_sync_does_not_fail_training(tmpdir):
+    syncer = CheckpointSyncer(str(tmpdir.mkdir('artifacts')), str(tmpdir / 'checkpoints'), max_bytes_per_second=0)
+
+    with patch.object(syncer, 'sync', side_effect=OSError('No space left on device')):
+        syncer.stop()
+
+
+def test_checkpoint_sync_and_restore(tmpdir):
+    checkpoints = tmpdir.mkdir('checkpoints')
+    artifacts = tmpdir / 'run' / 'artifacts'
+
+    with checkpoint_sync('run1', f'file://{artifacts}', str(checkpoints)):
+        artifacts.join('epoch1.ckpt').write('1', ensure=True)
+
+    assert resumed_run_id(str(checkpoints)) == 'run1'
+    assert (checkpoints / 'artifacts' / 'epoch1.ckpt').read() == '1'
+
+    # job is restarted on a new instance
+    artifacts.remove()
+    with checkpoint_sync('run1', f'file://{artifacts}', str(checkpoints)):
+        assert (artifacts / 'epoch1.ckpt').read() == '1'
+        artifacts.join('epoch2.ckpt').write('2')
+
+    assert sorted(os.listdir(str(checkpoints / 'artifacts'))) == ['epoch1.ckpt', 'epoch2.ckpt']
+
+
+def test_checkpoint_of_another_run(tmpdir):
+    checkpoints = tmpdir.mkdir('checkpoints')
+    with checkpoint_sync('run1', f'file://{tmpdir / "run1"}', str(checkpoints)):
+        tmpdir.join('run1', 'model.pkl').write('1', ensure=True)
+
+    # checkpointed run is lost, its artifacts are carried over only on demand
+    with checkpoint_sync('run2', f'file://{tmpdir / "run2"}', str(checkpoints), carry_over=True):
+        assert (tmpdir / 'run2' / 'model.pkl').read() == '1'
+
+    # e.g. run id is set explicitly
+    with checkpoint_sync('run3', f'file://{tmpdir / "run3"}', str(checkpoints)):
+        assert not os.listdir(str(tmpdir / 'run3'))
+        tmpdir.join('run3', 'other.pkl').write('3')
+
+    assert resumed_run_id(str(checkpoints)) == 'run3'
+    assert os.listdir(str(checkpoints / 'artifacts')) == ['other.pkl']
+
+
+def test_checkpoint_sync_disabled(tmpdir):
+    artifacts = tmpdir / 'artifacts'
+
+    with checkpoint_sync('run1', f'file://{artifacts}', str(tmpdir / 'missing')):
+        pass
+    with checkpoint_sync('run1', 's3://bucket/artifacts', str(tmpdir)):
+        pass
+
+    assert not artifacts.exists()
+    assert resumed_run_id(str(tmpdir)) is None
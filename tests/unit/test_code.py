@@ -0,0 +1,236 @@
+import io
+import os
+import tarfile
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sagemaker_mlflow_container import _code
+from sagemaker_mlflow_container._code import CodeExtractor, ProjectFiles
+
+
+def _make_archive(tmpdir, files):
+    archive = str(tmpdir / 'sourcedir.tar.gz')
+    src = tmpdir / 'src'
+    for name, content in files.items():
+        (src / name).write(content, ensure=True)
+    with tarfile.open(archive, 'w:gz') as tar:
+        for name in files:
+            tar.add(str(src / name), arcname=name)
+    return archive
+
+
+def test_code_extractor(tmpdir):
+    archive = _make_archive(tmpdir, {
+        'MLproject': 'conda_env: deps/conda.yaml\n',
+        'deps/conda.yaml': 'dependencies: []\n',
+        'train.py': 'print(1)\n',
+    })
+    code_dir = str(tmpdir / 'code')
+    code = CodeExtractor(archive, code_dir)
+
+    waiter_result = []
+    waiter = threading.Thread(target=lambda: waiter_result.append(code.wait_project_files()))
+    waiter.start()
+
+    code.download_and_extract()
+    waiter.join(5)
+
+    assert waiter_result == [ProjectFiles(os.path.join(code_dir, 'deps/conda.yaml'), entry_points={})]
+    assert os.path.exists(os.path.join(code_dir, 'train.py'))
+
+
+def test_code_extractor_without_mlproject(tmpdir):
+    archive = _make_archive(tmpdir, {'train.py': 'print(1)\n'})
+    code = CodeExtractor(archive, str(tmpdir / 'code'))
+
+    with pytest.raises(ValueError):
+        code.download_and_extract()
+    with pytest.raises(ValueError):
+        code.wait_project_files()
+
+
+def test_code_extractor_skips_members_outside_code_dir(tmpdir):
+    archive = str(tmpdir / 'evil.tar.gz')
+    (tmpdir / 'MLproject').write('name: evil\n')
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(str(tmpdir / 'MLproject'), arcname='MLproject')
+        tar.add(str(tmpdir / 'MLproject'), arcname='../outside')
+
+    code = CodeExtractor(archive, str(tmpdir / 'code'))
+    code.download_and_extract()
+
+    assert not (tmpdir / 'outside').exists()
+
+
+def test_code_extractor_skips_links_outside_code_dir(tmpdir):
+    archive = str(tmpdir / 'evil.tar.gz')
+    (tmpdir / 'MLproject').write('name: evil\n')
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(str(tmpdir / 'MLproject'), arcname='MLproject')
+        for name, link_type, target in [('abs', tarfile.SYMTYPE, str(tmpdir)), ('rel', tarfile.SYMTYPE, '../..'),
+                                        ('hard', tarfile.LNKTYPE, '../MLproject'),
+                                        ('inner', tarfile.SYMTYPE, 'MLproject')]:
+            info = tarfile.TarInfo(name)
+            info.type, info.linkname = link_type, target
+            tar.addfile(info)
+
+    code = CodeExtractor(archive, str(tmpdir / 'code'))
+    code.download_and_extract()
+
+    assert sorted(os.listdir(str(tmpdir / 'code'))) == ['MLproject', 'inner']
+
+
+def _extract_recording_ready(code):
+    ready_at = []
+    original = code._mark_project_files_ready
+
+    def mark_ready():
+        ready_at.append(sorted(os.listdir(code.code_dir)))
+        original()
+
+    with patch.object(code, '_mark_project_files_ready', side_effect=mark_ready):
+        code.download_and_extract()
+    return ready_at
+
+
+def test_code_extractor_finds_lock_files(tmpdir):
+    archive = _make_archive(tmpdir, {
+        'conda.lock': '@EXPLICIT\n',
+        'requirements.lock': 'mlflow==1.10.0\n',
+        'MLproject': 'conda_env: conda.yaml\n',
+        'conda.yaml': 'dependencies: []\n',
+        'train.py': 'print(1)\n',
+    })
+    code_dir = str(tmpdir / 'code')
+    code = CodeExtractor(archive, code_dir)
+
+    # project files are ready before the rest of archive is extracted
+    assert _extract_recording_ready(code) == [['MLproject', 'conda.lock', 'conda.yaml', 'requirements.lock']]
+    assert code.wait_project_files() == ProjectFiles(
+        os.path.join(code_dir, 'conda.yaml'), conda_lock_file=os.path.join(code_dir, 'conda.lock'),
+        pip_lock_file=os.path.join(code_dir, 'requirements.lock'), entry_points={})
+
+
+def test_code_extractor_finds_lock_files_after_mlproject(tmpdir):
+    archive = _make_archive(tmpdir, {
+        'MLproject': 'conda_env: conda.yaml\n',
+        'conda.yaml': 'dependencies: []\n',
+        'train.py': 'print(1)\n',
+        'conda.lock': '@EXPLICIT\n',
+    })
+    code_dir = str(tmpdir / 'code')
+    cache_dir = str(tmpdir / 'cache')
+    code = CodeExtractor(archive, code_dir)
+
+    with patch.object(_code.const, 'CODE_CACHE_DIR', cache_dir):
+        # lock file may follow, so project files are ready only when the whole archive is extracted
+        assert _extract_recording_ready(code) == [['MLproject', 'conda.lock', 'conda.yaml', 'train.py']]
+        expected = ProjectFiles(os.path.join(code_dir, 'conda.yaml'),
+                                conda_lock_file=os.path.join(code_dir, 'conda.lock'), entry_points={})
+        assert code.wait_project_files() == expected
+
+        cached = CodeExtractor(archive, str(tmpdir / 'cached'))
+        cached.download_and_extract()
+    assert cached.wait_project_files() == expected._replace(
+        conda_file=str(tmpdir / 'cached' / 'conda.yaml'), conda_lock_file=str(tmpdir / 'cached' / 'conda.lock'))
+
+
+PROJECT = {
+    'MLproject': 'conda_env: conda.yaml\nentry_points:\n  main:\n    parameters:\n      alpha: float\n',
+    'conda.yaml': 'dependencies: []\n',
+    'train.py': 'print(1)\n',
+}
+
+
+def test_code_cache(tmpdir):
+    archive = _make_archive(tmpdir, PROJECT)
+
+    with patch.object(_code.const, 'CODE_CACHE_DIR', str(tmpdir / 'cache')):
+        first = CodeExtractor(archive, str(tmpdir / 'code1'))
+        first.download_and_extract()
+
+        second = CodeExtractor(archive, str(tmpdir / 'code2'))
+        with patch.object(CodeExtractor, '_extract_archive', side_effect=AssertionError('extracted again')):
+            second.download_and_extract()
+
+    project_files = second.wait_project_files()
+    assert project_files == ProjectFiles(str(tmpdir / 'code2' / 'conda.yaml'),
+                                         entry_points={'main': {'alpha': 'float'}})
+    assert (tmpdir / 'code2' / 'train.py').read() == 'print(1)\n'
+
+
+def test_code_cache_miss_hashes_archive_once(tmpdir):
+    archive = _make_archive(tmpdir, PROJECT)
+
+    with patch.object(_code.const, 'CODE_CACHE_DIR', str(tmpdir / 'cache')), \
+            patch.object(_code, '_file_sha256', wraps=_code._file_sha256) as file_sha256:
+        CodeExtractor(archive, str(tmpdir / 'code')).download_and_extract()
+
+    file_sha256.assert_called_once_with(archive)
+    assert len((tmpdir / 'cache').listdir()) == 1
+
+
+def test_code_cache_miss_on_changed_archive(tmpdir):
+    archive = _make_archive(tmpdir, PROJECT)
+
+    with patch.object(_code.const, 'CODE_CACHE_DIR', str(tmpdir / 'cache')):
+        CodeExtractor(archive, str(tmpdir / 'code1')).download_and_extract()
+        archive = _make_archive(tmpdir, {**PROJECT, 'train.py': 'print(2)\n'})
+        CodeExtractor(archive, str(tmpdir / 'code2')).download_and_extract()
+
+    assert (tmpdir / 'code2' / 'train.py').read() == 'print(2)\n'
+    assert len((tmpdir / 'cache').listdir()) == 2
+
+
+def test_code_extractor_streams_s3_archive(tmpdir):
+    with open(_make_archive(tmpdir, PROJECT), 'rb') as f:
+        data = f.read()
+    s3 = MagicMock()
+    s3.head_object.return_value = {'ETag': '"etag"'}
+    s3.get_object.side_effect = lambda **kwargs: {'ETag': '"etag"', 'Body': io.BytesIO(data)}
+
+    with patch.object(_code, '_s3_client', return_value=s3), \
+            patch.object(_code.const, 'CODE_CACHE_DIR', str(tmpdir / 'cache')):
+        CodeExtractor('s3://bucket/sourcedir.tar.gz', str(tmpdir / 'code1')).download_and_extract()
+        CodeExtractor('s3://bucket/sourcedir.tar.gz', str(tmpdir / 'code2')).download_and_extract()
+
+    s3.get_object.assert_called_once_with(Bucket='bucket', Key='sourcedir.tar.gz')
+    assert (tmpdir / 'code1' / 'train.py').read() == (tmpdir / 'code2' / 'train.py').read() == 'print(1)\n'
+
+
+def test_code_extractor_error_is_raised_to_waiters(tmpdir):
+    archive = _make_archive(tmpdir, PROJECT)
+    with open(archive, 'rb') as f:
+        data = f.read()
+    with open(archive, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    code = CodeExtractor(archive, str(tmpdir / 'code'))
+
+    waiter_errors = []
+
+    def wait():
+        try:
+            code.wait_project_files()
+        except Exception as e:
+            waiter_errors.append(e)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    with pytest.raises(Exception) as e:
+        code.download_and_extract()
+    waiter.join(5)
+
+    assert waiter_errors == [e.value]
+
+
+def test_cancelled_code_extractor(tmpdir):
+    archive = _make_archive(tmpdir, PROJECT)
+    code = CodeExtractor(archive, str(tmpdir / 'code'))
+    code.cancel()
+
+    with pytest.raises(RuntimeError):
+        code.download_and_extract()
+    with pytest.raises(RuntimeError):
+        code.wait_project_files()
+    assert not os.listdir(str(tmpdir / 'code'))
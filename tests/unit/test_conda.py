@@ -0,0 +1,130 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from sagemaker_mlflow_container import _conda
+from sagemaker_mlflow_container._conda import _capture_lock_files, _conda_spec_hash, _env_cache_key, \
+    _install_from_lock_files, _is_env_up_to_date, _lock_spec_hash, _normalize_dependency, _restore_env_from_cache, \
+    _save_env_to_cache, _write_stamp
+
+
+def _make_env(tmpdir, packages):
+    prefix = tmpdir / 'env'
+    meta = prefix / 'conda-meta'
+    meta.ensure(dir=True)
+    for p in packages:
+        (meta / f'{p}.json').write('{}')
+    return str(prefix)
+
+
+def test_normalize_dependency():
+    assert _normalize_dependency('NumPy >= 1.18') == 'numpy>=1.18'
+    assert _normalize_dependency('scikit-learn') == 'scikit-learn'
+
+
+def test_conda_spec_hash_ignores_insignificant_changes(tmpdir):
+    first = tmpdir / 'first.yaml'
+    second = tmpdir / 'second.yaml'
+    third = tmpdir / 'third.yaml'
+
+    first.write('name: a\nchannels: [defaults]\ndependencies: [python=3.6, numpy, {pip: [mlflow]}]\n')
+    second.write('name: b\nchannels: [defaults]\ndependencies: [NumPy, python = 3.6, {pip: [mlflow]}]\n')
+    third.write('name: a\nchannels: [conda-forge]\ndependencies: [python=3.6, numpy, {pip: [mlflow]}]\n')
+
+    assert _conda_spec_hash(str(first)) == _conda_spec_hash(str(second))
+    assert _conda_spec_hash(str(first)) != _conda_spec_hash(str(third))
+
+
+def test_stamp(tmpdir):
+    prefix = _make_env(tmpdir, ['python-3.6.0-0'])
+
+    assert not _is_env_up_to_date('hash', prefix)
+
+    _write_stamp('hash', prefix)
+    assert _is_env_up_to_date('hash', prefix)
+    assert not _is_env_up_to_date('another-hash', prefix)
+
+    # env was changed after update
+    (tmpdir / 'env' / 'conda-meta' / 'numpy-1.18.0-0.json').write('{}')
+    assert not _is_env_up_to_date('hash', prefix)
+
+
+def test_env_cache_key_depends_on_installed_packages(tmpdir):
+    prefix = _make_env(tmpdir, ['python-3.6.0-0'])
+    key = _env_cache_key('hash', prefix)
+
+    (tmpdir / 'env' / 'conda-meta' / 'python-3.7.0-0.json').write('{}')
+    assert _env_cache_key('hash', prefix) != key
+
+
+def test_restore_and_save_env_cache(tmpdir):
+    prefix = _make_env(tmpdir, ['python-3.6.0-0'])
+    cache_dir = str(tmpdir / 'cache')
+
+    with patch.object(_conda.const, 'CONDA_ENV_CACHE_DIR', cache_dir):
+        assert not _restore_env_from_cache('key', prefix)
+
+        _save_env_to_cache('key', prefix)
+        (tmpdir / 'env' / 'conda-meta' / 'python-3.6.0-0.json').remove()
+
+        assert _restore_env_from_cache('key', prefix)
+        assert os.path.exists(os.path.join(prefix, 'conda-meta', 'python-3.6.0-0.json'))
+
+
+def test_env_cache_disabled(tmpdir):
+    prefix = _make_env(tmpdir, [])
+
+    with patch.object(_conda.const, 'CONDA_ENV_CACHE_DIR', ''):
+        _save_env_to_cache('key', prefix)
+        assert not _restore_env_from_cache('key', prefix)
+
+
+def test_lock_spec_hash(tmpdir):
+    conda_lock = tmpdir / 'conda.lock'
+    pip_lock = tmpdir / 'requirements.lock'
+    conda_lock.write('@EXPLICIT\nhttps://repo.anaconda.com/pkgs/main/linux-64/python-3.6.0-0.tar.bz2#abc\n')
+    pip_lock.write('mlflow==1.8.0\n')
+
+    key = _lock_spec_hash(str(conda_lock), str(pip_lock))
+    assert key != _lock_spec_hash(str(conda_lock), None)
+
+    pip_lock.write('mlflow==1.9.0\n')
+    assert key != _lock_spec_hash(str(conda_lock), str(pip_lock))
+
+
+def test_capture_lock_files(tmpdir):
+    def fake_check_error(cmd, error_class, capture_error, terminator, stdout):
+        stdout.write(' '.join(cmd))
+
+    with patch.object(_conda, 'check_error', side_effect=fake_check_error):
+        lock_dir = _capture_lock_files('/opt/env')
+
+    with open(os.path.join(lock_dir, 'conda.lock')) as f:
+        assert f.read() == 'conda list --explicit --md5 --prefix /opt/env'
+    with open(os.path.join(lock_dir, 'requirements.lock')) as f:
+        assert f.read() == '/opt/env/bin/python -m pip list --format=freeze'
+
+
+def test_install_from_lock_files():
+    with patch.object(_conda, 'check_error') as check_error:
+        _install_from_lock_files('training', '/opt/env', 'conda.lock', 'requirements.lock')
+
+    assert [c[0][0] for c in check_error.call_args_list] == [
+        ['conda', 'install', '--yes', '--name', 'training', '--file', 'conda.lock'],
+        ['/opt/env/bin/python', '-m', 'pip', 'install', '--no-deps', '-r', 'requirements.lock'],
+    ]
+
+
+def test_failed_env_cache_restore_keeps_env(tmpdir):
+    prefix = _make_env(tmpdir, ['python-3.6.0-0'])
+    cache_dir = str(tmpdir / 'cache')
+
+    with patch.object(_conda.const, 'CONDA_ENV_CACHE_DIR', cache_dir):
+        _save_env_to_cache('key', prefix)
+        with patch.object(_conda.shutil, 'copytree', side_effect=OSError('No space left on device')):
+            with pytest.raises(OSError):
+                _restore_env_from_cache('key', prefix)
+
+    assert os.path.exists(os.path.join(prefix, 'conda-meta', 'python-3.6.0-0.json'))
+    assert sorted(os.listdir(str(tmpdir))) == ['cache', 'env']
@@ -0,0 +1,65 @@
+import os
+import sys
+import tarfile
+from unittest.mock import patch
+
+import pytest
+from sagemaker_mlflow_container._conda_pack import find_snapshot, restore_env
+
+
+@pytest.fixture
+def packed_env(tmpdir):
+    """
+    Archive with the same layout as conda-pack creates
+    """
+    env = tmpdir / 'packed'
+    (env / 'conda-meta' / 'numpy-1.18.0-0.json').write('{}', ensure=True)
+    (env / 'bin').ensure(dir=True)
+    # absolute symlinks are rejected by extraction filter
+    (env / 'bin' / 'python').write(f'#!/bin/sh\nexec {sys.executable} "$@"\n')
+    (env / 'bin' / 'python').chmod(0o755)
+    (env / 'bin' / 'conda-unpack').write('import os\nopen(os.path.join(os.path.dirname(__file__), "unpacked"), "w")\n')
+
+    snapshot_dir = tmpdir / 'snapshots'
+    snapshot_dir.ensure(dir=True)
+    archive = str(snapshot_dir / 'key.tar.gz')
+    with tarfile.open(archive, 'w:gz') as tar:
+        for name in os.listdir(str(env)):
+            tar.add(str(env / name), arcname=name)
+    return str(snapshot_dir)
+
+
+def test_find_snapshot(packed_env):
+    assert find_snapshot(packed_env, 'key') == os.path.join(packed_env, 'key.tar.gz')
+    assert find_snapshot(packed_env, 'another-key') is None
+    assert find_snapshot(None, 'key') is None
+
+
+@pytest.mark.parametrize('with_pigz', [True, False])
+def test_restore_env(packed_env, tmpdir, with_pigz):
+    env_prefix = tmpdir / 'envs' / 'training'
+    (env_prefix / 'conda-meta' / 'old-1.0-0.json').write('{}', ensure=True)
+
+    with patch('shutil.which', side_effect=lambda name: 'gzip' if with_pigz else None):
+        restore_env(os.path.join(packed_env, 'key.tar.gz'), str(env_prefix))
+
+    assert (env_prefix / 'conda-meta' / 'numpy-1.18.0-0.json').exists()
+    assert not (env_prefix / 'conda-meta' / 'old-1.0-0.json').exists()
+    assert (env_prefix / 'bin' / 'unpacked').exists()
+
+
+def test_failed_restore_env_keeps_env(packed_env, tmpdir):
+    env_prefix = tmpdir / 'envs' / 'training'
+    (env_prefix / 'conda-meta' / 'old-1.0-0.json').write('{}', ensure=True)
+    archive = os.path.join(packed_env, 'key.tar.gz')
+    with open(archive, 'rb') as f:
+        data = f.read()
+    with open(archive, 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+    with patch('shutil.which', return_value=None):
+        with pytest.raises(Exception):
+            restore_env(archive, str(env_prefix))
+
+    assert (env_prefix / 'conda-meta' / 'old-1.0-0.json').exists()
+    assert os.listdir(str(tmpdir / 'envs')) == ['training']
@@ -0,0 +1,64 @@
+import hashlib
+import os
+
+import pytest
+from sagemaker_mlflow_container._conda_pkgs import conda_environ, prefetch_packages, read_explicit_lockfile
+
+
+def _make_channel(tmpdir, packages):
+    """
+    Create local file based conda channel and explicit lockfile listing its packages
+    """
+    channel = tmpdir.mkdir('channel').mkdir('linux-64')
+    lines = ['# platform: linux-64', '@EXPLICIT']
+    for name, content in packages.items():
+        (channel / name).write_binary(content)
+        lines.append(f'file://{channel / name}#{hashlib.md5(content).hexdigest()}')
+    lockfile = tmpdir / 'conda.lock'
+    lockfile.write('\n'.join(lines) + '\n')
+    return str(lockfile)
+
+
+def test_read_explicit_lockfile(tmpdir):
+    lockfile = tmpdir / 'conda.lock'
+    lockfile.write('# comment\n@EXPLICIT\nhttps://repo/linux-64/numpy-1.18.1-py36_0.tar.bz2#abc\n'
+                   'https://repo/noarch/six-1.14.0-py_0.conda\n')
+
+    packages = read_explicit_lockfile(str(lockfile))
+
+    assert [(p.file_name, p.md5) for p in packages] == [
+        ('numpy-1.18.1-py36_0.tar.bz2', 'abc'),
+        ('six-1.14.0-py_0.conda', None),
+    ]
+
+
+def test_prefetch_packages(tmpdir):
+    lockfile = _make_channel(tmpdir, {'numpy-1.18.1-0.tar.bz2': b'n' * 100, 'six-1.14.0-0.tar.bz2': b's' * 10})
+    pkgs_dir = str(tmpdir / 'pkgs')
+
+    stats = prefetch_packages(lockfile, pkgs_dir, workers=2)
+    assert (stats.hits, stats.misses, stats.bytes_downloaded, stats.bytes_saved) == (0, 2, 110, 0)
+    assert sorted(os.listdir(pkgs_dir)) == ['numpy-1.18.1-0.tar.bz2', 'six-1.14.0-0.tar.bz2', 'urls.txt']
+
+    # corrupted package is downloaded again
+    (tmpdir / 'pkgs' / 'six-1.14.0-0.tar.bz2').write_binary(b'x')
+    stats = prefetch_packages(lockfile, pkgs_dir, workers=2)
+    assert (stats.hits, stats.misses, stats.bytes_downloaded, stats.bytes_saved) == (1, 1, 10, 100)
+
+
+def test_prefetch_packages_checksum_mismatch(tmpdir):
+    lockfile = tmpdir / 'conda.lock'
+    (tmpdir / 'numpy-1.18.1-0.tar.bz2').write_binary(b'n')
+    lockfile.write(f'@EXPLICIT\nfile://{tmpdir / "numpy-1.18.1-0.tar.bz2"}#{"0" * 32}\n')
+
+    with pytest.raises(IOError):
+        prefetch_packages(str(lockfile), str(tmpdir / 'pkgs'))
+    assert os.listdir(str(tmpdir / 'pkgs')) == []
+
+
+def test_conda_environ(tmpdir):
+    assert conda_environ('') is None
+
+    environ = conda_environ(str(tmpdir / 'pkgs'))
+    assert environ['CONDA_PKGS_DIRS'] == str(tmpdir / 'pkgs')
+    assert environ['PATH'] == os.environ['PATH']
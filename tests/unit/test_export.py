@@ -0,0 +1,116 @@
+import errno
+import gzip
+import os
+from unittest.mock import patch
+
+import pytest
+from sagemaker_mlflow_container import _export
+from sagemaker_mlflow_container._export import EXPORT_MODES, ArtifactFilter, compress_tree, export_tree
+
+
+@pytest.fixture
+def src_tree(tmpdir):
+    src = tmpdir / 'src'
+    (src / 'model' / 'MLmodel').write('flavors: {}\n', ensure=True)
+    (src / 'model' / 'model.pkl').write_binary(os.urandom(3000), ensure=True)
+    (src / 'empty.txt').write('', ensure=True)
+    (src / 'empty_dir').ensure(dir=True)
+    os.symlink('model/MLmodel', str(src / 'link'))
+    return src
+
+
+def _assert_same_tree(src, dst):
+    for root, dirs, files in os.walk(str(src)):
+        rel = os.path.relpath(root, str(src))
+        for name in dirs + files:
+            src_path = os.path.join(root, name)
+            dst_path = os.path.join(str(dst), rel, name)
+            assert os.path.lexists(dst_path)
+            assert os.path.islink(src_path) == os.path.islink(dst_path)
+            if os.path.isfile(src_path):
+                with open(src_path, 'rb') as f1, open(dst_path, 'rb') as f2:
+                    assert f1.read() == f2.read()
+
+
+@pytest.mark.parametrize('mode', EXPORT_MODES)
+def test_export_tree(src_tree, tmpdir, mode):
+    reference = tmpdir / 'reference'
+    src_tree.copy(reference, mode=True)
+    dst = tmpdir / 'dst' / 'artifacts'
+
+    stats = export_tree(str(src_tree), str(dst), mode)
+
+    _assert_same_tree(reference, dst)
+    assert stats.files == 3
+    assert stats.bytes == 3000 + len('flavors: {}\n')
+    assert stats.mode != 'auto'
+    assert os.path.exists(str(src_tree)) == (mode != 'move')
+
+
+def test_export_tree_copies_large_files_by_chunks(src_tree, tmpdir):
+    dst = tmpdir / 'dst'
+    with patch.object(_export, 'COPY_CHUNK_SIZE', 1000):
+        export_tree(str(src_tree), str(dst), 'copy', workers=3)
+    _assert_same_tree(src_tree, dst)
+
+
+def test_export_tree_dst_exists(src_tree, tmpdir):
+    with pytest.raises(FileExistsError):
+        export_tree(str(src_tree), str(tmpdir), 'copy')
+
+
+def test_export_tree_unknown_mode(src_tree, tmpdir):
+    with pytest.raises(ValueError):
+        export_tree(str(src_tree), str(tmpdir / 'dst'), 'unknown')
+
+
+def test_artifact_filter():
+    artifact_filter = ArtifactFilter(include=['model/', '*.json'], exclude=['model/*.tmp'])
+
+    assert artifact_filter('model/MLmodel') and artifact_filter('model/data/model.pkl')
+    assert artifact_filter('metrics.json')
+    assert not artifact_filter('model/weights.tmp')
+    assert not artifact_filter('plots/loss.png') and not artifact_filter('model')
+    assert ArtifactFilter(exclude=['plots/'])('model/MLmodel')
+    assert not ArtifactFilter()
+
+
+@pytest.mark.parametrize('mode', EXPORT_MODES)
+def test_export_tree_selected(src_tree, tmpdir, mode):
+    dst = tmpdir / 'dst'
+
+    stats = export_tree(str(src_tree), str(dst), mode, select=ArtifactFilter(include=['model/'], exclude=['*.pkl']))
+
+    assert stats.files == 1
+    assert sorted(os.listdir(str(dst))) == ['model']
+    assert os.listdir(str(dst / 'model')) == ['MLmodel']
+    # not selected files are left in place
+    assert (src_tree / 'model' / 'model.pkl').exists()
+
+
+def test_export_tree_selected_move_across_filesystems(src_tree, tmpdir):
+    dst = tmpdir / 'dst'
+
+    with patch.object(_export.os, 'rename', side_effect=OSError(errno.EXDEV, 'Invalid cross-device link')):
+        export_tree(str(src_tree), str(dst), 'move', select=ArtifactFilter(include=['model/']))
+
+    assert sorted(os.listdir(str(dst / 'model'))) == ['MLmodel', 'model.pkl']
+    assert not (src_tree / 'model' / 'MLmodel').exists()
+
+
+def test_compress_tree(src_tree, tmpdir):
+    (src_tree / 'logs' / 'train.log').write('line\n' * 1000, ensure=True)
+    dst = tmpdir / 'dst'
+
+    with patch.object(_export, 'COMPRESS_CHUNK_SIZE', 1000):
+        stats = compress_tree(str(src_tree), str(dst), lambda rel: not rel.startswith('model'), workers=2)
+
+    assert stats.files == 2
+    assert sorted(os.listdir(str(dst))) == ['empty.txt.gz', 'logs']
+    with gzip.open(str(dst / 'logs' / 'train.log.gz'), 'rt') as f:
+        assert f.read() == 'line\n' * 1000
+    assert (dst / 'logs' / 'train.log.gz').size() < 1000
+    # empty file is compressed into a valid gzip member, zcat fails on zero length file
+    assert (dst / 'empty.txt.gz').size() > 0
+    with gzip.open(str(dst / 'empty.txt.gz'), 'rb') as f:
+        assert f.read() == b''
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+# Budget of cumulative import time of the training module (it is imported by every runner process)
+IMPORT_TIME_BUDGET_US = int(os.environ.get('IMPORT_TIME_BUDGET_US', 500_000))
+
+# Modules that must be imported only on the code paths that need them
+HEAVY_MODULES = ('mlflow', 'boto3', 'botocore', 'urllib3', 'pandas', 'sqlalchemy', 'sagemaker_containers._env')
+
+
+def _import_times(module):
+    """
+    Return cumulative import time in microseconds of every module imported by `import module`
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_training_import_time():
+    times = _import_times('sagemaker_mlflow_container.training')
+
+    heavy = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES or name in HEAVY_MODULES)
+    assert not heavy, f'Heavy modules are imported on startup: {", ".join(heavy)}'
+
+    elapsed = times['sagemaker_mlflow_container.training']
+    assert elapsed < IMPORT_TIME_BUDGET_US, \
+        f'Import of training module takes {elapsed / 1000:.0f}ms, budget is {IMPORT_TIME_BUDGET_US / 1000:.0f}ms'
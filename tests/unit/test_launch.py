@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._launch import THREADS_ENV_VARS, LaunchProfile, launch_profile
+
+
+def test_launch_profile_defaults(monkeypatch):
+    monkeypatch.delenv('OMP_NUM_THREADS', raising=False)
+    available = sorted(os.sched_getaffinity(0))
+
+    with patch('sagemaker_mlflow_container._launch._host_memory_mb', return_value=1000):
+        default_profile = launch_profile(len(available), 0, {})
+        with patch.object(const, 'LAUNCH_MEMORY_FRACTION', 0.9):
+            cpu_profile = launch_profile(len(available), 0, {})
+            gpu_profile = launch_profile(len(available), 1, {})
+
+    assert default_profile == LaunchProfile(len(available), None, None)
+    assert cpu_profile == LaunchProfile(len(available), None, 900)
+    assert gpu_profile.memory_limit_mb is None
+
+
+def test_launch_profile_overrides():
+    available = sorted(os.sched_getaffinity(0))
+
+    profile = launch_profile(64, 0, {'num_threads': '2', 'pin_cpus': 'true', 'memory_limit_mb': '0'})
+
+    assert profile == LaunchProfile(2, available, None)
+
+
+def test_launch_profile_split():
+    profile = LaunchProfile(8, [0, 1, 2, 3, 4, 5, 6, 7], 4000)
+
+    assert profile.split(2) == [LaunchProfile(4, [0, 1, 2, 3], 2000), LaunchProfile(4, [4, 5, 6, 7], 2000)]
+    assert LaunchProfile(2, None, None).split(4) == [LaunchProfile(1, None, None)] * 4
+
+
+def test_launch_profile_applied_to_child():
+    cpu = sorted(os.sched_getaffinity(0))[0]
+    profile = LaunchProfile(3, [cpu], 4096)
+
+    # the child waits for the profile to be applied before it reports its resources
+    process = subprocess.Popen(
+        [sys.executable, '-c', 'import os, resource, sys; sys.stdin.read(); '
+                               'print(os.environ["OMP_NUM_THREADS"], os.environ["OPENBLAS_NUM_THREADS"], '
+                               'sorted(os.sched_getaffinity(0)), resource.getrlimit(resource.RLIMIT_DATA)[0])'],
+        env=profile.environ(os.environ), stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True,
+    )
+    profile.apply(process.pid)
+    output = process.communicate('')[0].strip().split(maxsplit=2)
+
+    assert output == ['3', '3', f'[{cpu}] {4096 * 1024 * 1024}']
+    assert set(profile.environ({})) == set(THREADS_ENV_VARS)
+    assert profile.tags()['sagemaker_mlflow_container.launch.cpus'] == str(cpu)
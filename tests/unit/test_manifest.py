@@ -0,0 +1,47 @@
+import hashlib
+import os
+
+from sagemaker_mlflow_container._manifest import ManifestEntry, build_manifest, export_manifest, read_manifest, \
+    restore_refs
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_build_manifest(tmpdir):
+    large = os.urandom(3000)
+    (tmpdir / 'model' / 'model.pkl').write_binary(large, ensure=True)
+    (tmpdir / 'metrics.json').write_binary(b'{}')
+    os.symlink('metrics.json', str(tmpdir / 'link'))
+
+    entries = build_manifest(str(tmpdir), workers=2, buffer_size=1000)
+
+    assert entries == [
+        ManifestEntry('metrics.json', 2, _sha256(b'{}')),
+        ManifestEntry('model/model.pkl', 3000, _sha256(large)),
+    ]
+
+
+def test_export_manifest_dedup(tmpdir):
+    cas = tmpdir / 'cas'
+    embeddings = os.urandom(2048)
+    for run in ('run1', 'run2'):
+        (tmpdir / run / 'model' / 'embeddings.bin').write_binary(embeddings, ensure=True)
+        (tmpdir / run / 'model' / 'MLmodel').write(run, ensure=True)
+
+    export_manifest(str(tmpdir / 'run1'), str(tmpdir / 'run1.json'), str(cas), min_size=1024)
+    entries = export_manifest(str(tmpdir / 'run2'), str(tmpdir / 'run2.json'), str(cas), min_size=1024)
+
+    # the first run stores the large file in the store, the second one references it
+    assert [e.ref for e in read_manifest(str(tmpdir / 'run1.json'))] == [None, None]
+    stored = cas / 'sha256' / _sha256(embeddings)[:2] / _sha256(embeddings)
+    # the store keeps its own copy that isn't changed with the artifact of the first run
+    assert not os.path.samefile(str(stored), str(tmpdir / 'run1' / 'model' / 'embeddings.bin'))
+    assert read_manifest(str(tmpdir / 'run2.json')) == entries
+    assert entries[1].ref == f'cas://sha256/{_sha256(embeddings)}'
+    assert not (tmpdir / 'run2' / 'model' / 'embeddings.bin').exists()
+    assert (tmpdir / 'run2' / 'model' / 'MLmodel').exists()
+
+    restore_refs(str(tmpdir / 'run2'), entries, str(cas))
+    assert (tmpdir / 'run2' / 'model' / 'embeddings.bin').read_binary() == embeddings
@@ -0,0 +1,101 @@
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+from sagemaker_mlflow_container._pipeline import Stage, run_stages
+
+
+def test_run_stages_respects_dependencies():
+    order = []
+
+    def stage(name):
+        def func():
+            order.append(name)
+            return name
+        return func
+
+    results = run_stages([
+        Stage('c', stage('c'), requires=('a', 'b')),
+        Stage('a', stage('a')),
+        Stage('b', stage('b'), requires=('a',)),
+    ])
+
+    assert order == ['a', 'b', 'c']
+    assert results == {'a': 'a', 'b': 'b', 'c': 'c'}
+
+
+def test_run_stages_runs_independent_stages_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    run_stages([
+        Stage('first', barrier.wait),
+        Stage('second', barrier.wait),
+    ])
+
+
+def test_run_stages_propagates_first_error_and_cancels_dependent_stages():
+    called = []
+
+    def fail():
+        raise RuntimeError('failed')
+
+    with pytest.raises(RuntimeError):
+        run_stages([
+            Stage('fail', fail),
+            Stage('slow', lambda: time.sleep(0.1)),
+            Stage('dependent', lambda: called.append(True), requires=('fail', 'slow')),
+        ])
+
+    assert not called
+
+
+def test_run_stages_unknown_dependency():
+    with pytest.raises(ValueError):
+        run_stages([Stage('a', lambda: None, requires=('b',))])
+
+
+def test_run_stages_circular_dependency():
+    with pytest.raises(ValueError):
+        run_stages([Stage('a', lambda: None, requires=('b',)), Stage('b', lambda: None, requires=('a',))])
+
+
+def test_run_stages_cancels_running_stages_with_cancel_hook():
+    started = threading.Event()
+    stopped = threading.Event()
+    finished = []
+
+    def fail():
+        started.wait(5)
+        raise RuntimeError('failed')
+
+    def cancellable():
+        started.set()
+        stopped.wait(5)
+        finished.append(True)
+
+    with pytest.raises(RuntimeError):
+        run_stages([Stage('fail', fail), Stage('cancellable', cancellable, cancel=stopped.set)])
+
+    # cancelled stage is finished before the error is raised
+    assert finished == [True]
+
+
+def test_failed_pipeline_exits_without_waiting_for_abandoned_stages():
+    script = textwrap.dedent("""
+        import time
+        from sagemaker_mlflow_container._pipeline import Stage, run_stages
+
+        def fail():
+            time.sleep(0.1)
+            raise RuntimeError('failed')
+
+        run_stages([Stage('fail', fail), Stage('slow', lambda: time.sleep(30))])
+    """)
+    start = time.monotonic()
+    process = subprocess.run([sys.executable, '-c', script], stderr=subprocess.PIPE)
+
+    assert process.returncode != 0 and b'RuntimeError: failed' in process.stderr
+    assert time.monotonic() - start < 10
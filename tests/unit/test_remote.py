@@ -0,0 +1,150 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sagemaker_mlflow_container._remote import download_artifacts
+
+ARTIFACTS = {
+    'model/MLmodel': b'flavors: {}\n',
+    'model/model.pkl': os.urandom(10000),
+    'empty.txt': b'',
+}
+
+
+def _assert_downloaded(dst):
+    for path, content in ARTIFACTS.items():
+        with open(os.path.join(dst, path), 'rb') as f:
+            assert f.read() == content
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    moto = pytest.importorskip('moto')
+    boto3 = pytest.importorskip('boto3')
+    mock = getattr(moto, 'mock_aws', None) or getattr(moto, 'mock_s3')
+
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.delenv('MLFLOW_S3_ENDPOINT_URL', raising=False)
+
+    with mock():
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket='artifacts')
+        for path, content in ARTIFACTS.items():
+            s3.put_object(Bucket='artifacts', Key=f'1/run-id/artifacts/{path}', Body=content)
+        yield 'artifacts'
+
+
+def test_download_artifacts_s3(s3_bucket, tmpdir):
+    dst = str(tmpdir / 'dst')
+
+    stats = download_artifacts(f's3://{s3_bucket}/1/run-id/artifacts', 'run-id', dst, workers=4, part_size=1000)
+
+    _assert_downloaded(dst)
+    assert stats.files == len(ARTIFACTS)
+    assert stats.bytes == sum(len(c) for c in ARTIFACTS.values())
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_HEAD(self):
+        content = ARTIFACTS[self.path.split('/artifacts/', 1)[1]]
+        self.requests.append('HEAD')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+
+    def do_GET(self):
+        content = ARTIFACTS[self.path.split('/artifacts/', 1)[1]]
+        self.requests.append(self.headers['Range'])
+        if self.headers['Range'] is None:
+            body = content
+            self.send_response(200)
+        else:
+            start, end = self.headers['Range'][len('bytes='):].split('-')
+            body = content[int(start):int(end) + 1]
+            self.send_response(206)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    _RangeHandler.requests = []
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def test_download_artifacts_http(http_server, tmpdir):
+    infos = {
+        None: [MagicMock(is_dir=True, path='model'), MagicMock(is_dir=False, path='empty.txt', file_size=0)],
+        'model': [MagicMock(is_dir=False, path=p, file_size=len(c)) for p, c in ARTIFACTS.items()
+                  if p.startswith('model/')],
+    }
+    dst = str(tmpdir / 'dst')
+
+    with patch('mlflow.tracking.MlflowClient') as client_cls:
+        client_cls.return_value.list_artifacts.side_effect = lambda run_id, path: infos[path]
+        stats = download_artifacts(f'{http_server}/artifacts', 'run-id', dst, workers=4, part_size=4096)
+
+    _assert_downloaded(dst)
+    assert stats.files == len(ARTIFACTS)
+    # model.pkl is downloaded by 3 range requests
+    assert len(_RangeHandler.requests) == 4
+
+
+def test_download_artifacts_http_without_listed_sizes(http_server, tmpdir):
+    infos = [MagicMock(is_dir=False, path=p, file_size=None) for p in ('model/model.pkl', 'empty.txt')]
+    dst = str(tmpdir / 'dst')
+
+    with patch('mlflow.tracking.MlflowClient') as client_cls, \
+            patch('sagemaker_mlflow_container._remote._HttpSource._size', return_value=None):
+        client_cls.return_value.list_artifacts.side_effect = lambda run_id, path: infos
+        # server doesn't report sizes, artifacts are downloaded by one request without range
+        stats = download_artifacts(f'{http_server}/artifacts', 'run-id', dst, workers=4, part_size=4096)
+
+    assert stats.bytes == len(ARTIFACTS['model/model.pkl'])
+    for path in ('model/model.pkl', 'empty.txt'):
+        with open(os.path.join(dst, path), 'rb') as f:
+            assert f.read() == ARTIFACTS[path]
+    assert _RangeHandler.requests == [None, None]
+
+
+def test_download_artifacts_http_sizes_from_head_requests(http_server, tmpdir):
+    infos = [MagicMock(is_dir=False, path='model/model.pkl', file_size=None)]
+    dst = str(tmpdir / 'dst')
+
+    with patch('mlflow.tracking.MlflowClient') as client_cls:
+        client_cls.return_value.list_artifacts.side_effect = lambda run_id, path: infos
+        download_artifacts(f'{http_server}/artifacts', 'run-id', dst, workers=4, part_size=4096)
+
+    with open(os.path.join(dst, 'model/model.pkl'), 'rb') as f:
+        assert f.read() == ARTIFACTS['model/model.pkl']
+    assert _RangeHandler.requests[0] == 'HEAD' and len(_RangeHandler.requests) == 4
+
+
+def test_download_artifacts_rejects_paths_outside_dst(http_server, tmpdir):
+    infos = [MagicMock(is_dir=False, path='../outside.txt', file_size=1)]
+
+    with patch('mlflow.tracking.MlflowClient') as client_cls:
+        client_cls.return_value.list_artifacts.side_effect = lambda run_id, path: infos
+        with pytest.raises(ValueError):
+            download_artifacts(f'{http_server}/artifacts', 'run-id', str(tmpdir / 'dst'))
+
+    assert not (tmpdir / 'outside.txt').exists()
@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+import pytest
+from sagemaker_mlflow_container._rendezvous import LeaderRendezvous, WorkerRendezvous, leader_host
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('', 0))
+        return s.getsockname()[1]
+
+
+def _worker(host, port, env_up_to_date, snapshot_dir, results, success=True):
+    with WorkerRendezvous(host, 'localhost', port, timeout=10) as worker:
+        worker.connect(env_up_to_date)
+        run = worker.receive_run(snapshot_dir)
+        snapshot = None
+        if run.snapshot is not None:
+            with open(run.snapshot, 'rb') as f:
+                snapshot = f.read()
+        results.put((host, run.run_id, run.snapshot_key, snapshot))
+        worker.report(success, '' if success else 'boom')
+
+
+def _start_workers(tmpdir, port, workers):
+    results = multiprocessing.Queue()
+    processes = []
+    for host, env_up_to_date, success in workers:
+        snapshot_dir = str(tmpdir.mkdir(host))
+        p = multiprocessing.Process(target=_worker,
+                                    args=(host, port, env_up_to_date, snapshot_dir, results, success))
+        p.start()
+        processes.append(p)
+    return results, processes
+
+
+def test_leader_host():
+    assert leader_host(['algo-2', 'algo-1', 'algo-3']) == 'algo-1'
+
+
+def test_rendezvous(tmpdir):
+    port = _free_port()
+    snapshot = tmpdir / 'env.tar.gz'
+    snapshot.write_binary(os.urandom(3 * 1024 * 1024 + 1))
+
+    with LeaderRendezvous(['algo-2', 'algo-3'], port, timeout=10) as leader:
+        results, processes = _start_workers(tmpdir, port, [('algo-2', False, True), ('algo-3', True, True)])
+
+        leader.accept_workers()
+        assert leader.workers_need_env
+        leader.broadcast_run('run-id', 'key', str(snapshot))
+        leader.wait_workers()
+
+    for p in processes:
+        p.join(10)
+    received = sorted(results.get(timeout=1) for _ in processes)
+    assert received == [
+        ('algo-2', 'run-id', 'key', snapshot.read_binary()),
+        ('algo-3', 'run-id', 'key', None),
+    ]
+
+
+def test_rendezvous_worker_failed(tmpdir):
+    port = _free_port()
+
+    with LeaderRendezvous(['algo-2', 'algo-3'], port, timeout=10) as leader:
+        _, processes = _start_workers(tmpdir, port, [('algo-2', True, True), ('algo-3', True, False)])
+
+        leader.accept_workers()
+        assert not leader.workers_need_env
+        leader.broadcast_run('run-id', 'key', None)
+        with pytest.raises(RuntimeError, match='algo-3'):
+            leader.wait_workers()
+
+    for p in processes:
+        p.join(10)
+
+
+def test_rendezvous_worker_not_connected():
+    with LeaderRendezvous(['algo-2'], _free_port(), timeout=0.5) as leader:
+        with pytest.raises(TimeoutError):
+            leader.accept_workers()
+
+
+def test_accept_workers_stops_when_leader_is_closed():
+    with LeaderRendezvous(['algo-2'], _free_port(), timeout=60) as leader:
+        threading.Timer(0.2, leader.close).start()
+        start = time.monotonic()
+        with pytest.raises(RuntimeError, match='closed'):
+            leader.accept_workers()
+        assert time.monotonic() - start < 10
+
+
+def test_worker_fails_when_leader_is_closed(tmpdir):
+    port = _free_port()
+
+    with WorkerRendezvous('algo-2', 'localhost', port, timeout=10) as worker:
+        with LeaderRendezvous(['algo-2'], port, timeout=10) as leader:
+            worker.connect(True)
+            leader.accept_workers()
+        with pytest.raises(ConnectionError):
+            worker.receive_run(str(tmpdir))
+
+
+def _failed_worker(host, port):
+    with WorkerRendezvous(host, 'localhost', port, timeout=10) as worker:
+        worker.report(False, 'conda env is broken')
+
+
+def test_rendezvous_worker_failed_before_connect():
+    port = _free_port()
+
+    with LeaderRendezvous(['algo-2'], port, timeout=10) as leader:
+        p = multiprocessing.Process(target=_failed_worker, args=('algo-2', port))
+        p.start()
+        with pytest.raises(RuntimeError, match='conda env is broken'):
+            leader.accept_workers()
+    p.join(10)
+
+
+def test_rendezvous_watch_workers(tmpdir):
+    port = _free_port()
+    failures = []
+
+    with LeaderRendezvous(['algo-2'], port, timeout=10) as leader:
+        _, processes = _start_workers(tmpdir, port, [('algo-2', True, False)])
+
+        leader.accept_workers()
+        leader.broadcast_run('run-id', 'key', None)
+        reported = threading.Event()
+        leader.watch_workers(lambda host, error: (failures.append((host, error)), reported.set()))
+        assert reported.wait(10)
+        with pytest.raises(RuntimeError, match='algo-2'):
+            leader.wait_workers()
+
+    for p in processes:
+        p.join(10)
+    assert failures == [('algo-2', 'boom')]
@@ -0,0 +1,57 @@
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+
+from sagemaker_mlflow_container._resources import MEASURES, ResourceSampler, Sample, _process_tree, summarize
+
+# parent process that spawns a busy child which allocates memory and writes a file
+BUSY_TREE = '''
+import subprocess, sys
+subprocess.run([sys.executable, '-c', """
+import os, tempfile, time
+data = bytearray(50 * 1024 * 1024)
+end = time.monotonic() + 1
+with tempfile.TemporaryFile() as f:
+    while time.monotonic() < end:
+        f.write(os.urandom(1024 * 1024)); f.flush(); os.fsync(f.fileno())
+"""])
+'''
+
+
+def test_process_tree():
+    with subprocess.Popen([sys.executable, '-c', BUSY_TREE]) as process:
+        time.sleep(0.3)
+        tree = _process_tree(process.pid)
+        process.wait()
+
+    assert len(tree) == 2
+    assert process.pid in tree
+
+
+def test_sampler_logs_batches():
+    with subprocess.Popen([sys.executable, '-c', BUSY_TREE]) as process, \
+            patch('mlflow.tracking.MlflowClient') as client_cls:
+        sampler = ResourceSampler(process.pid, 'run1', interval=0.1, flush_interval=0.5)
+        sampler.start()
+        process.wait()
+        summary = sampler.stop()
+
+    assert summary['rss_mb']['peak'] > 50
+    assert summary['cpu_percent']['mean'] > 10
+    assert summary['processes']['peak'] == 2
+
+    batches = [c.kwargs['metrics'] for c in client_cls.return_value.log_batch.call_args_list]
+    # samples are logged by batches, summary is logged by the last one
+    assert len(batches) < len(sampler.samples)
+    logged = [m for batch in batches[:-1] for m in batch]
+    assert len(logged) == len(sampler.samples) * len(MEASURES)
+    assert {m.key for m in batches[-1]} == {f'resource_{m}_{s}' for m in MEASURES for s in ('peak', 'p95', 'mean')}
+
+
+def test_summarize():
+    samples = [Sample(0, cpu, cpu, 0, 0, 1, 1) for cpu in range(1, 101)]
+
+    summary = summarize(samples)
+
+    assert summary['cpu_percent'] == {'peak': 100, 'p95': 95, 'mean': 50.5}
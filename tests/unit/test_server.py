@@ -0,0 +1,109 @@
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+import urllib3
+
+from sagemaker_mlflow_container._server import MicroBatcher, UnsupportedContentType, format_output, make_server, \
+    parse_input
+
+
+def _predict(frame):
+    time.sleep(0.01)
+    if (frame['x'] < 0).any():
+        raise ValueError('negative x')
+    return frame['x'] * 2
+
+
+def test_parse_input():
+    expected = pd.DataFrame({'x': [1, 2], 'y': [3, 4]})
+
+    bodies = [
+        (b'x,y\n1,3\n2,4\n', 'text/csv'),
+        (json.dumps({'columns': ['x', 'y'], 'data': [[1, 3], [2, 4]]}).encode(), 'application/json'),
+        (json.dumps({'dataframe_split': {'columns': ['x', 'y'], 'data': [[1, 3], [2, 4]]}}).encode(), None),
+        (json.dumps([{'x': 1, 'y': 3}, {'x': 2, 'y': 4}]).encode(), 'application/json; charset=utf-8'),
+        (json.dumps({'dataframe_records': [{'x': 1, 'y': 3}, {'x': 2, 'y': 4}]}).encode(), 'application/json'),
+    ]
+    for body, content_type in bodies:
+        pd.testing.assert_frame_equal(parse_input(body, content_type), expected)
+    with pytest.raises(UnsupportedContentType):
+        parse_input(b'', 'image/png')
+
+
+def test_format_output():
+    assert json.loads(format_output(pd.Series([1, 2]))) == [1, 2]
+    assert json.loads(format_output(pd.DataFrame({'a': [1]}))) == [{'a': 1}]
+    assert json.loads(format_output([0.5])) == [0.5]
+
+
+def test_micro_batcher_groups_concurrent_requests():
+    batcher = MicroBatcher(_predict, max_rows=100, max_wait=0.2)
+    try:
+        futures = [batcher.submit(pd.DataFrame({'x': [i, i + 1]})) for i in range(0, 20, 2)]
+        results = [f.result(timeout=5).tolist() for f in futures]
+    finally:
+        batcher.close()
+
+    assert results == [[2 * i, 2 * i + 2] for i in range(0, 20, 2)]
+    assert batcher.batches == 1
+
+
+def test_micro_batcher_max_rows_and_columns():
+    batcher = MicroBatcher(_predict, max_rows=4, max_wait=0.2)
+    try:
+        futures = [batcher.submit(pd.DataFrame({'x': [i, i]})) for i in range(4)]
+        other = batcher.submit(pd.DataFrame({'x': [1], 'z': [0]}))
+        assert [f.result(timeout=5).tolist() for f in futures] == [[2 * i, 2 * i] for i in range(4)]
+        assert other.result(timeout=5).tolist() == [2]
+    finally:
+        batcher.close()
+
+    assert batcher.batches == 3
+
+
+def test_micro_batcher_isolates_failed_request():
+    batcher = MicroBatcher(_predict, max_rows=100, max_wait=0.2)
+    try:
+        good = batcher.submit(pd.DataFrame({'x': [1]}))
+        bad = batcher.submit(pd.DataFrame({'x': [-1]}))
+        assert good.result(timeout=5).tolist() == [2]
+        with pytest.raises(ValueError):
+            bad.result(timeout=5)
+    finally:
+        batcher.close()
+
+
+def test_server_invocations():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen()
+    batcher = MicroBatcher(_predict, max_rows=100, max_wait=0.05)
+    server = make_server(sock, batcher)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{sock.getsockname()[1]}'
+    http = urllib3.PoolManager(maxsize=8)
+    try:
+        assert http.request('GET', f'{url}/ping').status == 200
+
+        def invoke(i):
+            response = http.request('POST', f'{url}/invocations', body=f'x\n{i}\n'.encode(),
+                                    headers={'Content-Type': 'text/csv'})
+            return response.status, json.loads(response.data)
+
+        with ThreadPoolExecutor(8) as pool:
+            assert list(pool.map(invoke, range(8))) == [(200, [2 * i]) for i in range(8)]
+        assert batcher.batches < 8
+
+        response = http.request('POST', f'{url}/invocations', body=b'{', headers={'Content-Type': 'application/json'})
+        assert response.status == 400
+        response = http.request('POST', f'{url}/invocations', body=b'x', headers={'Content-Type': 'image/png'})
+        assert response.status == 415
+    finally:
+        server.shutdown()
+        batcher.close()
+        sock.close()
@@ -0,0 +1,72 @@
+import os
+import tarfile
+from os.path import join
+
+import pytest
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._manifest import CAS_REF_PREFIX, ManifestEntry, write_manifest
+from sagemaker_mlflow_container.serving import _extract_model_archive, _model_conda_file, _restore_deduplicated
+
+
+def test_model_conda_file(tmp_path):
+    (tmp_path / 'conda.yaml').write_text('dependencies: []')
+    (tmp_path / 'MLmodel').write_text('flavors:\n  python_function:\n    env: conda.yaml\n')
+    assert _model_conda_file(str(tmp_path)) == join(str(tmp_path), 'conda.yaml')
+
+    (tmp_path / 'MLmodel').write_text('flavors:\n  python_function:\n    env:\n      conda: conda.yaml\n')
+    assert _model_conda_file(str(tmp_path)) == join(str(tmp_path), 'conda.yaml')
+
+    (tmp_path / 'MLmodel').write_text('flavors:\n  python_function:\n    loader_module: m\n')
+    assert _model_conda_file(str(tmp_path)) is None
+
+
+def test_restore_deduplicated(tmp_path, monkeypatch):
+    sha256 = 'ab' * 32
+    cas_dir = tmp_path / 'cas'
+    (cas_dir / 'sha256' / 'ab').mkdir(parents=True)
+    (cas_dir / 'sha256' / 'ab' / sha256).write_bytes(b'weights')
+    model_dir = tmp_path / 'model'
+    (model_dir / const.SAGEMAKER_MODEL_SUBDIR).mkdir(parents=True)
+    write_manifest(str(model_dir / const.ARTIFACTS_MANIFEST_FILE),
+                   [ManifestEntry('model/data/weights.bin', 7, sha256, f'{CAS_REF_PREFIX}{sha256}')])
+
+    monkeypatch.setattr(const, 'ARTIFACTS_CAS_DIR', '')
+    with pytest.raises(ValueError):
+        _restore_deduplicated(str(model_dir))
+
+    monkeypatch.setattr(const, 'ARTIFACTS_CAS_DIR', str(cas_dir))
+    _restore_deduplicated(str(model_dir))
+
+    restored = join(str(model_dir), const.SAGEMAKER_MODEL_SUBDIR, 'model', 'data', 'weights.bin')
+    with open(restored, 'rb') as f:
+        assert f.read() == b'weights'
+    os.remove(join(str(cas_dir), 'sha256', 'ab', sha256))
+    _restore_deduplicated(str(model_dir))
+
+
+def test_extract_model_archive(tmp_path):
+    source = tmp_path / 'source' / const.SAGEMAKER_MODEL_SUBDIR / 'model'
+    source.mkdir(parents=True)
+    (source / 'MLmodel').write_text('flavors: {}')
+    model_dir = tmp_path / 'model'
+    model_dir.mkdir()
+    with tarfile.open(str(model_dir / 'model.tar.gz'), 'w:gz') as tar:
+        tar.add(str(tmp_path / 'source' / const.SAGEMAKER_MODEL_SUBDIR), arcname=const.SAGEMAKER_MODEL_SUBDIR)
+
+    _extract_model_archive(str(model_dir))
+
+    assert (model_dir / const.SAGEMAKER_MODEL_SUBDIR / 'model' / 'MLmodel').read_text() == 'flavors: {}'
+
+
+@pytest.mark.skipif(not hasattr(tarfile, 'data_filter'), reason='tarfile extraction filters are not supported')
+def test_extract_model_archive_rejects_members_outside_model_dir(tmp_path):
+    (tmp_path / 'outside').write_text('evil')
+    model_dir = tmp_path / 'model'
+    model_dir.mkdir()
+    with tarfile.open(str(model_dir / 'model.tar.gz'), 'w:gz') as tar:
+        tar.add(str(tmp_path / 'outside'), arcname='../outside-copy')
+
+    with pytest.raises(tarfile.TarError):
+        _extract_model_archive(str(model_dir))
+    assert not (tmp_path / 'outside-copy').exists()
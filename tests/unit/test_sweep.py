@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+from sagemaker_mlflow_container._sweep import TrialResult, best_trial, expand_trials, run_trials, validate_goal
+
+
+def test_expand_grid():
+    trials = expand_trials({'alpha': [0.1, 0.5], 'l1_ratio': {'min': 0, 'max': 1, 'num': 3}, 'seed': 1}, 'grid', 0)
+
+    assert trials == [
+        {'alpha': 0.1, 'l1_ratio': 0.0, 'seed': 1},
+        {'alpha': 0.1, 'l1_ratio': 0.5, 'seed': 1},
+        {'alpha': 0.1, 'l1_ratio': 1.0, 'seed': 1},
+        {'alpha': 0.5, 'l1_ratio': 0.0, 'seed': 1},
+        {'alpha': 0.5, 'l1_ratio': 0.5, 'seed': 1},
+        {'alpha': 0.5, 'l1_ratio': 1.0, 'seed': 1},
+    ]
+
+
+def test_expand_grid_log_int_range():
+    trials = expand_trials({'depth': {'min': 1, 'max': 100, 'num': 3, 'scale': 'log', 'type': 'int'}}, 'grid', 0)
+
+    assert trials == [{'depth': 1}, {'depth': 10}, {'depth': 100}]
+
+
+def test_expand_grid_range_without_num():
+    with pytest.raises(ValueError):
+        expand_trials({'alpha': {'min': 0, 'max': 1}}, 'grid', 0)
+
+
+def test_expand_random():
+    hps = {'alpha': {'min': 0.01, 'max': 1, 'scale': 'log'}, 'solver': ['adam', 'sgd'], 'epochs': 3}
+    trials = expand_trials(hps, 'random', 20, seed=42)
+
+    assert len(trials) == 20
+    assert trials == expand_trials(hps, 'random', 20, seed=42)
+    for trial in trials:
+        assert 0.01 <= trial['alpha'] <= 1
+        assert trial['solver'] in ('adam', 'sgd')
+        assert trial['epochs'] == 3
+
+
+def test_expand_without_sweep_values():
+    with pytest.raises(ValueError):
+        expand_trials({'alpha': 0.1}, 'grid', 0)
+
+
+def test_run_trials_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def run_trial(params):
+        barrier.wait()
+        return TrialResult(str(params['i']), params, params['i'])
+
+    results = run_trials([{'i': i} for i in range(3)], run_trial, parallelism=3)
+
+    assert [r.run_id for r in results] == ['0', '1', '2']
+
+
+def test_best_trial():
+    results = [
+        TrialResult('a', {}, 0.5),
+        TrialResult('b', {}, 0.1),
+        TrialResult('c', {}, None),
+        TrialResult('d', {}, 0.9),
+        TrialResult('e', {}, None, 'failed'),
+    ]
+
+    assert best_trial(results, 'minimize').run_id == 'b'
+    assert best_trial(results, 'maximize').run_id == 'd'
+    with pytest.raises(RuntimeError):
+        best_trial(results[2:3], 'minimize')
+
+
+def test_validate_goal():
+    validate_goal('maximize')
+    with pytest.raises(ValueError, match='Unknown sweep goal'):
+        validate_goal('max')
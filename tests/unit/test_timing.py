@@ -0,0 +1,55 @@
+import json
+import logging
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+from sagemaker_mlflow_container._timing import METRICS_LOG_PREFIX, StageTimer
+
+
+def test_stage_timer_span_records_children_usage():
+    timer = StageTimer()
+
+    with timer.span('busy_child'):
+        subprocess.run([sys.executable, '-c', 'sum(range(3 * 10 ** 6))'], check=True)
+
+    span, = timer.spans
+    assert span.name == 'busy_child'
+    assert span.wall_seconds >= span.children_cpu_seconds > 0
+    assert span.children_max_rss_kb > 0
+
+
+def test_stage_timer_records_failed_stage():
+    timer = StageTimer()
+
+    with pytest.raises(RuntimeError):
+        timer.wrap('failed', lambda: (_ for _ in ()).throw(RuntimeError()))()
+
+    assert [s.name for s in timer.spans] == ['failed']
+
+
+def test_stage_timer_report(tmpdir, caplog):
+    timer = StageTimer()
+    timer.wrap('stage', lambda: None)()
+    report_path = str(tmpdir / 'output' / 'timing.json')
+
+    timer.write_report(report_path)
+    with caplog.at_level(logging.INFO):
+        timer.log_metrics()
+
+    with open(report_path) as f:
+        report = json.load(f)
+    assert [s['name'] for s in report['spans']] == ['stage']
+    assert f'{METRICS_LOG_PREFIX} stage wall_seconds=' in caplog.text
+
+
+def test_train_keeps_training_error_if_timings_are_not_saved(tmpdir):
+    from types import SimpleNamespace
+
+    from sagemaker_mlflow_container import training
+
+    with patch.object(training, '_train', side_effect=RuntimeError('training failed')), \
+            patch.object(StageTimer, 'write_report', side_effect=OSError('read-only file system')):
+        with pytest.raises(RuntimeError, match='training failed'):
+            training.train(SimpleNamespace(output_data_dir=str(tmpdir)))
@@ -0,0 +1,175 @@
+import http.server
+import json
+import socketserver
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from sagemaker_mlflow_container import const
+from sagemaker_mlflow_container._tracking_proxy import MAX_BATCH_PARAMS, TrackingProxy, _RunBatch, tracking_proxy
+
+API_PREFIX = '/api/2.0/mlflow'
+
+
+class _FileStoreServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Minimal MLFlow tracking server backed by file store: logging and get run endpoints
+    with configurable latency and failures
+    """
+    daemon_threads = True
+
+    def __init__(self, root):
+        from mlflow.store.tracking.file_store import FileStore
+
+        super().__init__(('127.0.0.1', 0), _FileStoreHandler)
+        self.store = FileStore(root)
+        self.requests = []
+        self.latency = 0
+        self.fail_next = 0
+
+    @property
+    def uri(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class _FileStoreHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _respond(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        from mlflow.entities import Metric, Param, RunTag
+        from mlflow.exceptions import MlflowException
+
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.path, body))
+        time.sleep(self.server.latency)
+        endpoint = self.path[len(API_PREFIX) + 1:]
+        if endpoint in ('runs/log-metric', 'runs/log-parameter', 'runs/set-tag'):
+            kind = {'runs/log-metric': 'metrics', 'runs/log-parameter': 'params', 'runs/set-tag': 'tags'}[endpoint]
+            body = {'run_id': body['run_id'], kind: [body]}
+        elif endpoint != 'runs/log-batch':
+            self._respond(404, {})
+            return
+        if self.server.fail_next:
+            self.server.fail_next -= 1
+            self._respond(503, {})
+            return
+        try:
+            self.server.store.log_batch(
+                body['run_id'],
+                metrics=[Metric(m['key'], float(m['value']), int(m['timestamp']), int(m.get('step', 0)))
+                         for m in body.get('metrics', [])],
+                params=[Param(p['key'], str(p['value'])) for p in body.get('params', [])],
+                tags=[RunTag(t['key'], str(t['value'])) for t in body.get('tags', [])],
+            )
+        except MlflowException as e:
+            self._respond(400, {'error_code': e.error_code, 'message': e.message})
+            return
+        self._respond(200, {})
+
+    def do_GET(self):
+        from mlflow.utils.proto_json_utils import message_to_json
+
+        url = urlparse(self.path)
+        self.server.requests.append((url.path, None))
+        run = self.server.store.get_run(parse_qs(url.query)['run_id'][0])
+        self._respond(200, {'run': json.loads(message_to_json(run.to_proto()))})
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def tracking_server(tmp_path, monkeypatch):
+    # recent mlflow versions require opt-in to file store
+    monkeypatch.setenv('MLFLOW_ALLOW_FILE_STORE', 'true')
+    server = _FileStoreServer(str(tmp_path / 'mlruns'))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def run_id(tracking_server):
+    return tracking_server.store.create_run('0', 'user', int(time.time() * 1000), [], 'run').info.run_id
+
+
+def test_run_batch_requests():
+    batch = _RunBatch()
+    for i in range(MAX_BATCH_PARAMS + 10):
+        batch.add('params', {'key': f'p{i}', 'value': '1'})
+    batch.add('params', {'key': 'p0', 'value': '2'})
+    for i in range(1500):
+        batch.add('metrics', {'key': 'm', 'value': i, 'timestamp': 0, 'step': i})
+
+    requests = list(batch.requests())
+
+    assert [(len(r['params']), len(r['metrics'])) for r in requests] == [(100, 900), (10, 600)]
+    assert requests[0]['params'][0] == {'key': 'p0', 'value': '2'}
+    assert [m['step'] for r in requests for m in r['metrics']] == list(range(1500))
+
+
+def test_proxy_coalesces_writes(tracking_server, run_id):
+    from mlflow.tracking import MlflowClient
+
+    tracking_server.latency = 0.05
+    proxy = TrackingProxy(tracking_server.uri, flush_interval=60).start()
+    try:
+        client = MlflowClient(proxy.uri)
+        start = time.monotonic()
+        for step in range(50):
+            client.log_metric(run_id, 'loss', 1 / (step + 1), step=step)
+        client.log_param(run_id, 'lr', '0.1')
+        client.set_tag(run_id, 'stage', 'train')
+        assert time.monotonic() - start < 50 * tracking_server.latency
+
+        # get run is forwarded after pending entities are sent
+        run = client.get_run(run_id)
+    finally:
+        proxy.close()
+
+    assert [m.step for m in tracking_server.store.get_metric_history(run_id, 'loss')] == list(range(50))
+    assert run.data.params == {'lr': '0.1'} and run.data.tags['stage'] == 'train'
+    assert [path for path, _ in tracking_server.requests] == [f'{API_PREFIX}/runs/log-batch',
+                                                              f'{API_PREFIX}/runs/get']
+    assert proxy.stats.acknowledged == 52 and proxy.stats.forwarded == 1
+
+
+def test_proxy_retries_and_drops_rejected_entities(tracking_server, run_id):
+    from mlflow.entities import Param
+    from mlflow.tracking import MlflowClient
+
+    tracking_server.store.log_batch(run_id, [], [Param('lr', '0.1')], [])
+    tracking_server.fail_next = 2
+    proxy = TrackingProxy(tracking_server.uri, flush_interval=60, retries=3).start()
+    try:
+        client = MlflowClient(proxy.uri)
+        client.log_metric(run_id, 'loss', 0.5)
+        # params can't be changed, the whole batch is rejected and entities are resent one by one
+        client.log_param(run_id, 'lr', '0.2')
+        proxy.flush()
+    finally:
+        proxy.close()
+
+    assert tracking_server.store.get_run(run_id).data.metrics == {'loss': 0.5}
+    assert proxy.stats.dropped == 1
+
+
+def test_tracking_proxy_disabled_for_local_uri(monkeypatch, tmp_path):
+    monkeypatch.setenv('MLFLOW_TRACKING_URI', f'file://{tmp_path}')
+
+    with tracking_proxy({}) as proxy:
+        assert proxy is None
+    with tracking_proxy({const.TRACKING_PROXY_PARAM: 'true'}) as proxy:
+        assert proxy is None
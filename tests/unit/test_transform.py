@@ -0,0 +1,66 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from sagemaker_mlflow_container._transform import format_chunk, parse_chunk, read_chunks, transform
+
+
+class DoubleModel:
+    def predict(self, frame):
+        return frame['x'] * 2
+
+
+def load_double_model(model_path):
+    return DoubleModel()
+
+
+def load_broken_model(model_path):
+    raise ValueError('model is broken')
+
+
+def test_read_chunks():
+    data = b'x,y\n1,2\n3,4\n\n5,6'
+
+    chunks = list(read_chunks(io.BytesIO(data), 'csv', 2))
+
+    assert chunks == [(b'x,y\n', b'1,2\n3,4\n'), (b'x,y\n', b'5,6\n')]
+    assert list(read_chunks(io.BytesIO(b'{"x": 1}\n{"x": 2}\n'), 'jsonl', 5)) == [(b'', b'{"x": 1}\n{"x": 2}\n')]
+
+
+def test_parse_and_format_chunk():
+    frame = parse_chunk(b'x,y\n', b'1,2\n3,4\n', 'csv')
+    pd.testing.assert_frame_equal(frame, pd.DataFrame({'x': [1, 3], 'y': [2, 4]}))
+    pd.testing.assert_frame_equal(parse_chunk(b'', b'{"x": 1, "y": 2}\n{"x": 3, "y": 4}\n', 'jsonl'), frame)
+
+    assert format_chunk(frame['x'], 'csv') == b'1\n3\n'
+    assert format_chunk(frame, 'jsonl') == b'{"x":1,"y":2}\n{"x":3,"y":4}\n'
+    assert format_chunk([0.5], 'csv') == b'0.5\n'
+
+
+def test_transform(tmp_path):
+    input_dir, output_dir = tmp_path / 'input', tmp_path / 'output'
+    (input_dir / 'part').mkdir(parents=True)
+    (input_dir / 'a.csv').write_text('x\n' + ''.join(f'{i}\n' for i in range(1000)))
+    (input_dir / 'part' / 'b.jsonl').write_text(''.join(json.dumps({'x': i}) + '\n' for i in range(10)))
+    (input_dir / 'notes.txt').write_text('skipped')
+
+    stats = transform('unused', str(input_dir), str(output_dir), chunk_rows=64, workers=2,
+                      load_model=load_double_model)
+
+    assert (stats.files, stats.rows) == (2, 1010)
+    assert (output_dir / 'a.csv.out').read_text() == ''.join(f'{2 * i}\n' for i in range(1000))
+    assert (output_dir / 'part' / 'b.jsonl.out').read_text().splitlines() == \
+        [json.dumps({'x': 2 * i}, separators=(',', ':')) for i in range(10)]
+    assert not (output_dir / 'notes.txt.out').exists()
+
+
+def test_transform_fails_when_model_is_not_loaded(tmp_path):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    (input_dir / 'a.csv').write_text('x\n1\n2\n')
+
+    with pytest.raises(RuntimeError, match='model is broken'):
+        transform('/opt/ml/model', str(input_dir), str(tmp_path / 'output'), chunk_rows=1, workers=2,
+                  load_model=load_broken_model)
@@ -1,47 +1,12 @@
+import threading
+import time
 from unittest.mock import patch
 
 import pytest
-from sagemaker_mlflow_container import const
-from sagemaker_mlflow_container._utils import _conda_info, _copy_environ_and_prepend_path, \
-    _extract_conda_file_name, _find_mlproject_file_path, _get_conda_env_bin_path, _mapping_to_mlflow_hyper_params, \
-    _mapping_to_mlflow_run_params, _split_run_params
-
-
-def test_conda_info():
-
-    class StubProcess:
-        stdout = '{"result": "ok"}'
-
-    env_name = 'training'
-
-    with patch('subprocess.run') as run_mock:
-
-        run_mock.return_value = StubProcess
-
-        info = _conda_info(env_name)
-
-        args, _ = run_mock.call_args
-
-        cmd, *_ = args
-
-        assert cmd == ['conda', 'run', '-n', env_name, 'conda', 'info', '--json']
-
-        assert info == {'result': 'ok'}
-
-
-def test_get_conda_env_bin_path():
-
-    stub_path = '/stub/path/to/env'
-
-    with patch('sagemaker_mlflow_container._utils._conda_info') as info_mock:
-
-        info_mock.return_value = {
-            const.CONDA_INFO_ENV_PATH_KEY: stub_path
-        }
-
-        bin_path = _get_conda_env_bin_path('env_name')
-
-    assert bin_path == f'{stub_path}/bin'
+from sagemaker_mlflow_container._utils import ProcessTerminator, _activated_environ, _copy_environ_and_prepend_path, \
+    _extract_conda_file_name, _extract_entry_points, _find_mlproject_file_path, _mapping_to_mlflow_hyper_params, \
+    _mapping_to_mlflow_run_params, _param_to_bool, _param_to_list, \
+    _split_container_params, _split_run_params, check_error
 
 
 def test_copy_environ_and_prepend_path():
@@ -59,6 +24,23 @@ def test_copy_environ_and_prepend_path():
     assert overridden_env == {'PATH': f'{new_path}:{stub_path}'}
 
 
+def test_activated_environ(tmpdir):
+    prefix = tmpdir / 'training'
+    (prefix / 'conda-meta').ensure(dir=True)
+    (prefix / 'conda-meta' / 'state').write('{"env_vars": {"FROM_STATE": "1"}}')
+    (prefix / 'etc' / 'conda' / 'activate.d').ensure(dir=True)
+    (prefix / 'etc' / 'conda' / 'activate.d' / 'java.sh').write('export JAVA_HOME="$CONDA_PREFIX/lib/jvm"\n')
+
+    with patch('os.environ', {'PATH': '/usr/bin'}):
+        environ = _activated_environ(str(prefix), 'training')
+
+    assert environ['PATH'].split(':')[:2] == [f'{prefix}/bin', '/usr/bin']
+    assert environ['CONDA_PREFIX'] == str(prefix)
+    assert environ['CONDA_DEFAULT_ENV'] == 'training'
+    assert environ['FROM_STATE'] == '1'
+    assert environ['JAVA_HOME'] == f'{prefix}/lib/jvm'
+
+
 def test_find_mlproject_file_path_ok(tmpdir):
     p = tmpdir.join('MLproject')
     p.write("")
@@ -82,12 +64,42 @@ def test_extract_conda_file_name(tmpdir):
     assert _extract_conda_file_name(str(without_conda_spec)) == "conda.yaml"
 
 
+def test_extract_entry_points(tmpdir):
+    mlproject = tmpdir / "MLproject"
+    mlproject.write("entry_points:\n  main:\n    parameters:\n      alpha: {type: float, default: 0.1}\n"
+                    "    command: python train.py\n  validate:\n    command: python validate.py\n")
+    assert _extract_entry_points(str(mlproject)) == {"main": {"alpha": {"type": "float", "default": 0.1}},
+                                                     "validate": {}}
+
+    mlproject.write("name: test\n")
+    assert _extract_entry_points(str(mlproject)) == {}
+
+
 def test_split_run_params():
     actual = _split_run_params({"sagemaker_mlflow_run_experiment-id": 2, "another_param": 3})
     expected = {"experiment-id": 2}
     assert actual == expected
 
 
+def test_split_container_params():
+    actual = _split_container_params({"sagemaker_mlflow_container_pack_env": True,
+                                      "sagemaker_mlflow_run_experiment-id": 2})
+    expected = {"pack_env": True}
+    assert actual == expected
+
+
+def test_param_to_bool():
+    assert _param_to_bool("True") and _param_to_bool("1") and _param_to_bool(True)
+    assert not _param_to_bool("false") and not _param_to_bool(0) and not _param_to_bool("")
+
+
+def test_param_to_list():
+    assert _param_to_list("model/, *.onnx") == ["model/", "*.onnx"]
+    assert _param_to_list('["model/", "*.pkl"]') == ["model/", "*.pkl"]
+    assert _param_to_list(["model/"]) == ["model/"]
+    assert _param_to_list(None) == [] and _param_to_list("") == []
+
+
 def test_mapping_to_mlflow_run_params():
     actual = _mapping_to_mlflow_run_params({"experiment-id": 2, "no-conda": None})
     expected = ["--experiment-id", "2", "--no-conda"]
@@ -98,3 +110,31 @@ def test_mapping_to_mlflow_hyper_params():
     actual = _mapping_to_mlflow_hyper_params({"alpha": 1.0, 'epochs': 10})
     expected = ["-P", "alpha=1.0", "-P", "epochs=10"]
     assert actual == expected
+
+
+def test_check_error_with_env(tmpdir):
+    from sagemaker_containers._errors import _CalledProcessError
+
+    out = tmpdir / 'out'
+    with open(str(out), 'w') as f:
+        check_error(['sh', '-c', 'echo $FOO'], _CalledProcessError, capture_error=True, env={'FOO': 'bar'}, stdout=f)
+    assert out.read() == 'bar\n'
+
+    with pytest.raises(_CalledProcessError):
+        check_error(['sh', '-c', 'exit 3'], _CalledProcessError, capture_error=True, env={})
+
+
+def test_check_error_terminated_from_another_thread():
+    from sagemaker_containers._errors import _CalledProcessError
+
+    terminator = ProcessTerminator()
+    threading.Timer(0.2, terminator.terminate).start()
+    start = time.monotonic()
+    with pytest.raises(_CalledProcessError):
+        # child of shell is terminated too
+        check_error(['sh', '-c', 'sleep 30; true'], _CalledProcessError, terminator=terminator)
+    assert time.monotonic() - start < 10
+
+    # command started after termination is terminated at once
+    with pytest.raises(_CalledProcessError):
+        check_error(['sleep', '30'], _CalledProcessError, terminator=terminator)
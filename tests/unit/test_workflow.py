@@ -0,0 +1,64 @@
+import pytest
+
+from sagemaker_mlflow_container._workflow import export_step, parse_workflow, step_params, validate_workflow
+
+ENTRY_POINTS = {
+    'prepare': {'raw': {'type': 'path'}},
+    'featurize': {'prepare_artifacts': {'type': 'path'}},
+    'train': {'alpha': {'type': 'float'}, 'featurize_artifacts': {'type': 'path'}},
+    'evaluate': {'prepare_artifacts': {'type': 'path'}, 'train_artifacts': {'type': 'uri'}},
+}
+
+
+def test_parse_workflow():
+    assert parse_workflow({'prepare': [], 'train': 'prepare'}) == {'prepare': (), 'train': ('prepare',)}
+    assert parse_workflow('{"prepare": [], "evaluate": ["prepare", "train"], "train": "prepare"}') == {
+        'prepare': (), 'evaluate': ('prepare', 'train'), 'train': ('prepare',),
+    }
+    for value in ('prepare,train', '[]', '{}'):
+        with pytest.raises(ValueError):
+            parse_workflow(value)
+
+
+def test_validate_workflow():
+    workflow = {'prepare': (), 'featurize': ('prepare',), 'train': ('featurize',), 'evaluate': ('train',)}
+    # prepare artifacts of evaluate step are required transitively
+    validate_workflow(workflow, ENTRY_POINTS)
+
+    with pytest.raises(ValueError, match='not entry points'):
+        validate_workflow(dict(workflow, deploy=('train',)), ENTRY_POINTS)
+    with pytest.raises(ValueError, match='unknown steps'):
+        validate_workflow(dict(workflow, train=('split',)), ENTRY_POINTS)
+    with pytest.raises(ValueError, match='circular'):
+        validate_workflow(dict(workflow, prepare=('evaluate',)), ENTRY_POINTS)
+    with pytest.raises(ValueError, match='does not require train'):
+        validate_workflow(dict(workflow, evaluate=('prepare',)), ENTRY_POINTS)
+    with pytest.raises(ValueError):
+        validate_workflow(workflow, None)
+
+    validate_workflow(workflow, ENTRY_POINTS, ['raw'])
+    with pytest.raises(ValueError, match='Pipe mode channel raw'):
+        validate_workflow(workflow, dict(ENTRY_POINTS, train={'raw': {'type': 'path'}}), ['raw'])
+
+
+def test_export_step():
+    workflow = {'prepare': (), 'train': ('prepare',), 'evaluate': ('train',), 'report': ('prepare',)}
+
+    assert export_step({'prepare': (), 'train': ('prepare',)}) == 'train'
+    assert export_step(workflow, 'train') == 'train'
+    with pytest.raises(ValueError, match='several final steps'):
+        export_step(workflow)
+    with pytest.raises(ValueError):
+        export_step(workflow, 'deploy')
+
+
+def test_step_params():
+    uris = {'prepare': 's3://bucket/1/prepare/artifacts', 'train': 's3://bucket/1/train/artifacts'}
+
+    assert step_params(ENTRY_POINTS['evaluate'], {'alpha': 0.5}, uris) == {
+        'prepare_artifacts': 's3://bucket/1/prepare/artifacts', 'train_artifacts': 's3://bucket/1/train/artifacts',
+    }
+    assert step_params(ENTRY_POINTS['train'], {'alpha': 0.5, 'featurize_artifacts': '/data'}, uris) == {
+        'alpha': 0.5, 'featurize_artifacts': '/data',
+    }
+    assert step_params(ENTRY_POINTS['prepare'], {'alpha': 0.5}, {}) == {}